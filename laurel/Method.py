@@ -1,16 +1,23 @@
-import datetime
 import logging
 import os
 import shutil
 import subprocess
+import time
 
 from dafny_utils import (
+    DEFAULT_VERIFICATION_TIMEOUT,
+    VerificationCancelled,
+    get_dafny_version,
     parse_assertion_results,
+    remove_verification_options,
     replace_method,
+    run_dafny_command,
     extract_dafny_functions,
     extract_error_message,
+    source_name,
 )
-from utils import adjust_microseconds, string_difference
+from disk_cache import dependency_digests, hash_key
+from utils import normalize_code, string_difference
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +38,23 @@ class Method:
             self.type = type
         self.error_message = ""
         self.error_file_path = ""
+        # directory the file is verified from and files hidden from the
+        # verification when it runs in an isolated workspace
+        self.location = None
+        self.excluded_files = []
+        # modified methods are named after their file so that the logs of
+        # concurrent verifications do not overwrite each other
+        self.log_name = None
+
+    def get_error_file_path(self, results_directory):
+        if self.log_name:
+            return f"{results_directory}/{self.log_name}_error.txt"
+        return (
+            f"{results_directory}/{self.method_name}_{self.type}_{self.index}_error.txt"
+        )
+
+    def get_location(self):
+        return self.location or os.path.dirname(self.file_path)
 
     def move_original(self, directory):
         file_name, file_extension = os.path.splitext(os.path.basename(self.file_path))
@@ -78,77 +102,317 @@ class Method:
         logger.debug(f"Created file: {fix_filename}")
 
         new_method = Method(fix_filename, self.method_name, index=self.index, type=type)
+        # the modified method is verified in place of this one
+        new_method.location = self.get_location()
+        new_method.excluded_files = self.excluded_files + [self.file_path]
+        new_method.log_name = os.path.splitext(os.path.basename(fix_filename))[0]
         return new_method
 
-    def run_verification(self, results_directory, additionnal_args=None):
+    def verification_key(self, additionnal_args=None, whole_file=False, backend=None):
+        # error messages only contain the basename with this flag
+        if additionnal_args and "--use-basename-for-filename" in additionnal_args:
+            file_name = os.path.basename(self.file_path)
+        else:
+            file_name = os.path.abspath(self.file_path)
+        return hash_key(
+            self.get_file_content(),
+            file_name,
+            dependency_digests(
+                self.file_path,
+                additionnal_args,
+                self.get_location(),
+                self.excluded_files,
+            ),
+            None if whole_file else self.method_name,
+            backend.version() if backend is not None else get_dafny_version(),
+            additionnal_args or "",
+        )
+
+    def run_verification(
+        self,
+        results_directory,
+        additionnal_args=None,
+        cache=None,
+        backend=None,
+        cancel_event=None,
+        workspaces=None,
+        whole_file=False,
+        log_format="text",
+        timeout=DEFAULT_VERIFICATION_TIMEOUT,
+    ):
         self.dafny_log_file = f"{results_directory}/{self.method_name}_{self.index}.txt"
         if self.type:
             self.dafny_log_file = (
                 f"{results_directory}/{self.method_name}_{self.type}_{self.index}.txt"
             )
-        dafny_command = [
-            "dafny",
-            "verify",
-            "--warn-deprecation:False",
-            "--boogie-filter",
-            f'"*{self.method_name}*"',
+        if self.log_name:
+            self.dafny_log_file = f"{results_directory}/{self.log_name}.txt"
+        cache_key = None
+        if cache is not None:
+            cache_key = self.verification_key(additionnal_args, whole_file, backend)
+            entry = cache.get(cache_key)
+            if entry is not None:
+                logger.debug(f"Verification cache hit for {self.method_name}")
+                return self.load_cache_entry(entry, results_directory)
+
+        if workspaces is not None:
+            with workspaces.materialize(
+                self.file_path,
+                additionnal_args,
+                self.get_location(),
+                self.excluded_files,
+            ) as workspace:
+                success = self.run_dafny(
+                    workspace.file_path,
+                    results_directory,
+                    workspace.dafny_args,
+                    backend,
+                    cancel_event,
+                    whole_file,
+                    log_format,
+                    timeout,
+                    workspace,
+                )
+        else:
+            success = self.run_dafny(
+                self.file_path,
+                results_directory,
+                additionnal_args,
+                backend,
+                cancel_event,
+                whole_file,
+                log_format,
+                timeout,
+            )
+        # both depend on the run rather than on the verified code
+        if cache is not None and self.verification_result not in (
+            "Cancelled",
+            "Timeout",
+        ):
+            cache.put(cache_key, self.cache_entry(success))
+        return success
+
+    def run_dafny(
+        self,
+        file_path,
+        results_directory,
+        additionnal_args,
+        backend,
+        cancel_event,
+        whole_file=False,
+        log_format="text",
+        timeout=DEFAULT_VERIFICATION_TIMEOUT,
+        workspace=None,
+    ):
+        dafny_command = ["dafny", "verify", "--warn-deprecation:False"]
+        # without the filter every implementation of the file is verified
+        if not whole_file:
+            dafny_command += ["--boogie-filter", f'"*{self.method_name}*"']
+        dafny_command += [
             "--log-format",
-            f'"text;LogFileName={self.dafny_log_file}"',
-            self.file_path,
+            f'"{log_format};LogFileName={self.dafny_log_file}"',
+            file_path,
         ]
         dafny_command[-1:-1] = additionnal_args.split() if additionnal_args else []
         logger.debug(dafny_command)
 
+        start_time = time.monotonic()
         try:
-            result = subprocess.run(
-                " ".join(dafny_command),
-                check=True,
-                capture_output=True,
-                timeout=400,
-                text=True,
-                shell=True,
-                executable="/usr/bin/zsh",
-            )
+            if backend is not None:
+                result = backend.run(
+                    dafny_command[1:], timeout=timeout, cancel_event=cancel_event
+                )
+                result.check_returncode()
+            else:
+                result = run_dafny_command(
+                    " ".join(dafny_command), timeout=timeout, cancel_event=cancel_event
+                )
+            if workspace is not None:
+                workspace.restore_output(result)
             logger.debug(result.stdout)
-        # TODO Catch timeouts
+        except subprocess.TimeoutExpired:
+            logger.warning(
+                f"Verification of {self.file_path} timed out after {timeout}s"
+            )
+            self.verification_outcome = []
+            self.verification_result = "Timeout"
+            self.verification_time = time.monotonic() - start_time
+            return False
+        except VerificationCancelled:
+            logger.debug(f"Verification of {self.file_path} cancelled")
+            self.verification_result = "Cancelled"
+            return False
         except subprocess.CalledProcessError as e:
-            if e.stderr:
-                logger.error(e.stderr)
-            if e.stdout:
-                logger.error(e.stdout)
-            self.error_message = extract_error_message(e.stdout)
-            self.error_file_path = f"{results_directory}/{self.method_name}_{self.type}_{self.index}_error.txt"
-            with open(self.error_file_path, "w") as file:
-                file.write(e.stdout)
-            self.entire_error_message = e.stdout
+            if workspace is not None:
+                workspace.restore_output(e)
+            self.record_error(e, results_directory)
 
         self.verification_outcome = parse_assertion_results(self.dafny_log_file)
+        return self.record_verification_outcome()
+
+    def record_error(self, error, results_directory):
+        if error.stderr:
+            logger.error(error.stderr)
+        if error.stdout:
+            logger.error(error.stdout)
+        self.record_error_output(error.stdout, results_directory)
+
+    def record_error_output(self, output, results_directory):
+        self.error_message = extract_error_message(output)
+        self.error_file_path = self.get_error_file_path(results_directory)
+        with open(self.error_file_path, "w") as file:
+            file.write(output)
+        self.entire_error_message = output
+
+    def run_resolution(
+        self,
+        results_directory,
+        additionnal_args=None,
+        backend=None,
+        workspaces=None,
+        timeout=DEFAULT_VERIFICATION_TIMEOUT,
+    ):
+        """
+        Only parse and resolve the file, which is much cheaper than verifying
+        it. Returns False and sets the Syntax_Error result if it is ill-formed.
+        """
+        resolution_args = remove_verification_options(additionnal_args)
+        if workspaces is not None:
+            with workspaces.materialize(
+                self.file_path,
+                resolution_args,
+                self.get_location(),
+                self.excluded_files,
+            ) as workspace:
+                return self.run_dafny_resolve(
+                    workspace.file_path,
+                    results_directory,
+                    workspace.dafny_args,
+                    backend,
+                    timeout,
+                    workspace,
+                )
+        return self.run_dafny_resolve(
+            self.file_path, results_directory, resolution_args, backend, timeout
+        )
+
+    def run_dafny_resolve(
+        self,
+        file_path,
+        results_directory,
+        additionnal_args,
+        backend,
+        timeout,
+        workspace=None,
+    ):
+        dafny_command = ["dafny", "resolve", "--warn-deprecation:False", file_path]
+        dafny_command[-1:-1] = additionnal_args.split() if additionnal_args else []
+        logger.debug(dafny_command)
+        try:
+            if backend is not None:
+                backend.run(dafny_command[1:], timeout=timeout).check_returncode()
+            else:
+                run_dafny_command(" ".join(dafny_command), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # leave the decision to the verification
+            logger.warning(f"Resolution of {self.file_path} timed out")
+            return True
+        except subprocess.CalledProcessError as e:
+            if workspace is not None:
+                workspace.restore_output(e)
+            self.record_error(e, results_directory)
+            self.record_syntax_error()
+            return False
+        return True
+
+    def record_syntax_error(self):
+        self.verification_outcome = []
+        self.verification_result = "Syntax_Error"
+        self.verification_time = 0
+
+    def record_verification_outcome(self):
         if not self.verification_outcome:
-            self.verication_result = "Syntax_Error"
+            self.verification_result = "Syntax_Error"
             return False
         self.verification_result = (
-            # self.verification_outcome[0]["overall_outcome"] == "Correct"
-            self.verification_outcome[0]["overall_outcome"]
+            # self.verification_outcome[0].overall_outcome == "Correct"
+            self.verification_outcome[0].overall_outcome
         )
-        try:
-            time_adjusted = adjust_microseconds(
-                self.verification_outcome[0]["overall_time"], 6
-            )
-            time_obj = datetime.time.fromisoformat(time_adjusted)
-        except ValueError as e:
-            logger.error(e)
-            logger.error(time_adjusted)
+        overall_time = self.verification_outcome[0].overall_time
+        seconds = self.verification_outcome[0].overall_seconds
+        if seconds is None:
+            logger.error(f"Invalid verification time: {overall_time}")
             self.verification_time = 0
             return False
 
-        self.verification_time = datetime.timedelta(
-            hours=time_obj.hour,
-            minutes=time_obj.minute,
-            seconds=time_obj.second,
-            microseconds=time_obj.microsecond,
-        ).total_seconds()
+        self.verification_time = seconds
         return True
 
+    def outcomes_of(self, qualified_name):
+        """
+        Results of a method in the outcome of a whole file verification.
+        `qualified_name` is the name of the method qualified by its modules
+        and classes, as given by extract_qualified_method_and_lemma_names:
+        methods of the same name in other modules or classes are not matched.
+        """
+        return [
+            outcome
+            for outcome in self.verification_outcome or []
+            if outcome.function_name is not None
+            and source_name(outcome.function_name) == qualified_name
+        ]
+
+    def copy_verification_results(self, other):
+        """
+        Take the results of `other`, a method with the same code verified in
+        place of this one.
+        """
+        self.verification_outcome = other.verification_outcome
+        self.verification_result = other.verification_result
+        self.verification_time = other.verification_time
+        self.dafny_log_file = other.dafny_log_file
+        self.error_message = other.error_message
+        self.entire_error_message = other.entire_error_message
+        if other.entire_error_message is not None and other.error_file_path:
+            self.entire_error_message = other.entire_error_message.replace(
+                os.path.basename(other.file_path), os.path.basename(self.file_path)
+            )
+            self.error_file_path = self.get_error_file_path(
+                os.path.dirname(other.error_file_path)
+            )
+            with open(self.error_file_path, "w") as file:
+                file.write(self.entire_error_message)
+
+    def code_key(self):
+        return normalize_code(self.get_method_content(self.get_file_content()))
+
+    def cache_entry(self, success):
+        with open(self.dafny_log_file, "r") as file:
+            log = file.read()
+        return {
+            "success": success,
+            "verification_result": self.verification_result,
+            "verification_time": self.verification_time,
+            "error_message": self.error_message,
+            "entire_error_message": self.entire_error_message,
+            "log": log,
+        }
+
+    def load_cache_entry(self, entry, results_directory):
+        self.verification_result = entry["verification_result"]
+        self.verification_time = entry["verification_time"]
+        self.error_message = entry["error_message"]
+        self.entire_error_message = entry["entire_error_message"]
+        with open(self.dafny_log_file, "w") as file:
+            file.write(entry["log"])
+        # the records are parsed again from the cached log
+        self.verification_outcome = parse_assertion_results(self.dafny_log_file)
+        if self.entire_error_message is not None:
+            self.error_file_path = self.get_error_file_path(results_directory)
+            with open(self.error_file_path, "w") as file:
+                file.write(self.entire_error_message)
+        return entry["success"]
+
     def __str__(self):
         return f"Method: {self.method_name} in {self.file_path}\nVerification time: {self.verification_time} seconds\nVerification result: {self.verification_result}"
 
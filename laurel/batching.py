@@ -0,0 +1,209 @@
+import os
+import re
+
+from dafny_utils import extract_dafny_functions, extract_method_and_lemma_names
+
+CANDIDATE_SUFFIX = "_laurel_candidate_"
+# blank and code snippet lines following a located message
+SNIPPET_PATTERN = re.compile(r"^\s*(\d+\s*)?(\|.*)?$")
+LOCATION_PATTERN = re.compile(r"^(\S*?)\((\d+),\d+\)")
+
+
+def candidate_name(method_name, index):
+    return f"{method_name}{CANDIDATE_SUFFIX}{index}"
+
+
+def rename_method(method_content, method_name, new_name):
+    # recursive calls are renamed as well
+    return re.sub(rf"\b{re.escape(method_name)}\b", new_name, method_content)
+
+
+def is_recursive(content, method_name):
+    """
+    Whether `method_name` calls itself in `content`, directly or through the
+    other methods and lemmas of the file. A renamed copy of such a method
+    does not verify like the method: the calls of the other methods still
+    go to the original.
+    """
+    names = set(extract_method_and_lemma_names(content))
+    callees = {}
+    for name in names:
+        # without the declaration of the method
+        body = re.sub(
+            rf"\b{re.escape(name)}\b",
+            "",
+            extract_dafny_functions(content, name) or "",
+            1,
+        )
+        callees[name] = {
+            callee for callee in names if re.search(rf"\b{re.escape(callee)}\b", body)
+        }
+    reached = set()
+    to_visit = [method_name]
+    while to_visit:
+        for callee in callees.get(to_visit.pop(), ()):
+            if callee == method_name:
+                return True
+            if callee not in reached:
+                reached.add(callee)
+                to_visit.append(callee)
+    return False
+
+
+class CandidateBatch:
+    """
+    Dafny file holding the candidates of a method side by side. Every
+    candidate is a copy of the method renamed after its index so that they
+    can all be verified by one Dafny run.
+    """
+
+    def __init__(self, base_content, method_name, candidate_contents):
+        """
+        `base_content` is a file containing the method and `candidate_contents`
+        maps the index of each candidate to its version of the method.
+        """
+        self.method_name = method_name
+        method_content = extract_dafny_functions(base_content, method_name)
+        if method_content not in base_content:
+            # the method ends the file without a final newline
+            method_content = method_content[:-1]
+        insert_position = base_content.index(method_content) + len(method_content)
+        # line of the method in the base file and in every candidate file
+        self.method_line = (
+            base_content.count("\n", 0, base_content.index(method_content)) + 1
+        )
+
+        parts = [base_content[:insert_position]]
+        line = base_content.count("\n", 0, insert_position) + 1
+        self.method_length = line - self.method_line
+        self.line_ranges = {}
+        for index, content in candidate_contents.items():
+            copy = "\n" + rename_method(
+                content, method_name, candidate_name(method_name, index)
+            )
+            start = line + 1
+            line += copy.count("\n")
+            self.line_ranges[index] = (start, line - 1)
+            parts.append(copy)
+        parts.append(base_content[insert_position:])
+        self.content = "".join(parts)
+        # the rest of the base file is shifted by the copies
+        self.tail_line = line
+        self.inserted_lines = line - self.method_line - self.method_length
+
+    def write(self, file_path):
+        with open(file_path, "w") as file:
+            file.write(self.content)
+
+    def candidate_of_line(self, line):
+        for index, (start, end) in self.line_ranges.items():
+            if start <= line <= end:
+                return index
+        return None
+
+    def split_output(self, output, batch_file_name, candidate_file_names):
+        """
+        Split the output of the batch run into the error records each
+        candidate would have had if it was run on its own: error locations
+        and names are moved back to the candidate files. A record is a
+        located message with its code snippet, followed by its related
+        locations. The records located outside the candidates, in the batch
+        or in another file, are returned under None.
+        """
+        records = {index: [] for index in self.line_ranges}
+        records[None] = []
+        for file_name, line, record in iter_records(output):
+            index = None
+            if os.path.basename(file_name) == batch_file_name:
+                index = self.candidate_of_line(line)
+            records[index].append(record)
+        for index, index_records in records.items():
+            if index is not None:
+                records[index] = [
+                    self.map_section(
+                        record, index, batch_file_name, candidate_file_names[index]
+                    )
+                    for record in index_records
+                ]
+        return records
+
+    def map_section(self, section, index, batch_file_name, candidate_file_name):
+        start, end = self.line_ranges[index]
+        offset = start - self.method_line
+
+        def map_line(line):
+            line = int(line)
+            if start <= line <= end:
+                return line - offset
+            if line >= self.tail_line:
+                # the candidate file holds the candidate instead of the method
+                candidate_length = end - start + 1
+                return (
+                    line - self.inserted_lines + candidate_length - self.method_length
+                )
+            return line
+
+        section = re.sub(
+            rf"{re.escape(batch_file_name)}\((\d+),(\d+)\)",
+            lambda match: f"{candidate_file_name}({map_line(match.group(1))},{match.group(2)})",
+            section,
+        )
+        # line numbers of the code snippets
+        section = re.sub(
+            r"^(\s*\d+)( \|)",
+            lambda match: str(map_line(match.group(1))).rjust(len(match.group(1)))
+            + match.group(2),
+            section,
+            flags=re.MULTILINE,
+        )
+        return section.replace(
+            candidate_name(self.method_name, index), self.method_name
+        )
+
+
+def iter_records(output):
+    """
+    Split a Dafny output into its records. A record is a located message
+    with its code snippet, followed by its related locations. Yields the
+    file name and the line of each record with its text.
+    """
+    record = None
+    for line in output.splitlines(keepends=True):
+        match = LOCATION_PATTERN.match(line)
+        if match and not (record and "Related location" in line):
+            if record:
+                yield file_name, record_line, "".join(record)
+            file_name, record_line = match.group(1), int(match.group(2))
+            record = [line]
+        elif record and (match or SNIPPET_PATTERN.match(line)):
+            record.append(line)
+        elif record:
+            # summary lines end the records
+            yield file_name, record_line, "".join(record)
+            record = None
+    if record:
+        yield file_name, record_line, "".join(record)
+
+
+def count_errors(records):
+    return sum(1 for record in records if ": Error" in record.split("\n", 1)[0])
+
+
+def join_records(records):
+    return "".join(records).rstrip("\n")
+
+
+def records_output(records, verified):
+    """
+    Dafny output of a run that reported `records` and verified `verified`
+    implementations.
+    """
+    return (
+        f"{join_records(records)}\n\nDafny program verifier finished "
+        f"with {verified} verified, {count_errors(records)} errors\n"
+    )
+
+
+def batch_file_path(candidate_file_path, suffix="batch"):
+    file_name, extension = os.path.splitext(candidate_file_path)
+    return f"{file_name}_{suffix}{extension}"
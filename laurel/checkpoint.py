@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+
+class PruningCheckpoint:
+    """
+    Append-only record of the assertions already processed by a pruning run.
+    Every line is a JSON object holding the key of an assertion, the index
+    it was given and the result of its removal, or the key of a minimized
+    method and the index of its minimization, so that a restarted run skips
+    them and keeps numbering the new ones after the largest index used.
+    Files moved out of or created in the project are journaled as well so
+    that a run killed in the middle of a verification can be undone. Only
+    leftovers inside `project_path` are removed, the results directory holds
+    the files the stats point to.
+    """
+
+    def __init__(self, path, project_path=None):
+        self.path = path
+        self.project_path = project_path
+        self.done = {}
+        self.results = {}
+        self.minimized = {}
+        self.moved = []
+        self.created = []
+        if os.path.exists(path):
+            self._load()
+            self._restore_project()
+        self.file = open(path, "a", buffering=1)
+
+    def _load(self):
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line can be truncated if the run was killed
+                    logger.warning(f"Ignoring corrupted checkpoint line: {line}")
+                    continue
+                if "moved" in entry:
+                    self.moved.append(entry["moved"])
+                elif "created" in entry:
+                    self.created.append(entry["created"])
+                elif "minimized" in entry:
+                    self.minimized[tuple(entry["minimized"])] = entry.get("index")
+                else:
+                    key = tuple(entry["key"])
+                    self.done[key] = entry["index"]
+                    self.results[key] = entry.get("result")
+        logger.info(f"Resuming from {self.path}: {len(self.done)} assertions done")
+
+    def _restore_project(self):
+        for original_path, moved_path in reversed(self.moved):
+            if os.path.exists(moved_path) and not os.path.exists(original_path):
+                logger.warning(f"Restoring {original_path} from {moved_path}")
+                shutil.move(moved_path, original_path)
+        for created_path in self.created:
+            if os.path.exists(created_path) and self.in_project(created_path):
+                logger.warning(f"Removing leftover {created_path}")
+                os.remove(created_path)
+        self.moved = []
+        self.created = []
+
+    def in_project(self, path):
+        if self.project_path is None:
+            return True
+        project_path = os.path.abspath(self.project_path)
+        return os.path.commonpath([project_path, os.path.abspath(path)]) == project_path
+
+    def is_done(self, key):
+        return key in self.done
+
+    def mark_done(self, key, index, result=None):
+        self.done[key] = index
+        self.results[key] = result
+        self._write({"key": list(key), "index": index, "result": result})
+
+    def is_minimized(self, method_key):
+        return method_key in self.minimized
+
+    def mark_minimized(self, method_key, index):
+        self.minimized[method_key] = index
+        self._write({"minimized": list(method_key), "index": index})
+
+    def record_move(self, original_path, moved_path):
+        self._write({"moved": [original_path, moved_path]})
+
+    def record_created(self, path):
+        self._write({"created": path})
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+
+    def last_index(self):
+        indices = [index for index in self.minimized.values() if index is not None]
+        return max([*self.done.values(), *indices], default=0)
+
+    def close(self):
+        self.file.close()
+
+
+def assertion_key(file_path, method_name, assertions, position):
+    """
+    Key of the assertion at `position` in the `assertions` of a method. The
+    occurrence count tells apart identical assertions of the same method.
+    """
+    assertion = assertions[position]
+    occurrence = assertions[:position].count(assertion)
+    return (os.path.abspath(file_path), method_name, assertion, occurrence)
+
+
+def open_checkpoint(config):
+    stats_file = config["Stats_file"]
+    checkpoint_file = config.get("Checkpoint_file", f"{stats_file}.checkpoint")
+    if not config.get("Resume", True) and os.path.exists(checkpoint_file):
+        logger.info(f"Resume disabled, starting over {checkpoint_file}")
+        os.remove(checkpoint_file)
+    return PruningCheckpoint(checkpoint_file, config["Project_path"])
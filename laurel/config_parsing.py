@@ -3,7 +3,11 @@ import os
 import traceback
 import yaml
 
+from dafny_server_wrapper import open_server_pool
+from dafny_utils import DEFAULT_VERIFICATION_TIMEOUT
+from disk_cache import open_cache
 from Method import Method
+from workspace import open_workspace_manager
 
 logger = logging.getLogger(__name__)
 
@@ -39,3 +43,33 @@ def parse_config_llm(config_file):
         except yaml.YAMLError as exc:
             traceback_str = traceback.format_exc()
             logger.error(f"{exc}\n{traceback_str}")
+
+
+def parse_verification_options(config, baseline_time=None):
+    """
+    Keyword arguments of Method.run_verification. `baseline_time` is the
+    verification time of the original method, from which the timeout of a
+    modified method is derived.
+    """
+    return {
+        "additionnal_args": config.get("Dafny_args", ""),
+        "cache": open_cache(config.get("Verification_cache")),
+        "backend": open_server_pool(config.get("Dafny_servers", 0)),
+        "workspaces": open_workspace_manager(
+            config.get("Isolated_workspaces", False), config.get("Workspace_dir")
+        ),
+        "log_format": config.get("Log_format", "text"),
+        "timeout": get_verification_timeout(config, baseline_time),
+    }
+
+
+def get_verification_timeout(config, baseline_time=None):
+    maximum = config.get("Timeout_max", DEFAULT_VERIFICATION_TIMEOUT)
+    factor = config.get("Timeout_factor")
+    if not factor or not baseline_time:
+        return maximum
+    return min(maximum, max(config.get("Timeout_min", 30), factor * baseline_time))
+
+
+def is_isolated(config):
+    return config.get("Isolated_workspaces", False)
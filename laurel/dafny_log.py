@@ -0,0 +1,231 @@
+import json
+import re
+from dataclasses import dataclass, field
+
+RESULTS_PATTERN = re.compile(r"Results for (\S+) \(([\w-]+)\)")
+BATCH_PATTERN = re.compile(r"Assertion batch (\d+):")
+ASSERTION_PATTERN = re.compile(r"(\w+\.\w+)\((\d+),(\d+)\): (.+)")
+JSON_NAME_PATTERN = re.compile(r"(\S+) \(([\w-]+)\)")
+JSON_RESULTS_PATTERN = re.compile(r'"verificationResults"\s*:\s*\[')
+JSON_CHUNK_SIZE = 1 << 16
+
+# text log fields of an implementation and of an assertion batch
+IMPLEMENTATION_FIELDS = {
+    "Overall outcome": "overall_outcome",
+    "Overall time": "overall_time",
+    "Overall resource count": "overall_resource_count",
+    "Maximum assertion batch time": "max_batch_time",
+    "Maximum assertion batch resource count": "max_batch_resource_count",
+}
+BATCH_FIELDS = {
+    "Outcome": "overall_outcome",
+    "Duration": "duration",
+    "Resource count": "resource_count",
+}
+COUNT_FIELDS = {"overall_resource_count", "max_batch_resource_count", "resource_count"}
+
+
+@dataclass(slots=True)
+class AssertionResult:
+    filename: str
+    line: int
+    character: int
+    assertion_result: str
+
+
+@dataclass(slots=True)
+class BatchResult:
+    batch_number: int
+    overall_outcome: str = None
+    duration: str = None
+    resource_count: int = None
+    assertions: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ImplementationResult:
+    function_name: str = None
+    verification_type: str = None
+    overall_outcome: str = None
+    overall_time: str = None
+    overall_resource_count: int = None
+    max_batch_time: str = None
+    max_batch_resource_count: int = None
+    batches: list = field(default_factory=list)
+
+    @property
+    def overall_seconds(self):
+        return parse_duration(self.overall_time)
+
+
+def parse_duration(duration):
+    """
+    Convert a .NET TimeSpan ([d.]hh:mm:ss[.fffffff]) to seconds.
+    """
+    if duration is None:
+        return None
+    try:
+        hours, minutes, seconds = duration.strip().split(":")
+        days, _, hours = hours.rpartition(".")
+        return (
+            (int(days or 0) * 24 + int(hours)) * 3600
+            + int(minutes) * 60
+            + float(seconds)
+        )
+    except ValueError:
+        return None
+
+
+def iter_text_log(lines):
+    """
+    Parse the text log of Dafny line by line, yielding a record for every
+    implementation once all its lines have been read.
+    """
+    implementation = None
+    batch = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith("Results for "):
+            if implementation is not None:
+                yield implementation
+            implementation = ImplementationResult()
+            batch = None
+            match = RESULTS_PATTERN.match(line)
+            if match:
+                implementation.function_name = match.group(1)
+                implementation.verification_type = match.group(2)
+            continue
+        if implementation is None or not line:
+            continue
+
+        match = BATCH_PATTERN.match(line)
+        if match:
+            batch = BatchResult(int(match.group(1)))
+            implementation.batches.append(batch)
+            continue
+        label, _, value = line.partition(": ")
+        if label in IMPLEMENTATION_FIELDS:
+            set_field(implementation, IMPLEMENTATION_FIELDS[label], value)
+            continue
+        if batch is None:
+            continue
+        if label in BATCH_FIELDS:
+            set_field(batch, BATCH_FIELDS[label], value)
+            continue
+        match = ASSERTION_PATTERN.search(line)
+        if match:
+            file_name, line_number, character, assertion_result = match.groups()
+            batch.assertions.append(
+                AssertionResult(
+                    file_name, int(line_number), int(character), assertion_result
+                )
+            )
+    if implementation is not None:
+        yield implementation
+
+
+def set_field(record, name, value):
+    if name in COUNT_FIELDS:
+        value = int(value) if value.isdigit() else None
+    elif name.endswith("outcome"):
+        value = value.split()[0] if value else None
+    setattr(record, name, value)
+
+
+def iter_json_log(file, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Parse the log written with `--log-format json` one item of its
+    verificationResults at a time, without loading the whole log.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while True:
+        match = JSON_RESULTS_PATTERN.search(buffer)
+        if match:
+            break
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+    buffer = buffer[match.end() :]
+    while True:
+        start = len(buffer) - len(buffer.lstrip(" \t\r\n,"))
+        if start < len(buffer) and buffer[start] == "]":
+            return
+        try:
+            if start == len(buffer):
+                raise json.JSONDecodeError("Missing item", buffer, start)
+            result, end = decoder.raw_decode(buffer, start)
+        except json.JSONDecodeError:
+            # the item continues in the next chunk
+            chunk = file.read(chunk_size)
+            if not chunk:
+                # the log of a killed run can be truncated
+                return
+            buffer += chunk
+            continue
+        yield json_implementation(result)
+        buffer = buffer[end:]
+
+
+def json_implementation(result):
+    implementation = ImplementationResult(
+        overall_outcome=result.get("outcome"),
+        overall_time=result.get("runTime"),
+        overall_resource_count=result.get("resourceCount"),
+    )
+    name = result.get("name", "")
+    match = JSON_NAME_PATTERN.match(name)
+    if match:
+        implementation.function_name = match.group(1)
+        implementation.verification_type = match.group(2)
+    else:
+        implementation.function_name = name or None
+
+    for vc_result in result.get("vcResults", []):
+        batch = BatchResult(
+            vc_result.get("vcNum"),
+            vc_result.get("outcome"),
+            vc_result.get("runTime"),
+            vc_result.get("resourceCount"),
+        )
+        for assertion in vc_result.get("assertions", []):
+            location = assertion.get("location", {})
+            batch.assertions.append(
+                AssertionResult(
+                    location.get("filename"),
+                    location.get("line"),
+                    location.get("col"),
+                    assertion.get("description"),
+                )
+            )
+        implementation.batches.append(batch)
+
+    if implementation.batches:
+        slowest = max(
+            implementation.batches,
+            key=lambda batch: parse_duration(batch.duration) or 0,
+        )
+        implementation.max_batch_time = slowest.duration
+        implementation.max_batch_resource_count = max(
+            batch.resource_count or 0 for batch in implementation.batches
+        )
+    return implementation
+
+
+def read_log(file_path):
+    """
+    Read a Dafny log in the text or JSON format, yielding the record of
+    every implementation as soon as it is parsed.
+    """
+    with open(file_path, "r") as file:
+        first_char = ""
+        while True:
+            first_char = file.read(1)
+            if not first_char or not first_char.isspace():
+                break
+        file.seek(0)
+        if first_char == "{":
+            yield from iter_json_log(file)
+        else:
+            yield from iter_text_log(file)
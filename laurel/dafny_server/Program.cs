@@ -0,0 +1,85 @@
+using System;
+using System.IO;
+using System.Text.Json;
+using System.Threading.Tasks;
+using Microsoft.Dafny;
+
+namespace dafny_server
+{
+    public class VerificationRequest
+    {
+        public string[] Args { get; set; }
+        // ask for the version of the Dafny the server runs instead
+        public bool Version { get; set; }
+    }
+
+    public class VerificationResponse
+    {
+        public int ExitCode { get; set; }
+        public string Stdout { get; set; }
+        public string Stderr { get; set; }
+    }
+
+    // Long-lived Dafny driver: reads one JSON request per line on stdin,
+    // runs the Dafny CLI in-process with the given arguments and answers
+    // with one JSON response per line on stdout.
+    class Program
+    {
+        static int RunDafny(string[] args, TextWriter stdout, TextWriter stderr)
+        {
+            // Depending on the Dafny version MainWithWriters returns an int or a Task<int>
+            object exitCode = DafnyCli.MainWithWriters(stdout, stderr, TextReader.Null, args);
+            if (exitCode is Task<int> task)
+            {
+                return task.GetAwaiter().GetResult();
+            }
+            return (int)exitCode;
+        }
+
+        static int Main(string[] args)
+        {
+            // Keep the real stdout for the protocol, anything Dafny prints
+            // directly on the console goes to stderr.
+            var protocol = new StreamWriter(Console.OpenStandardOutput()) { AutoFlush = true };
+            Console.SetOut(Console.Error);
+
+            string line;
+            while ((line = Console.In.ReadLine()) != null)
+            {
+                if (string.IsNullOrWhiteSpace(line))
+                {
+                    continue;
+                }
+                var request = JsonSerializer.Deserialize<VerificationRequest>(line);
+                var stdout = new StringWriter();
+                var stderr = new StringWriter();
+                int exitCode;
+                try
+                {
+                    if (request.Version)
+                    {
+                        stdout.Write(typeof(DafnyCli).Assembly.GetName().Version.ToString(3));
+                        exitCode = 0;
+                    }
+                    else
+                    {
+                        exitCode = RunDafny(request.Args, stdout, stderr);
+                    }
+                }
+                catch (Exception e)
+                {
+                    stderr.WriteLine(e.ToString());
+                    exitCode = -1;
+                }
+                var response = new VerificationResponse
+                {
+                    ExitCode = exitCode,
+                    Stdout = stdout.ToString(),
+                    Stderr = stderr.ToString()
+                };
+                protocol.WriteLine(JsonSerializer.Serialize(response));
+            }
+            return 0;
+        }
+    }
+}
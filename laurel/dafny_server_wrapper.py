@@ -0,0 +1,175 @@
+import atexit
+import functools
+import glob
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+
+from dafny_utils import VerificationCancelled
+
+DAFNY_SERVER_CSHARP_PATH = "dafny_server/bin/Debug/net6.0/dafny_server"
+
+logger = logging.getLogger(__name__)
+
+
+class DafnyServerError(Exception):
+    pass
+
+
+def expand_shell_arguments(arguments):
+    """
+    Mimic the shell on a list of arguments built for `dafny` on the command
+    line: quoted arguments are taken literally and globs are expanded.
+    """
+    expanded = []
+    for argument in arguments:
+        if len(argument) > 1 and argument[0] == argument[-1] == '"':
+            expanded.append(argument[1:-1])
+        elif glob.has_magic(argument):
+            matches = sorted(glob.glob(argument, recursive=True))
+            expanded.extend(matches if matches else [argument])
+        else:
+            expanded.append(argument)
+    return expanded
+
+
+class DafnyServer:
+    """
+    A warm Dafny process answering one verification request at a time.
+    """
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [os.path.join(os.path.dirname(__file__), DAFNY_SERVER_CSHARP_PATH)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            start_new_session=True,
+        )
+        self.jobs = 0
+        self.responses = queue.Queue()
+        self.reader = threading.Thread(target=self._read_responses, daemon=True)
+        self.reader.start()
+
+    def _read_responses(self):
+        for line in self.process.stdout:
+            self.responses.put(line)
+        self.responses.put(None)
+
+    def run(self, arguments, timeout=None, cancel_event=None):
+        response = self._request({"Args": arguments}, arguments, timeout, cancel_event)
+        return subprocess.CompletedProcess(
+            arguments, response["ExitCode"], response["Stdout"], response["Stderr"]
+        )
+
+    def version(self, timeout=None):
+        response = self._request({"Version": True}, ["--version"], timeout)
+        if response["ExitCode"] != 0 or not response["Stdout"]:
+            raise DafnyServerError(
+                "Dafny server does not report its version, rebuild dafny_server"
+            )
+        return response["Stdout"]
+
+    def _request(self, payload, arguments, timeout=None, cancel_event=None):
+        request = json.dumps(payload)
+        try:
+            self.process.stdin.write(request + "\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            raise DafnyServerError(f"Dafny server is not running: {e}")
+        self.jobs += 1
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            try:
+                line = self.responses.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise VerificationCancelled(arguments)
+                if deadline is not None and time.monotonic() > deadline:
+                    raise subprocess.TimeoutExpired(arguments, timeout)
+        if line is None:
+            raise DafnyServerError("Dafny server exited unexpectedly")
+        return json.loads(line)
+
+    def close(self):
+        # the server runs in its own session, kill the solvers it started too
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+
+class DafnyServerPool:
+    """
+    Pool of `size` warm Dafny servers. `run` takes the arguments that would
+    follow `dafny` on the command line and returns a CompletedProcess.
+    A server is restarted after `max_jobs` requests or if a request fails,
+    times out or is cancelled.
+    """
+
+    def __init__(self, size, max_jobs=100):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.servers = queue.Queue()
+        for _ in range(size):
+            self.servers.put(None)
+        self._version = None
+
+    def run(self, arguments, timeout=None, cancel_event=None):
+        return self._with_server(
+            lambda server: server.run(
+                expand_shell_arguments(arguments), timeout, cancel_event
+            )
+        )
+
+    def version(self):
+        """
+        Version of the Dafny the servers run, which the verification cache
+        is keyed on rather than the version of the Dafny CLI.
+        """
+        if self._version is None:
+            self._version = self._with_server(lambda server: server.version(60))
+        return self._version
+
+    def _with_server(self, request):
+        server = self.servers.get()
+        try:
+            if server is None:
+                server = DafnyServer()
+            result = request(server)
+        except (DafnyServerError, subprocess.TimeoutExpired, VerificationCancelled):
+            server.close()
+            server = None
+            raise
+        finally:
+            if server is not None and server.jobs >= self.max_jobs:
+                server.close()
+                server = None
+            self.servers.put(server)
+        return result
+
+    def close(self):
+        # the servers are restarted if the pool is used again
+        for _ in range(self.size):
+            server = self.servers.get()
+            if server is not None:
+                server.close()
+            self.servers.put(None)
+
+
+@functools.lru_cache(maxsize=None)
+def open_server_pool(size):
+    if not size:
+        return None
+    logger.info(f"Starting a pool of {size} Dafny servers")
+    pool = DafnyServerPool(size)
+    atexit.register(pool.close)
+    return pool
@@ -1,5 +1,123 @@
+import functools
 import os
 import re
+import signal
+import subprocess
+import time
+
+from dafny_log import read_log
+
+
+# wall-clock limit in seconds of a verification when none is configured
+DEFAULT_VERIFICATION_TIMEOUT = 400
+
+
+class VerificationCancelled(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def get_dafny_version():
+    try:
+        result = subprocess.run(
+            ["dafny", "--version"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return result.stdout.strip()
+
+
+def extract_library_patterns(dafny_args):
+    # "--library /path/src/**/*.dfy --resource-limit 20000" -> ["/path/src/**/*.dfy"]
+    if not dafny_args:
+        return []
+    return re.findall(r"--library[\s:=]+([^\s]+)", dafny_args)
+
+
+def extract_cores(dafny_args):
+    # "--cores:2" or "--cores 50%" -> number of cores used by one Dafny run
+    match = re.search(r"--cores[\s:=]+(\d+)(%?)", dafny_args or "")
+    if not match:
+        return 1
+    if match.group(2):
+        return max(1, os.cpu_count() * int(match.group(1)) // 100)
+    return max(1, int(match.group(1)))
+
+
+TIME_LIMIT_PATTERN = r"--verification-time-limit[\s:=]+(\d+)"
+
+
+def extract_verification_time_limit(dafny_args):
+    match = re.search(TIME_LIMIT_PATTERN, dafny_args or "")
+    return int(match.group(1)) if match else None
+
+
+def set_verification_time_limit(dafny_args, seconds):
+    option = f"--verification-time-limit:{seconds}"
+    if re.search(TIME_LIMIT_PATTERN, dafny_args or ""):
+        return re.sub(TIME_LIMIT_PATTERN, option, dafny_args)
+    return f"{dafny_args} {option}".strip()
+
+
+# options of `dafny verify` that `dafny resolve` does not accept
+VERIFICATION_OPTIONS = (
+    r"cores|verification-time-limit|resource-limit|boogie-filter|log-format|boogie"
+    r"|solver-[\w-]+|vcs-[\w-]+|disable-nonlinear-arithmetic|isolate-assertions"
+    r"|verify-included-files|verification-error-limit|track-print-effects"
+)
+
+
+def remove_verification_options(dafny_args):
+    # "--cores:2 --resource-limit 20000 --library x" -> "--library x"
+    dafny_args = re.sub(
+        rf"--(?:{VERIFICATION_OPTIONS})(?:[:=]\S+|\s+(?!-)\S+)?(?=\s|$)",
+        "",
+        dafny_args or "",
+    )
+    return " ".join(dafny_args.split())
+
+
+def run_dafny_command(command, timeout, cancel_event=None):
+    """
+    Run a Dafny shell command in its own process group so that the whole
+    process tree (shell, dafny, z3) can be killed on timeout or cancellation.
+    """
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        shell=True,
+        executable="/usr/bin/zsh",
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                kill_process_group(process)
+                raise VerificationCancelled(command)
+            if time.monotonic() > deadline:
+                kill_process_group(process)
+                raise subprocess.TimeoutExpired(command, timeout)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.communicate()
+
+
+def extract_includes(dafny_code):
+    return re.findall(r'^\s*include\s+"([^"]+)"', dafny_code, flags=re.MULTILINE)
 
 
 def extract_error_message(error_string):
@@ -47,94 +165,10 @@ def compare_errormessage(previous_output, new_output):
 
 
 def parse_assertion_results(file_path):
-    with open(file_path, "r") as f:
-        data = f.read()
-    assertion_batches = re.split(r"\n(?=\s*Results for \w+)", data)[1:]
-
-    result = []
-    for batch in assertion_batches:
-        if not batch:
-            continue
-        function_match = re.search(r"Results for (\w+) \((\w+)\)", batch)
-        if function_match:
-            function_name = function_match.group(1)
-            verification_type = function_match.group(2)
-        else:
-            function_name = None
-            verification_type = None
-
-        overall_outcome_match = re.search(r"Overall outcome: (\w+)", batch)
-        overall_time_match = re.search(r"Overall time: (.+)", batch)
-        overall_resource_count_match = re.search(
-            r"Overall resource count: (\d+)", batch
-        )
-        max_batch_time_match = re.search(r"Maximum assertion batch time: (.+)", batch)
-        max_batch_resource_count_match = re.search(
-            r"Maximum assertion batch resource count: (\d+)", batch
-        )
-        batch_info_matches = re.finditer(
-            r"Assertion batch (\d+):([\s\S]*?)(?=\n\s*Assertion batch \d+|$)", batch
-        )
-
-        batches_info = []
-        for batch_info_match in batch_info_matches:
-            batch_number = int(batch_info_match.group(1))
-            batch_info = batch_info_match.group(2).strip()
-
-            outcome_match = re.search(r"Outcome: (\w+)", batch_info)
-            duration_match = re.search(r"Duration: (.+)", batch_info)
-            resource_count_match = re.search(r"Resource count: (\d+)", batch_info)
-
-            batch_data = {
-                "batch_number": batch_number,
-                "overall_outcome": outcome_match.group(1) if outcome_match else None,
-                "duration": duration_match.group(1) if duration_match else None,
-                "resource_count": int(resource_count_match.group(1))
-                if resource_count_match
-                else None,
-            }
-
-            assertions_info = []
-            assertions_matches = re.finditer(
-                r"(\w+\.\w+)\((\d+),(\d+)\): (.+)", batch_info
-            )
-            for match in assertions_matches:
-                file_name, line, character, assertion_result = match.groups()
-
-                assertions_info.append(
-                    {
-                        "filename": file_name,
-                        "line": int(line),
-                        "character": int(character),
-                        "assertion_result": assertion_result,
-                    }
-                )
-
-            batch_data["assertions"] = assertions_info
-            batches_info.append(batch_data)
-
-        function_data = {
-            "function_name": function_name,
-            "verification_type": verification_type,
-            "overall_outcome": overall_outcome_match.group(1)
-            if overall_outcome_match
-            else None,
-            "overall_time": overall_time_match.group(1) if overall_time_match else None,
-            "overall_resource_count": int(overall_resource_count_match.group(1))
-            if overall_resource_count_match
-            else None,
-            "max_batch_time": max_batch_time_match.group(1)
-            if max_batch_time_match
-            else None,
-            "max_batch_resource_count": int(max_batch_resource_count_match.group(1))
-            if max_batch_resource_count_match
-            else None,
-            "batches": batches_info,
-        }
-
-        result.append(function_data)
-
-    return result
+    """
+    Records of every implementation in a Dafny log (text or JSON format).
+    """
+    return list(read_log(file_path))
 
 
 def extract_assertions(code):
@@ -246,6 +280,83 @@ def extract_method_and_lemma_names(content):
     return method_names + lemma_names
 
 
+# declarations whose members are qualified by their name
+SCOPE_PATTERN = re.compile(
+    r"\{:[^}]*\}|[{}]"
+    r"|\b(?:module|class|trait|datatype|codatatype|newtype)\s+"
+    r"(?:\{:[^}]*\}\s*)*([\w.]+)"
+    r"|\b(?:function|predicate|method|lemma|constructor|const|var|type)\b"
+)
+# scopes Dafny adds to the names of the declarations outside of any
+IMPLICIT_SCOPES = ("_module", "__default")
+
+
+def extract_qualified_method_and_lemma_names(content):
+    """
+    Names of the methods and lemmas of `content` qualified by their enclosing
+    modules, classes, traits and datatypes ("Module.Class.Method"), in the
+    order of extract_method_and_lemma_names.
+    """
+    declarations = sorted(
+        (match.start(), kind, match.group(1))
+        for kind in ("method", "lemma")
+        for match in re.finditer(rf"\b{kind}\s+(\w+)", content)
+    )
+    # comments are blanked out to keep the positions
+    code = re.sub(
+        r"//[^\n]*|/\*.*?\*/",
+        lambda match: re.sub(r"[^\n]", " ", match.group()),
+        content,
+        flags=re.DOTALL,
+    )
+    qualified_names = {}
+    # enclosing declarations with the depth of their body
+    scopes = []
+    pending_scope = None
+    depth = 0
+    declaration_index = 0
+    for match in list(SCOPE_PATTERN.finditer(code)) + [None]:
+        position = match.start() if match else len(content)
+        while (
+            declaration_index < len(declarations)
+            and declarations[declaration_index][0] < position
+        ):
+            start, _, name = declarations[declaration_index]
+            qualified_names[start] = ".".join([scope for scope, _ in scopes] + [name])
+            declaration_index += 1
+        if match is None or match.group().startswith("{:"):
+            continue
+        if match.group() == "{":
+            depth += 1
+            if pending_scope is not None:
+                scopes.append((pending_scope, depth))
+                pending_scope = None
+        elif match.group() == "}":
+            if scopes and scopes[-1][1] == depth:
+                scopes.pop()
+            depth -= 1
+        else:
+            # a datatype or newtype without members ends at the next declaration
+            pending_scope = match.group(1)
+
+    return [
+        qualified_names[start]
+        for kind in ("method", "lemma")
+        for start, declaration_kind, _ in declarations
+        if declaration_kind == kind
+    ]
+
+
+def source_name(implementation_name):
+    """
+    Name of an implementation of a verification log as written in the source
+    file, without the implicit default module and class.
+    """
+    return ".".join(
+        part for part in implementation_name.split(".") if part not in IMPLICIT_SCOPES
+    )
+
+
 def replace_method(file_content, old_method_name, new_method_content):
     function = extract_dafny_functions(file_content, old_method_name)
     dafny_code = file_content.replace(function, new_method_content)
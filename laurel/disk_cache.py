@@ -0,0 +1,115 @@
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from dafny_utils import extract_includes, extract_library_patterns
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """
+    Persistent key/value store where every entry is a JSON file named after
+    its key. Entries are written atomically so that several processes can
+    share the same directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._entry_path(key), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
+
+    def put(self, key, value):
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path))
+        with os.fdopen(fd, "w") as file:
+            json.dump(value, file)
+        os.replace(tmp_path, entry_path)
+
+
+@functools.lru_cache(maxsize=None)
+def open_cache(directory):
+    if not directory:
+        return None
+    return DiskCache(directory)
+
+
+def hash_key(*parts):
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=4096)
+def _file_digest(path, mtime_ns, size):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    return _file_digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+def included_files(file_path, location=None):
+    """
+    Return the files transitively included by `file_path`. `location` is the
+    directory the file is verified from (defaults to its own directory).
+    """
+    seen = set()
+    to_visit = [(file_path, location or os.path.dirname(file_path))]
+    while to_visit:
+        current, directory = to_visit.pop()
+        try:
+            with open(current, "r") as file:
+                content = file.read()
+        except OSError:
+            continue
+        for include in extract_includes(content):
+            include_path = os.path.abspath(os.path.join(directory, include))
+            if include_path not in seen:
+                seen.add(include_path)
+                to_visit.append((include_path, os.path.dirname(include_path)))
+    return seen
+
+
+def library_files(dafny_args):
+    files = set()
+    for pattern in extract_library_patterns(dafny_args):
+        files.update(
+            os.path.abspath(path) for path in glob.glob(pattern, recursive=True)
+        )
+    return files
+
+
+def dependency_files(file_path, dafny_args, location=None):
+    dependencies = included_files(file_path, location)
+    for library_file in library_files(dafny_args):
+        dependencies.add(library_file)
+        dependencies.update(included_files(library_file))
+    dependencies.discard(os.path.abspath(file_path))
+    return sorted(dependencies)
+
+
+def dependency_digests(file_path, dafny_args, location=None, excluded_files=()):
+    excluded_files = {os.path.abspath(path) for path in excluded_files}
+    return [
+        (path, file_digest(path))
+        for path in dependency_files(file_path, dafny_args, location)
+        if path not in excluded_files and os.path.exists(path)
+    ]
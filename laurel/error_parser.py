@@ -1,4 +1,11 @@
-from placeholder_wrapper import call_placeholder_finder
+import os
+
+from disk_cache import file_digest, hash_key
+from placeholder_wrapper import (
+    call_placeholder_finder,
+    placeholder_executable,
+    placeholder_finder_digests,
+)
 
 
 # insert assertion location that just return the method with the placeholder
@@ -9,18 +16,84 @@ def insert_assertion_location(
     optional_files=None,
     original_method_file=None,
     multiple_locations=False,
+    cache=None,
+    use_daemon=True,
 ):
+    error_message = remove_warning(message)
+    if cache is not None:
+        key = placeholder_key(
+            error_message,
+            method_file,
+            method_name,
+            optional_files,
+            original_method_file,
+            multiple_locations,
+        )
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["output"], ""
     method_with_placeholder = call_placeholder_finder(
-        remove_warning(message),
+        error_message,
         method_file,
         method_name,
         optional_files=optional_files,
         blacklisted_file=original_method_file,
         multiple_locations=multiple_locations,
+        use_daemon=use_daemon,
     )
+    output, error = method_with_placeholder
+    if cache is not None and not error:
+        cache.put(key, {"output": output})
     return method_with_placeholder
 
 
+def placeholder_key(
+    error_message,
+    method_file,
+    method_name,
+    optional_files,
+    blacklisted_file,
+    multiple_locations,
+):
+    """
+    Cache key of a placeholder finder call: the build of the finder, the
+    content of the method file and of the library files it loads rather
+    than their paths.
+    """
+    executable = placeholder_executable()
+    return hash_key(
+        executable,
+        placeholder_finder_digests(executable),
+        file_digest(method_file),
+        method_name,
+        error_message,
+        multiple_locations,
+        [
+            (path, file_digest(path))
+            for path in placeholder_library_files(optional_files, blacklisted_file)
+        ],
+    )
+
+
+def placeholder_library_files(optional_files, blacklisted_file=None):
+    # same files as AddFilesToFs in the placeholder finder
+    if not optional_files:
+        return []
+    directory = os.path.abspath(os.path.normpath(optional_files))
+    if "**" in optional_files:
+        directory = os.path.abspath(optional_files[: optional_files.index("**")])
+    files = []
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            if not file_name.endswith(".dfy"):
+                continue
+            path = os.path.join(root, file_name)
+            if blacklisted_file and blacklisted_file in path:
+                continue
+            files.append(path)
+    return sorted(files)
+
+
 def remove_warning(message):
     lines = message.split("\n")
 
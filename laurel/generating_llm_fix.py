@@ -1,15 +1,35 @@
 import logging
+import math
 import os
-import shutil
+import threading
 import traceback
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
-from config_parsing import parse_config_llm
+from config_parsing import (
+    is_isolated,
+    parse_config_llm,
+    parse_verification_options,
+)
+from batching import (
+    CandidateBatch,
+    batch_file_path,
+    candidate_name,
+    count_errors,
+    is_recursive,
+    join_records,
+    records_output,
+)
 from dafny_utils import (
     compare_errormessage,
+    extract_cores,
     extract_dafny_functions,
+    extract_library_patterns,
+    extract_qualified_method_and_lemma_names,
     find_starting_line_number,
+    set_verification_time_limit,
 )
+from disk_cache import open_cache
 from error_parser import remove_warning
 from llm_prompt import Llm_prompt
 from Method import Method
@@ -19,6 +39,11 @@ from utils import (
     write_csv_header_arg,
 )
 from select_example import ExamplesSelector
+from tiers import get_short_time_limit, is_tiered, timed_out_candidates
+from verification_environment import (
+    cleanup_environment,
+    setup_verification_environment,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -132,7 +157,12 @@ def generate_fix_llm(
 
 
 def insert_assertion(
-    method_with_placeholder, original_method, fix_prompt, try_number, config_prompt
+    method_with_placeholder,
+    original_method,
+    fix_prompt,
+    try_number,
+    config_prompt,
+    directory=None,
 ):
     assertion, placeholder_number = fix_prompt
     if "\n" not in assertion:
@@ -177,7 +207,7 @@ def insert_assertion(
     diff = original_method.get_diff(new_method_content)
     new_method = original_method.create_modified_method(
         new_method_content,
-        os.path.dirname(original_method.file_path),
+        directory if directory else os.path.dirname(original_method.file_path),
         try_number,
         "fix",
         config_prompt["Prompt_name"],
@@ -220,6 +250,8 @@ def generate_prompts(
         threshold,
         config.get("Dafny_args", ""),
         unmodified_method_path,
+        placeholder_cache=open_cache(config.get("Placeholder_cache")),
+        placeholder_daemon=config.get("Placeholder_daemon", True),
     )
 
     new_prompts = llm_prompt.get_n_fixes(
@@ -245,7 +277,7 @@ def process_method(
     nb_placeholders = 0
     placeholder_position = 0
     logger.info("+--------------------------------------+")
-    method.run_verification(config["Results_dir"], config.get("Dafny_args", ""))
+    method.run_verification(config["Results_dir"], **parse_verification_options(config))
     if method.verification_result == "Correct":
         logger.info(f"Method {method.method_name} already verified")
         method.move_to_results_directory(os.path.dirname(original_file_location))
@@ -254,6 +286,9 @@ def process_method(
     logger.debug(method)
     new_method = None
     diff = ""
+    # isolated workspaces let the candidates live in the results directory
+    isolated = is_isolated(config)
+    candidates_directory = config["Results_dir"] if isolated else None
     for prompt_index, config_prompt in enumerate(config["Prompts"], start=1):
         try:
             new_prompts, method_with_placeholder = generate_prompts(
@@ -270,6 +305,24 @@ def process_method(
             traceback_str = traceback.format_exc()
             logger.error(f"An error occurred: {e}\n{traceback_str}")
             break
+        candidates = None
+        # candidates verified for this prompt, by code
+        verified_methods = {}
+        if verifies_candidates_together(config):
+            candidates = prepare_candidates(
+                new_prompts,
+                method,
+                method_with_placeholder,
+                config_prompt,
+                candidates_directory,
+            )
+            if config.get("Resolve_candidates", False):
+                resolve_candidates(candidates, method, config)
+            if not isolated:
+                method.move_to_results_directory(config["Results_dir"])
+            verify_candidates(candidates, config, method.verification_time)
+            if not isolated:
+                method.move_to_results_directory(os.path.dirname(original_method_file))
         for i, prompt in enumerate(new_prompts, start=1):
             if success:
                 break
@@ -278,18 +331,39 @@ def process_method(
                 feedback = False
                 prompt_path = f"{method.file_path}_{method.index}_{prompt_index}_{config_prompt['Prompt_name']}_prompt"
                 prompt.set_path(prompt_path)
-                response_tuple = eval(prompt.get_latest_message()["content"])
-                assertion, placeholder_position = response_tuple
-                logger.info(
-                    f"Choose placeholder number: {placeholder_position} for {assertion}"
-                )
-                new_method, diff = insert_assertion(
-                    method_with_placeholder, method, response_tuple, i, config_prompt
-                )
-                method.move_to_results_directory(config["Results_dir"])
-                new_method.run_verification(
-                    config["Results_dir"], config.get("Dafny_args", "")
-                )
+                if candidates is not None:
+                    new_method, diff, placeholder_position, error = candidates[i - 1]
+                    if error is not None:
+                        raise error
+                else:
+                    response_tuple = eval(prompt.get_latest_message()["content"])
+                    assertion, placeholder_position = response_tuple
+                    logger.info(
+                        f"Choose placeholder number: {placeholder_position} "
+                        f"for {assertion}"
+                    )
+                    new_method, diff = insert_assertion(
+                        method_with_placeholder,
+                        method,
+                        response_tuple,
+                        i,
+                        config_prompt,
+                        candidates_directory,
+                    )
+                    code_key = new_method.code_key()
+                    if code_key in verified_methods:
+                        logger.info("Same code as a previous candidate")
+                        new_method.copy_verification_results(verified_methods[code_key])
+                    else:
+                        if not isolated:
+                            method.move_to_results_directory(config["Results_dir"])
+                        new_method.run_verification(
+                            config["Results_dir"],
+                            **parse_verification_options(
+                                config, method.verification_time
+                            ),
+                        )
+                        verified_methods[code_key] = new_method
                 prompt.save_prompt()
                 prompt_length = prompt.get_prompt_length(
                     config["Model_parameters"]["Encoding"]
@@ -298,7 +372,10 @@ def process_method(
                     logger.info(f"Success with prompt {prompt_index} on try {i}")
                     success = True
 
-                method.move_to_results_directory(os.path.dirname(original_method_file))
+                if not isolated:
+                    method.move_to_results_directory(
+                        os.path.dirname(original_method_file)
+                    )
                 new_method.move_to_results_directory(config["Results_dir"])
                 store_results(
                     method,
@@ -341,19 +418,27 @@ def process_method(
                         f"Choose placeholder number: {placeholder_position} for {assertion}"
                     )
                     new_method, diff = insert_assertion(
-                        method_with_placeholder, method, response, i, config_prompt
+                        method_with_placeholder,
+                        method,
+                        response,
+                        i,
+                        config_prompt,
+                        candidates_directory,
                     )
-                    method.move_to_results_directory(config["Results_dir"])
+                    if not isolated:
+                        method.move_to_results_directory(config["Results_dir"])
                     new_method.run_verification(
-                        config["Results_dir"], config.get("Dafny_args", "")
+                        config["Results_dir"],
+                        **parse_verification_options(config, method.verification_time),
                     )
                     prompt.save_prompt()
                     prompt_length = prompt.get_prompt_length(
                         config["Model_parameters"]["Encoding"]
                     )
-                    method.move_to_results_directory(
-                        os.path.dirname(original_method_file)
-                    )
+                    if not isolated:
+                        method.move_to_results_directory(
+                            os.path.dirname(original_method_file)
+                        )
                     if new_method.verification_result == "Correct":
                         logger.info(f"Success with prompt {prompt_index} on try {i}")
                         success = True
@@ -410,26 +495,336 @@ def process_method(
     return success
 
 
-def setup_verification_environment(config, row, index=0):
-    original_filepath = row["Original Method File"]
-    tmp_original_file_location = shutil.move(
-        original_filepath,
-        os.path.join(config["Results_dir"], os.path.basename(original_filepath)),
+def shares_library_directory(config):
+    # the candidates would be in the directory matched by the --library glob
+    return not is_isolated(config) and extract_library_patterns(
+        config.get("Dafny_args", "")
     )
-    original_method_file = os.path.join(
-        os.path.dirname(original_filepath), os.path.basename(row["New Method File"])
+
+
+def verifies_candidates_together(config):
+    """
+    Whether all the candidates of a prompt are written before verifying them,
+    instead of writing and verifying them one at a time.
+    """
+    if get_verification_workers(config) > 1:
+        return True
+    return (
+        is_tiered(config)
+        or config.get("Resolve_candidates", False)
+        or config.get("Batch_candidates", False)
+    ) and not shares_library_directory(config)
+
+
+def get_verification_workers(config):
+    if not config.get("Parallel_verification", False):
+        return 1
+    if shares_library_directory(config):
+        logger.warning(
+            "Parallel verification with --library requires Isolated_workspaces"
+        )
+        return 1
+    return config.get(
+        "Verification_workers",
+        max(1, os.cpu_count() // extract_cores(config.get("Dafny_args", ""))),
     )
-    if row["New Method File"] != original_method_file:
-        shutil.copy(
-            row["New Method File"],
-            # os.path.join(config["Results_dir"], os.path.basename(row["New Method File"])),
-            original_method_file,
+
+
+def prepare_candidates(
+    new_prompts, method, method_with_placeholder, config_prompt, directory=None
+):
+    candidates = []
+    for i, prompt in enumerate(new_prompts, start=1):
+        try:
+            response_tuple = eval(prompt.get_latest_message()["content"])
+            assertion, placeholder_position = response_tuple
+            logger.info(
+                f"Try {i}: choose placeholder number: {placeholder_position} "
+                f"for {assertion}"
+            )
+            new_method, diff = insert_assertion(
+                method_with_placeholder,
+                method,
+                response_tuple,
+                i,
+                config_prompt,
+                directory,
+            )
+            candidates.append([new_method, diff, placeholder_position, None])
+        except Exception as e:
+            candidates.append([None, "", 0, e])
+    return candidates
+
+
+def resolve_candidates(candidates, method, config):
+    """
+    Parse and resolve the candidates without verifying them, with a single
+    Dafny run on the file of the method holding all of them. The ill-formed
+    ones get the Syntax_Error result and are not verified.
+    """
+    duplicates = find_duplicate_candidates(candidates)
+    new_methods = {
+        index: candidate[0]
+        for index, candidate in enumerate(candidates)
+        if candidate[3] is None and index not in duplicates
+    }
+    if not new_methods:
+        return
+    verification_options = parse_verification_options(config)
+    # the method is resolved with the candidates, if it does not resolve
+    # the Dafny arguments are to blame
+    batch, batch_method = write_batch(
+        method.get_file_content(), new_methods, "resolve_batch"
+    )
+    logger.info(f"Resolving {len(new_methods)} candidates of {method.method_name}")
+    try:
+        resolved = batch_method.run_resolution(
+            config["Results_dir"],
+            additionnal_args=verification_options["additionnal_args"],
+            backend=verification_options["backend"],
+            workspaces=verification_options["workspaces"],
         )
-    return (
-        Method(original_method_file, row["Original Method"], index=index),
-        tmp_original_file_location,
-        original_method_file,
+    finally:
+        batch_method.move_to_results_directory(config["Results_dir"])
+    if resolved:
+        return
+    records = batch.split_output(
+        batch_method.entire_error_message or "",
+        os.path.basename(batch_method.file_path),
+        {
+            index: os.path.basename(new_method.file_path)
+            for index, new_method in new_methods.items()
+        },
     )
+    if count_errors(records.pop(None)) or not any(records.values()):
+        logger.warning(f"{method.method_name} does not resolve, skipping the filter")
+        return
+    ill_formed = 0
+    for index, new_method in new_methods.items():
+        errors = count_errors(records[index])
+        if not errors:
+            continue
+        ill_formed += 1
+        new_method.record_error_output(
+            f"{join_records(records[index])}\n{errors} resolution/type errors "
+            f"detected in {os.path.basename(new_method.file_path)}\n",
+            config["Results_dir"],
+        )
+        new_method.record_syntax_error()
+    logger.info(f"{ill_formed}/{len(candidates)} candidates do not resolve")
+
+
+def write_batch(base_content, new_methods, suffix="batch"):
+    """
+    Write the candidates `new_methods`, indexed by their position, side by
+    side in a copy of `base_content` next to the first of them. Returns the
+    batch and the Method verifying or resolving it.
+    """
+    first_method = new_methods[min(new_methods)]
+    method_name = first_method.method_name
+    batch = CandidateBatch(
+        base_content,
+        method_name,
+        {
+            index: new_method.get_method_content(new_method.get_file_content())
+            for index, new_method in new_methods.items()
+        },
+    )
+    batch_path = batch_file_path(first_method.file_path, suffix)
+    batch.write(batch_path)
+    # the filter matches every candidate and not the method itself
+    batch_method = Method(
+        batch_path, candidate_name(method_name, ""), index=first_method.index
+    )
+    batch_method.location = first_method.get_location()
+    batch_method.excluded_files = first_method.excluded_files + [
+        new_method.file_path for new_method in new_methods.values()
+    ]
+    batch_method.log_name = os.path.splitext(os.path.basename(batch_path))[0]
+    return batch, batch_method
+
+
+def find_duplicate_candidates(candidates):
+    """
+    Map the index of every candidate that has the same code as an earlier
+    one to the index of that earlier candidate.
+    """
+    first_indexes = {}
+    duplicates = {}
+    for index, (new_method, _, _, error) in enumerate(candidates):
+        if error is not None:
+            continue
+        code_key = new_method.code_key()
+        if code_key in first_indexes:
+            duplicates[index] = first_indexes[code_key]
+        else:
+            first_indexes[code_key] = index
+    return duplicates
+
+
+def verify_candidates(candidates, config, baseline_time=None):
+    """
+    Verify the candidates concurrently. When a candidate is correct, the
+    verification of the following candidates is cancelled since they would
+    not have been tried sequentially.
+    In tiered mode the candidates are first verified with a short time limit
+    and only the ones that timed out are verified again with the full limit.
+    Duplicated candidates are verified once and share the results.
+    """
+    duplicates = find_duplicate_candidates(candidates)
+    if duplicates:
+        logger.info(f"{len(duplicates)}/{len(candidates)} duplicated candidates")
+    indexes = [index for index in range(len(candidates)) if index not in duplicates]
+    verify_unique_candidates(candidates, indexes, config, baseline_time)
+    for index, first_index in duplicates.items():
+        candidates[index][0].copy_verification_results(candidates[first_index][0])
+
+
+def verify_unique_candidates(candidates, indexes, config, baseline_time=None):
+    verification_options = parse_verification_options(config, baseline_time)
+    run = run_batch if config.get("Batch_candidates", False) else run_candidates
+    time_limit = get_short_time_limit(config, baseline_time)
+    if time_limit is None:
+        run(candidates, indexes, config, verification_options)
+        return
+
+    logger.info(f"Verifying the candidates with a {time_limit}s time limit first")
+    run(
+        candidates,
+        indexes,
+        config,
+        dict(
+            verification_options,
+            additionnal_args=set_verification_time_limit(
+                verification_options["additionnal_args"], time_limit
+            ),
+        ),
+    )
+    timed_out = timed_out_candidates(candidates, indexes)
+    if timed_out:
+        logger.info(f"Verifying {len(timed_out)} timed out candidates again")
+        run(candidates, timed_out, config, verification_options)
+
+
+def run_batch(candidates, indexes, config, verification_options):
+    """
+    Verify the candidates at `indexes` with a single Dafny run on a file
+    holding all of them, then give each candidate its own results. The
+    candidates are verified one by one if the batch cannot be verified or
+    if its output cannot be split between them.
+    """
+    indexes = [
+        index
+        for index in indexes
+        if candidates[index][3] is None
+        # rejected by resolve_candidates
+        and candidates[index][0].verification_result != "Syntax_Error"
+    ]
+    recursive = [
+        index
+        for index in indexes
+        if is_recursive(
+            candidates[index][0].get_file_content(), candidates[index][0].method_name
+        )
+    ]
+    if recursive:
+        logger.info(f"Verifying {len(recursive)} recursive candidates on their own")
+        run_candidates(candidates, recursive, config, verification_options)
+        indexes = [index for index in indexes if index not in recursive]
+    if len(indexes) < 2:
+        run_candidates(candidates, indexes, config, verification_options)
+        return
+    new_methods = {index: candidates[index][0] for index in indexes}
+    method_name = new_methods[indexes[0]].method_name
+    batch, batch_method = write_batch(
+        new_methods[indexes[0]].get_file_content(), new_methods
+    )
+    batch_path = batch_method.file_path
+    # the candidates share the cores of one Dafny run
+    rounds = math.ceil(
+        len(indexes) / extract_cores(verification_options["additionnal_args"])
+    )
+    logger.info(f"Verifying {len(indexes)} candidates of {method_name} in one run")
+    batch_options = dict(
+        verification_options, timeout=verification_options["timeout"] * rounds
+    )
+    try:
+        batch_method.run_verification(config["Results_dir"], **batch_options)
+    finally:
+        batch_method.move_to_results_directory(config["Results_dir"])
+    if not batch_method.verification_outcome:
+        logger.warning(
+            f"Batch verification failed ({batch_method.verification_result}), "
+            "verifying the candidates one by one"
+        )
+        run_candidates(candidates, indexes, config, verification_options)
+        return
+
+    records = batch.split_output(
+        batch_method.entire_error_message or "",
+        os.path.basename(batch_path),
+        {
+            index: os.path.basename(new_method.file_path)
+            for index, new_method in new_methods.items()
+        },
+    )
+    if count_errors(records[None]):
+        logger.warning(
+            "Batch verification reported errors outside the candidates, "
+            "verifying the candidates one by one"
+        )
+        run_candidates(candidates, indexes, config, verification_options)
+        return
+    # the candidates are declared next to the method, in its modules and classes
+    qualified_names = {
+        qualified_name.rpartition(".")[2]: qualified_name
+        for qualified_name in extract_qualified_method_and_lemma_names(batch.content)
+    }
+    for index, new_method in new_methods.items():
+        name = candidate_name(method_name, index)
+        new_method.verification_outcome = batch_method.outcomes_of(
+            qualified_names.get(name, name)
+        )
+        new_method.dafny_log_file = batch_method.dafny_log_file
+        new_method.record_verification_outcome()
+        if records[index]:
+            verified = sum(
+                1
+                for outcome in new_method.verification_outcome
+                if outcome.overall_outcome == "Correct"
+            )
+            new_method.record_error_output(
+                records_output(records[index], verified), config["Results_dir"]
+            )
+
+
+def run_candidates(candidates, indexes, config, verification_options):
+    indexes = list(indexes)
+    cancel_events = {index: threading.Event() for index in indexes}
+
+    def verify(index):
+        new_method, _, _, error = candidates[index]
+        if error is not None or cancel_events[index].is_set():
+            return
+        # rejected by resolve_candidates
+        if new_method.verification_result == "Syntax_Error":
+            return
+        try:
+            new_method.run_verification(
+                config["Results_dir"],
+                cancel_event=cancel_events[index],
+                **verification_options,
+            )
+        except Exception as e:
+            candidates[index][3] = e
+            return
+        if new_method.verification_result == "Correct":
+            for later_index in indexes:
+                if later_index > index:
+                    cancel_events[later_index].set()
+
+    with ThreadPoolExecutor(max_workers=get_verification_workers(config)) as pool:
+        list(pool.map(verify, indexes))
 
 
 def get_new_method_content(fix_prompt, method_name):
@@ -440,10 +835,6 @@ def get_new_method_content(fix_prompt, method_name):
     return new_method_content
 
 
-def cleanup_environment(tmp_original_file_location, original_file_path):
-    shutil.copy(tmp_original_file_location, original_file_path)
-
-
 def store_results(
     method,
     new_method,
@@ -100,6 +100,8 @@ class Llm_prompt:
         threshold,
         dafny_args,
         original_method_file,
+        placeholder_cache=None,
+        placeholder_daemon=True,
     ):
         with open(program_to_fix, "r") as f:
             content = f.read()
@@ -152,6 +154,8 @@ class Llm_prompt:
                     optional_files=library_files,
                     original_method_file=original_method_file,
                     multiple_locations=multiple_locations,
+                    cache=placeholder_cache,
+                    use_daemon=placeholder_daemon,
                 )
             else:
                 method_to_insert = insert_assertion_location(
@@ -159,6 +163,8 @@ class Llm_prompt:
                     program_to_fix,
                     method_name,
                     multiple_locations=multiple_locations,
+                    cache=placeholder_cache,
+                    use_daemon=placeholder_daemon,
                 )
         fix_prompt = config_prompt["Fix_prompt"]
         method_to_insert = replace_and_extract_method_with_line_numbers(
@@ -0,0 +1,72 @@
+def ddmin(items, test):
+    """
+    Delta debugging: return a 1-minimal subset of `items` for which `test`
+    holds, assuming it holds for `items`. Subsets are tried by halves first,
+    so when most items are unnecessary the number of tests is logarithmic.
+    """
+    results = {}
+
+    def cached_test(subset):
+        key = tuple(subset)
+        if key not in results:
+            results[key] = test(list(subset))
+        return results[key]
+
+    items = list(items)
+    if cached_test([]):
+        return []
+    granularity = 2
+    while len(items) >= 2:
+        chunks = split(items, granularity)
+        reduced = False
+        for chunk in chunks:
+            if cached_test(chunk):
+                items = chunk
+                granularity = 2
+                reduced = True
+                break
+        if not reduced and granularity > 2:
+            for chunk in chunks:
+                complement = [item for item in items if item not in chunk]
+                if cached_test(complement):
+                    items = complement
+                    granularity = max(granularity - 1, 2)
+                    reduced = True
+                    break
+        if not reduced:
+            if granularity >= len(items):
+                break
+            granularity = min(len(items), granularity * 2)
+    return items
+
+
+def split(items, parts):
+    size, remainder = divmod(len(items), parts)
+    chunks = []
+    start = 0
+    for part in range(parts):
+        end = start + size + (1 if part < remainder else 0)
+        chunks.append(items[start:end])
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+
+def remove_assertions_at(method_content, assertions, positions):
+    """
+    Remove the assertions at `positions` (indexes in `assertions`, in the
+    order extract_assertions returned them) from `method_content`.
+    """
+    positions = set(positions)
+    kept_content = []
+    cursor = 0
+    for position, assertion in enumerate(assertions):
+        start = method_content.index(assertion, cursor)
+        end = start + len(assertion)
+        if position in positions:
+            kept_content.append(method_content[cursor:start])
+            cursor = end
+        else:
+            kept_content.append(method_content[cursor:end])
+            cursor = end
+    kept_content.append(method_content[cursor:])
+    return "".join(kept_content)
@@ -5,6 +5,7 @@ using System.Diagnostics.Contracts;
 using System.IO;
 using System.Linq;
 using System.Runtime.CompilerServices;
+using System.Security.Cryptography;
 using System.Text;
 using System.Text.Json;
 using System.Text.RegularExpressions;
@@ -467,6 +468,86 @@ namespace placeholder
         }
     }
 
+    public class PlaceholderRequest
+    {
+        public string ErrorMessage { get; set; }
+        public string MethodFile { get; set; }
+        public string MethodName { get; set; }
+        public bool MultipleLocations { get; set; }
+        public string AdditionalInclude { get; set; }
+        public string BlacklistedFile { get; set; }
+    }
+
+    public class PlaceholderResponse
+    {
+        // the method with the placeholders, null when it could not be found
+        public string Output { get; set; }
+        public string Log { get; set; }
+        public string Error { get; set; }
+    }
+
+    // Parser keeping the parsed library files between requests, keyed by
+    // their path and the digest of their content: only the method file and
+    // the library files that changed are parsed again. Every program gets
+    // its own copy of the declarations, which the resolver modifies.
+    class LibraryCachingParser : ProgramParser
+    {
+        readonly Dictionary<string, Tuple<string, DfyParseResult>> parsedLibraries =
+            new Dictionary<string, Tuple<string, DfyParseResult>>();
+
+        // the file being fixed, which is never cached
+        public Uri MethodUri { get; set; }
+
+        static string Digest(string content)
+        {
+            using (var sha256 = SHA256.Create())
+            {
+                return Convert.ToHexString(sha256.ComputeHash(Encoding.UTF8.GetBytes(content)));
+            }
+        }
+
+        protected override DfyParseResult ParseFile(
+            DafnyOptions options,
+            Func<TextReader> getReader,
+            Uri uri,
+            CancellationToken cancellationToken
+        )
+        {
+            if (uri == MethodUri)
+            {
+                return base.ParseFile(options, getReader, uri, cancellationToken);
+            }
+            string content;
+            using (var reader = getReader())
+            {
+                content = reader.ReadToEnd();
+            }
+            var digest = Digest(content);
+            if (
+                !parsedLibraries.TryGetValue(uri.LocalPath, out var cached)
+                || cached.Item1 != digest
+            )
+            {
+                var result = base.ParseFile(
+                    options,
+                    () => new StringReader(content),
+                    uri,
+                    cancellationToken
+                );
+                cached = Tuple.Create(digest, result);
+                if (result.ErrorReporter.ErrorCount == 0)
+                {
+                    parsedLibraries[uri.LocalPath] = cached;
+                }
+            }
+            var cloner = new Cloner(true, false);
+            return cached.Item2 with
+            {
+                Module = new FileModuleDefinition(cloner, cached.Item2.Module)
+            };
+        }
+    }
+
     class MainReturnValTest
     {
         public static Declaration FindMethodByName(Program program, string declarationName)
@@ -658,6 +739,26 @@ namespace placeholder
             return lines;
         }
 
+        // Contents of the files read so far, read again when they change
+        static readonly Dictionary<string, Tuple<DateTime, long, string>> fileContents =
+            new Dictionary<string, Tuple<DateTime, long, string>>();
+
+        public static string ReadFileCached(string path)
+        {
+            var info = new FileInfo(path);
+            if (
+                fileContents.TryGetValue(path, out var cached)
+                && cached.Item1 == info.LastWriteTimeUtc
+                && cached.Item2 == info.Length
+            )
+            {
+                return cached.Item3;
+            }
+            var content = File.ReadAllText(path);
+            fileContents[path] = Tuple.Create(info.LastWriteTimeUtc, info.Length, content);
+            return content;
+        }
+
         public static Dictionary<Uri, string> AddFilesToFs(
             string methodFile,
             string additionalFilesDir = "",
@@ -666,7 +767,7 @@ namespace placeholder
         {
             var fileDictionary = new Dictionary<Uri, string>();
 
-            var fileContent = File.ReadAllText(methodFile);
+            var fileContent = ReadFileCached(methodFile);
             var baseMethodUri = new Uri("transcript:///" + methodFile);
             fileDictionary.Add(baseMethodUri, fileContent);
 
@@ -699,7 +800,7 @@ namespace placeholder
                         continue;
                     }
 
-                    fileContent = File.ReadAllText(fileInclude);
+                    fileContent = ReadFileCached(fileInclude);
                     var fileUri = new Uri("transcript:///" + fileInclude);
 
                     if (!fileDictionary.ContainsKey(fileUri))
@@ -712,47 +813,49 @@ namespace placeholder
             return fileDictionary;
         }
 
-        static int Main(string[] args)
+        // Resolved programs of the last requests, the most recent last. A
+        // program is reused when it was built from the same files; otherwise
+        // only the method file and the changed library files are parsed.
+        const int ProgramCacheSize = 4;
+        static readonly LibraryCachingParser parser = new LibraryCachingParser();
+        static readonly List<Tuple<Dictionary<Uri, string>, Program>> resolvedPrograms =
+            new List<Tuple<Dictionary<Uri, string>, Program>>();
+
+        static bool SameFiles(Dictionary<Uri, string> files, Dictionary<Uri, string> otherFiles)
         {
-            TextWriter output = Console.Error;
-            DafnyOptions options = DafnyOptions.Create(output);
-            BatchErrorReporter errorReporter = new BatchErrorReporter(options);
-            var methodFile = "";
-            var methodName = "";
-            bool multiple_location = false;
-            var additionnalInclude = "";
-            var blacklistedFile = "";
-            if (args.Length < 2)
+            if (files.Count != otherFiles.Count)
             {
-                Console.WriteLine(
-                    "Usage: Program <method_file> <method_name> [multiple_location] [additional_include] [blacklisted_file]"
-                );
-                return 0;
+                return false;
             }
-            else
+            foreach (var file in files)
             {
-                methodFile = args[0];
-                methodName = args[1];
-                multiple_location = args.Length > 2 ? bool.Parse(args[2]) : false; // default value is false
-                additionnalInclude = args.Length > 3 ? args[3] : null; // default value is null
-                blacklistedFile = args.Length > 4 ? args[4] : null; // default value is null
+                // unchanged files are the same cached strings
+                if (!otherFiles.TryGetValue(file.Key, out var content) || !string.Equals(content, file.Value))
+                {
+                    return false;
+                }
             }
+            return true;
+        }
 
-            string input;
-            input = Console.In.ReadToEnd();
-            if (!Path.IsPathRooted(methodFile))
+        static Program ResolveProgram(
+            string methodFile,
+            Dictionary<Uri, string> filesDict,
+            BatchErrorReporter reporter,
+            TextWriter log
+        )
+        {
+            for (int i = 0; i < resolvedPrograms.Count; i++)
             {
-                methodFile = Path.GetFullPath(methodFile);
+                if (SameFiles(resolvedPrograms[i].Item1, filesDict))
+                {
+                    var cached = resolvedPrograms[i];
+                    resolvedPrograms.RemoveAt(i);
+                    resolvedPrograms.Add(cached);
+                    return cached.Item2;
+                }
             }
 
-            // Create a URI from the file name
-            var uri = new Uri("transcript:///" + methodFile);
-
-            // Initialize an error reporter to report errors to the console
-            var reporter = new ConsoleErrorReporter(options);
-
-            var filesDict = AddFilesToFs(methodFile, additionnalInclude, blacklistedFile);
-
             var files = new List<DafnyFile>();
             var fs = new InMemoryFileSystem(filesDict);
             foreach (var dafnyElement in filesDict)
@@ -766,7 +869,8 @@ namespace placeholder
                 );
                 files.Add(dafnyFile);
             }
-            var program = new ProgramParser().ParseFiles(
+            parser.MethodUri = new Uri("transcript:///" + methodFile);
+            var program = parser.ParseFiles(
                 methodFile,
                 files,
                 reporter,
@@ -781,12 +885,49 @@ namespace placeholder
 
             if (!success)
             {
-                Console.WriteLine("Error reporter: " + reporter.ErrorCount);
+                log.WriteLine("Error reporter: " + reporter.ErrorCount);
                 foreach (var message in reporter.AllMessages)
                 {
                     throw new Exception("Error parsing or reporting method file: " + message);
                 }
-                return 1;
+                return null;
+            }
+
+            resolvedPrograms.Add(Tuple.Create(filesDict, program));
+            if (resolvedPrograms.Count > ProgramCacheSize)
+            {
+                resolvedPrograms.RemoveAt(0);
+            }
+            return program;
+        }
+
+        // Return the method with the placeholders, or null if the program
+        // does not resolve. Messages are written to `log`.
+        public static string Run(
+            string input,
+            string methodFile,
+            string methodName,
+            bool multiple_location,
+            string additionnalInclude,
+            string blacklistedFile,
+            BatchErrorReporter reporter,
+            TextWriter log
+        )
+        {
+            if (!Path.IsPathRooted(methodFile))
+            {
+                methodFile = Path.GetFullPath(methodFile);
+            }
+
+            // Create a URI from the file name
+            var uri = new Uri("transcript:///" + methodFile);
+
+            var filesDict = AddFilesToFs(methodFile, additionnalInclude, blacklistedFile);
+
+            var program = ResolveProgram(methodFile, filesDict, reporter, log);
+            if (program == null)
+            {
+                return null;
             }
 
             var declaration = FindMethodByName(program, methodName);
@@ -865,7 +1006,99 @@ namespace placeholder
 
             // Extract the method
             var method_lines = file_lines.ToArray()[(method_start_line - 1)..(method_end_line)];
-            Console.WriteLine(string.Join("\n", method_lines));
+            return string.Join("\n", method_lines);
+        }
+
+        // Long-lived mode: reads one JSON request per line on stdin and
+        // answers with one JSON response per line on stdout.
+        static int Serve(DafnyOptions options)
+        {
+            var protocol = new StreamWriter(Console.OpenStandardOutput()) { AutoFlush = true };
+            Console.SetOut(Console.Error);
+
+            string line;
+            while ((line = Console.In.ReadLine()) != null)
+            {
+                if (string.IsNullOrWhiteSpace(line))
+                {
+                    continue;
+                }
+                var response = new PlaceholderResponse();
+                var log = new StringWriter();
+                try
+                {
+                    var request = JsonSerializer.Deserialize<PlaceholderRequest>(line);
+                    response.Output = Run(
+                        request.ErrorMessage,
+                        request.MethodFile,
+                        request.MethodName,
+                        request.MultipleLocations,
+                        request.AdditionalInclude,
+                        request.BlacklistedFile,
+                        // errors of a request are not reported with the next ones
+                        new BatchErrorReporter(options),
+                        log
+                    );
+                }
+                catch (Exception e)
+                {
+                    response.Error = e.ToString();
+                }
+                response.Log = log.ToString();
+                protocol.WriteLine(JsonSerializer.Serialize(response));
+            }
+            return 0;
+        }
+
+        static int Main(string[] args)
+        {
+            TextWriter output = Console.Error;
+            DafnyOptions options = DafnyOptions.Create(output);
+            var methodFile = "";
+            var methodName = "";
+            bool multiple_location = false;
+            var additionnalInclude = "";
+            var blacklistedFile = "";
+            if (args.Length == 1 && args[0] == "--daemon")
+            {
+                return Serve(options);
+            }
+            if (args.Length < 2)
+            {
+                Console.WriteLine(
+                    "Usage: Program <method_file> <method_name> [multiple_location] [additional_include] [blacklisted_file]\n"
+                    + "       Program --daemon"
+                );
+                return 0;
+            }
+            else
+            {
+                methodFile = args[0];
+                methodName = args[1];
+                multiple_location = args.Length > 2 ? bool.Parse(args[2]) : false; // default value is false
+                additionnalInclude = args.Length > 3 ? args[3] : null; // default value is null
+                blacklistedFile = args.Length > 4 ? args[4] : null; // default value is null
+            }
+
+            string input;
+            input = Console.In.ReadToEnd();
+
+            var method_with_placeholder = Run(
+                input,
+                methodFile,
+                methodName,
+                multiple_location,
+                additionnalInclude,
+                blacklistedFile,
+                // report the errors to the console
+                new ConsoleErrorReporter(options),
+                Console.Out
+            );
+            if (method_with_placeholder == null)
+            {
+                return 1;
+            }
+            Console.WriteLine(method_with_placeholder);
 
             return 0;
         }
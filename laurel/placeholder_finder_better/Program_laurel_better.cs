@@ -506,6 +506,24 @@ namespace placeholder
         }
     }
 
+    public class PlaceholderRequest
+    {
+        public string ErrorMessage { get; set; }
+        public string MethodFile { get; set; }
+        public string MethodName { get; set; }
+        public bool MultipleLocations { get; set; }
+        public string AdditionalInclude { get; set; }
+        public string BlacklistedFile { get; set; }
+    }
+
+    public class PlaceholderResponse
+    {
+        // the method with the placeholders, null when it could not be found
+        public string Output { get; set; }
+        public string Log { get; set; }
+        public string Error { get; set; }
+    }
+
     class MainReturnValTest
     {
         public static Declaration FindMethodByName(Program program, string declarationName)
@@ -786,6 +804,26 @@ namespace placeholder
             return lines;
         }
 
+        // Contents of the files read so far, read again when they change
+        static readonly Dictionary<string, Tuple<DateTime, long, string>> fileContents =
+            new Dictionary<string, Tuple<DateTime, long, string>>();
+
+        public static string ReadFileCached(string path)
+        {
+            var info = new FileInfo(path);
+            if (
+                fileContents.TryGetValue(path, out var cached)
+                && cached.Item1 == info.LastWriteTimeUtc
+                && cached.Item2 == info.Length
+            )
+            {
+                return cached.Item3;
+            }
+            var content = File.ReadAllText(path);
+            fileContents[path] = Tuple.Create(info.LastWriteTimeUtc, info.Length, content);
+            return content;
+        }
+
         public static Dictionary<Uri, string> AddFilesToFs(
             string methodFile,
             string additionalFilesDir = "",
@@ -794,7 +832,7 @@ namespace placeholder
         {
             var fileDictionary = new Dictionary<Uri, string>();
 
-            var fileContent = File.ReadAllText(methodFile);
+            var fileContent = ReadFileCached(methodFile);
             var baseMethodUri = new Uri("transcript:///" + methodFile);
             fileDictionary.Add(baseMethodUri, fileContent);
 
@@ -827,7 +865,7 @@ namespace placeholder
                         continue;
                     }
 
-                    fileContent = File.ReadAllText(fileInclude);
+                    fileContent = ReadFileCached(fileInclude);
                     var fileUri = new Uri("transcript:///" + fileInclude);
 
                     if (!fileDictionary.ContainsKey(fileUri))
@@ -840,47 +878,50 @@ namespace placeholder
             return fileDictionary;
         }
 
-        static int Main(string[] args)
+        // Resolved programs of the last requests, the most recent last. A
+        // program is reused when it was built from the same files.
+        const int ProgramCacheSize = 4;
+        static readonly List<Tuple<Dictionary<Uri, string>, Program>> resolvedPrograms =
+            new List<Tuple<Dictionary<Uri, string>, Program>>();
+
+        static bool SameFiles(Dictionary<Uri, string> files, Dictionary<Uri, string> otherFiles)
         {
-            TextWriter output = Console.Error;
-            DafnyOptions options = DafnyOptions.Create(output);
-            BatchErrorReporter errorReporter = new BatchErrorReporter(options);
-            var methodFile = "";
-            var methodName = "";
-            bool multiple_location = false;
-            var additionnalInclude = "";
-            var blacklistedFile = "";
-            if (args.Length < 2)
+            if (files.Count != otherFiles.Count)
             {
-                Console.WriteLine(
-                    "Usage: Program <method_file> <method_name> [multiple_location] [additional_include] [blacklisted_file]"
-                );
-                return 0;
+                return false;
             }
-            else
+            foreach (var file in files)
             {
-                methodFile = args[0];
-                methodName = args[1];
-                multiple_location = args.Length > 2 ? bool.Parse(args[2]) : false; // default value is false
-                additionnalInclude = args.Length > 3 ? args[3] : null; // default value is null
-                blacklistedFile = args.Length > 4 ? args[4] : null; // default value is null
+                // unchanged files are the same cached strings
+                if (!otherFiles.TryGetValue(file.Key, out var content) || !string.Equals(content, file.Value))
+                {
+                    return false;
+                }
             }
+            return true;
+        }
 
-            string input;
-            input = Console.In.ReadToEnd();
-            if (!Path.IsPathRooted(methodFile))
+        static Program ResolveProgram(
+            string methodFile,
+            Dictionary<Uri, string> filesDict,
+            DafnyOptions options,
+            TextWriter log
+        )
+        {
+            for (int i = 0; i < resolvedPrograms.Count; i++)
             {
-                methodFile = Path.GetFullPath(methodFile);
+                if (SameFiles(resolvedPrograms[i].Item1, filesDict))
+                {
+                    var cached = resolvedPrograms[i];
+                    resolvedPrograms.RemoveAt(i);
+                    resolvedPrograms.Add(cached);
+                    return cached.Item2;
+                }
             }
 
-            // Create a URI from the file name
-            var uri = new Uri("transcript:///" + methodFile);
-
             // Initialize an error reporter to report errors to the console
             var reporter = new ConsoleErrorReporter(options);
 
-            var filesDict = AddFilesToFs(methodFile, additionnalInclude, blacklistedFile);
-
             var files = new List<DafnyFile>();
             var fs = new InMemoryFileSystem(filesDict);
             foreach (var dafnyElement in filesDict)
@@ -909,12 +950,49 @@ namespace placeholder
 
             if (!success)
             {
-                Console.WriteLine("Error reporter: " + reporter.ErrorCount);
+                log.WriteLine("Error reporter: " + reporter.ErrorCount);
                 foreach (var message in reporter.AllMessages)
                 {
                     throw new Exception("Error parsing or reporting method file: " + message);
                 }
-                return 1;
+                return null;
+            }
+
+            resolvedPrograms.Add(Tuple.Create(filesDict, program));
+            if (resolvedPrograms.Count > ProgramCacheSize)
+            {
+                resolvedPrograms.RemoveAt(0);
+            }
+            return program;
+        }
+
+        // Return the method with the placeholders, or null if the program
+        // does not resolve. Messages are written to `log`.
+        public static string Run(
+            string input,
+            string methodFile,
+            string methodName,
+            bool multiple_location,
+            string additionnalInclude,
+            string blacklistedFile,
+            DafnyOptions options,
+            TextWriter log
+        )
+        {
+            if (!Path.IsPathRooted(methodFile))
+            {
+                methodFile = Path.GetFullPath(methodFile);
+            }
+
+            // Create a URI from the file name
+            var uri = new Uri("transcript:///" + methodFile);
+
+            var filesDict = AddFilesToFs(methodFile, additionnalInclude, blacklistedFile);
+
+            var program = ResolveProgram(methodFile, filesDict, options, log);
+            if (program == null)
+            {
+                return null;
             }
 
             var declaration = FindMethodByName(program, methodName);
@@ -993,7 +1071,98 @@ namespace placeholder
 
             // Extract the method
             var method_lines = file_lines.ToArray()[(method_start_line - 1)..(method_end_line)];
-            Console.WriteLine(string.Join("\n", method_lines));
+            return string.Join("\n", method_lines);
+        }
+
+        // Long-lived mode: reads one JSON request per line on stdin and
+        // answers with one JSON response per line on stdout.
+        static int Serve(DafnyOptions options)
+        {
+            var protocol = new StreamWriter(Console.OpenStandardOutput()) { AutoFlush = true };
+            Console.SetOut(Console.Error);
+
+            string line;
+            while ((line = Console.In.ReadLine()) != null)
+            {
+                if (string.IsNullOrWhiteSpace(line))
+                {
+                    continue;
+                }
+                var response = new PlaceholderResponse();
+                var log = new StringWriter();
+                try
+                {
+                    var request = JsonSerializer.Deserialize<PlaceholderRequest>(line);
+                    response.Output = Run(
+                        request.ErrorMessage,
+                        request.MethodFile,
+                        request.MethodName,
+                        request.MultipleLocations,
+                        request.AdditionalInclude,
+                        request.BlacklistedFile,
+                        options,
+                        log
+                    );
+                }
+                catch (Exception e)
+                {
+                    response.Error = e.ToString();
+                }
+                response.Log = log.ToString();
+                protocol.WriteLine(JsonSerializer.Serialize(response));
+            }
+            return 0;
+        }
+
+        static int Main(string[] args)
+        {
+            TextWriter output = Console.Error;
+            DafnyOptions options = DafnyOptions.Create(output);
+            BatchErrorReporter errorReporter = new BatchErrorReporter(options);
+            var methodFile = "";
+            var methodName = "";
+            bool multiple_location = false;
+            var additionnalInclude = "";
+            var blacklistedFile = "";
+            if (args.Length == 1 && args[0] == "--daemon")
+            {
+                return Serve(options);
+            }
+            if (args.Length < 2)
+            {
+                Console.WriteLine(
+                    "Usage: Program <method_file> <method_name> [multiple_location] [additional_include] [blacklisted_file]\n"
+                    + "       Program --daemon"
+                );
+                return 0;
+            }
+            else
+            {
+                methodFile = args[0];
+                methodName = args[1];
+                multiple_location = args.Length > 2 ? bool.Parse(args[2]) : false; // default value is false
+                additionnalInclude = args.Length > 3 ? args[3] : null; // default value is null
+                blacklistedFile = args.Length > 4 ? args[4] : null; // default value is null
+            }
+
+            string input;
+            input = Console.In.ReadToEnd();
+
+            var method_with_placeholder = Run(
+                input,
+                methodFile,
+                methodName,
+                multiple_location,
+                additionnalInclude,
+                blacklistedFile,
+                options,
+                Console.Out
+            );
+            if (method_with_placeholder == null)
+            {
+                return 1;
+            }
+            Console.WriteLine(method_with_placeholder);
 
             return 0;
         }
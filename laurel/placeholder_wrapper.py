@@ -1,6 +1,13 @@
+import atexit
+import functools
+import json
 import logging
 import subprocess
 import os
+import threading
+
+from disk_cache import file_digest
+
 # ricostynha modified dotnet version
 # before PLACEHOLDER_CSHARP_PATH = "placeholder_finder/bin/Debug/net6.0/placeholder_finder"
 # after
@@ -10,6 +17,85 @@ PLACEHOLDER_LAUREL_BETTER_CSHARP_PATH = "placeholder_finder_better/bin/Debug/net
 logger = logging.getLogger(__name__)
 
 
+class PlaceholderFinderError(Exception):
+    pass
+
+
+class PlaceholderFinderDaemon:
+    """
+    A long-running placeholder finder answering one request per line. It
+    keeps the parsed library files and the last programs it resolved in
+    memory, so the libraries are not parsed again for every prompt. The
+    `Placeholder_daemon: False` option runs the finder once per call instead.
+    """
+
+    def __init__(self, executable):
+        self.executable = executable
+        self.process = None
+        # an old build without the daemon mode exits before answering
+        self.answered = False
+        self.disabled = False
+        self.lock = threading.Lock()
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            [self.executable, "--daemon"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+
+    def find(self, request):
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+            try:
+                self.process.stdin.write(json.dumps(request) + "\n")
+                self.process.stdin.flush()
+                response = json.loads(self.process.stdout.readline())
+            except (OSError, ValueError) as e:
+                self.close()
+                self.disabled = not self.answered
+                raise PlaceholderFinderError(f"Placeholder finder daemon failed: {e}")
+            self.answered = True
+            return response
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+def placeholder_executable(use_laurel_better=False):
+    if use_laurel_better:
+        return os.path.join(
+            os.path.dirname(__file__), PLACEHOLDER_LAUREL_BETTER_CSHARP_PATH
+        )
+    return os.path.join(os.path.dirname(__file__), PLACEHOLDER_LAUREL_CSHARP_PATH)
+
+
+def placeholder_finder_digests(executable):
+    """
+    Digests of a build of the placeholder finder: its launcher and the
+    assembly next to it, which holds the code of the finder.
+    """
+    return [
+        (path, file_digest(path))
+        for path in (executable, f"{executable}.dll")
+        if os.path.exists(path)
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def open_placeholder_daemon(executable):
+    logger.info(f"Starting the placeholder finder daemon {executable}")
+    daemon = PlaceholderFinderDaemon(executable)
+    atexit.register(daemon.close)
+    return daemon
+
+
 def call_placeholder_finder(
     error_message,
     method_file,
@@ -18,21 +104,42 @@ def call_placeholder_finder(
     optional_files=None,
     blacklisted_file=None,
     multiple_locations=False,
+    use_daemon=True,
 ):
-    if(use_laurel_better):
-        placeholder_path_exec = PLACEHOLDER_LAUREL_BETTER_CSHARP_PATH 
-    else:
-        placeholder_path_exec = PLACEHOLDER_LAUREL_CSHARP_PATH 
-
-    command = [
-        os.path.join(os.path.dirname(__file__), placeholder_path_exec),
-        method_file,
-        method_name,
-        str(multiple_locations),
-    ]
+    executable = placeholder_executable(use_laurel_better)
     if optional_files:
         if not os.path.isabs(optional_files):
             optional_files = os.path.abspath(os.path.normpath(optional_files))
+    arguments = (
+        f"Arguments were: method_file={method_file}, method_name={method_name}, "
+        f"optional_files={optional_files}, blacklisted_file={blacklisted_file}"
+    )
+    daemon = open_placeholder_daemon(executable) if use_daemon else None
+    if daemon is not None and not daemon.disabled:
+        try:
+            response = daemon.find(
+                {
+                    "ErrorMessage": error_message,
+                    "MethodFile": method_file,
+                    "MethodName": method_name,
+                    "MultipleLocations": multiple_locations,
+                    "AdditionalInclude": optional_files or None,
+                    "BlacklistedFile": blacklisted_file or None,
+                }
+            )
+        except PlaceholderFinderError as e:
+            logger.warning(f"{e}, running the placeholder finder once")
+        else:
+            if response["Error"] or response["Output"] is None:
+                error = response["Log"] or ""
+                error += f"Error in call_placeholder_finder: {response['Error']}"
+                error += arguments
+                print(error)
+                return "", error
+            return response["Output"].strip(), ""
+
+    command = [executable, method_file, method_name, str(multiple_locations)]
+    if optional_files:
         command.append(optional_files)
     if blacklisted_file:
         command.append(blacklisted_file)
@@ -53,14 +160,14 @@ def call_placeholder_finder(
         # after 
         error = e.stdout
         error += f"Error in call_placeholder_finder: {str(e.stderr)}"
-        error +=  f"Arguments were: method_file={method_file}, method_name={method_name}, optional_files={optional_files}, blacklisted_file={blacklisted_file}"
+        error += arguments
         print(error)
         return "", error   
 
     except Exception as e:
         # general fallback for any other exception
         error = f"Unexpected error: {str(e)}"
-        error +=  f"Arguments were: method_file={method_file}, method_name={method_name}, optional_files={optional_files}, blacklisted_file={blacklisted_file}"
+        error += arguments
         print(error)
         return "", error
     
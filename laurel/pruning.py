@@ -2,15 +2,25 @@ import logging
 import os
 import time
 import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 from dafny_utils import (
     extract_assertions,
     extract_method_and_lemma_names,
+    extract_qualified_method_and_lemma_names,
     count_dfy_files,
     get_dfy_files,
 )
-from utils import write_csv_header
-from config_parsing import parse_config_assert_pruning
+from batching import iter_records, records_output
+from utils import write_csv_header, write_minimization_csv_header
+from checkpoint import assertion_key, open_checkpoint
+from disk_cache import hash_key
+from minimization import ddmin, remove_assertions_at
+from config_parsing import (
+    is_isolated,
+    parse_config_assert_pruning,
+    parse_verification_options,
+)
 
 from Method import Method
 
@@ -26,14 +36,38 @@ def remove_assertions(config_file):
     total_files = count_dfy_files(project_path)
     file_counter = 0
     start_time = time.time()
-    assertion_index = [0]
+    checkpoint = open_checkpoint(config)
+    assertion_index = [checkpoint.last_index()]
 
     stats = []
-    csv_writer = write_csv_header(stats_file)
+    # a run that does not resume starts the stats over with the checkpoint
+    resume = config.get("Resume", True)
+    csv_writer = write_csv_header(stats_file, resume)
+    minimization_writer = None
+    if is_minimizing(config):
+        minimization_writer = write_minimization_csv_header(
+            config.get("Minimization_file", f"{stats_file}.minimal.csv"), resume
+        )
+
+    if config.get("Pruning_workers", 1) > 1:
+        remove_assertions_in_parallel(
+            config,
+            csv_writer,
+            stats,
+            assertion_index,
+            checkpoint,
+            minimization_writer,
+        )
+        checkpoint.close()
+        logger.debug(f"Elapsed time: {time.time() - start_time}")
+        return
 
     for file_path in get_dfy_files(project_path):
         file_counter += 1
         file_location = os.path.dirname(file_path)
+        if not has_pending_assertions(file_path, checkpoint, is_minimizing(config)):
+            logger.info(f"Skipping completed file {file_counter}/{total_files}")
+            continue
         logger.info(f"Starting file {file_counter}/{total_files}:{file_path}")
 
         try:
@@ -45,6 +79,8 @@ def remove_assertions(config_file):
                 csv_writer,
                 stats,
                 assertion_index,
+                checkpoint,
+                minimization_writer,
             )
         except Exception as e:
             traceback_str = traceback.format_exc()
@@ -55,10 +91,242 @@ def remove_assertions(config_file):
             f"==== Finished file {file_path} {file_counter}/{total_files} ====="
         )
         logger.debug(f"Elapsed time: {elapsed_time}")
+    checkpoint.close()
+
+
+def is_minimizing(config):
+    return config.get("Pruning_mode", "single") == "ddmin"
+
+
+def has_pending_assertions(file_path, checkpoint, minimizing=False):
+    try:
+        with open(file_path) as file:
+            content = file.read()
+        for method_name in extract_method_and_lemma_names(content):
+            method = Method(file_path, method_name)
+            assertions = extract_assertions(method.get_method_content(content))
+            method_key = (os.path.abspath(file_path), method_name)
+            if minimizing and assertions and not checkpoint.is_minimized(method_key):
+                return True
+            for position in range(len(assertions)):
+                key = assertion_key(file_path, method_name, assertions, position)
+                if not checkpoint.is_done(key):
+                    return True
+    except Exception as e:
+        logger.warning(f"Could not check the assertions of {file_path}: {e}")
+        return True
+    return False
+
+
+def remove_assertions_in_parallel(
+    config, csv_writer, stats, assertion_index, checkpoint, minimization_writer=None
+):
+    """
+    Run the baseline of every file, then every assertion removal and, when
+    minimizing, the minimization of every method as independent jobs on a
+    pool of processes. Each job is verified in its own workspace so that
+    they never see each other's files.
+    """
+    if not is_isolated(config):
+        logger.info("Parallel pruning uses isolated workspaces")
+        config = dict(config, Isolated_workspaces=True)
+    results_path = config["Results_dir"]
+    dfy_files = [
+        file_path
+        for file_path in get_dfy_files(config["Project_path"])
+        if has_pending_assertions(file_path, checkpoint, is_minimizing(config))
+    ]
+    files_done = 0
+
+    with ProcessPoolExecutor(max_workers=config["Pruning_workers"]) as executor:
+
+        def submit_methods(method_list):
+            # indices are given in the order of the sequential run, whatever
+            # the order the jobs complete in
+            for method in sorted(method_list, key=lambda x: x.verification_time):
+                file_content = method.get_file_content()
+                assertions = extract_assertions(method.get_method_content(file_content))
+                method_key = (os.path.abspath(method.file_path), method.method_name)
+                minimization = None
+                if (
+                    is_minimizing(config)
+                    and assertions
+                    and not checkpoint.is_minimized(method_key)
+                ):
+                    # ddmin does not wait for the single removals
+                    assertion_index[0] += 1
+                    minimization = {
+                        "key": method_key,
+                        "assertions": assertions,
+                        "keys": [],
+                        "index": assertion_index[0],
+                        "stats": None,
+                        "remaining": 1,
+                    }
+                    future = executor.submit(
+                        minimization_job,
+                        method,
+                        assertions,
+                        results_path,
+                        config,
+                        assertion_index[0],
+                    )
+                    pending[future] = ("minimization", minimization)
+                for position, assertion in enumerate(assertions):
+                    key = assertion_key(
+                        method.file_path, method.method_name, assertions, position
+                    )
+                    if minimization is not None:
+                        minimization["keys"].append(key)
+                    if checkpoint.is_done(key):
+                        continue
+                    assertion_index[0] += 1
+                    future = executor.submit(
+                        assertion_job,
+                        method,
+                        assertion,
+                        assertion_index[0],
+                        results_path,
+                        config,
+                    )
+                    pending[future] = (
+                        "assertion",
+                        (key, assertion_index[0], minimization),
+                    )
+                    if minimization is not None:
+                        minimization["remaining"] += 1
+
+        def finish_minimization(minimization):
+            # the row is written once ddmin and the single removals are done
+            minimization["remaining"] -= 1
+            if minimization["remaining"] > 0 or minimization["stats"] is None:
+                return
+            removal_results = [
+                checkpoint.results.get(key) for key in minimization["keys"]
+            ]
+            minimization_writer.writerow(
+                with_necessary(
+                    minimization["stats"], minimization["assertions"], removal_results
+                )
+            )
+            checkpoint.mark_minimized(minimization["key"], minimization["index"])
+
+        # baseline jobs map to the position of their file, assertion jobs to
+        # their key, index and the minimization of their method, minimization
+        # jobs to that minimization
+        pending = {
+            executor.submit(baseline_job, file_path, results_path, config): (
+                "baseline",
+                file_position,
+            )
+            for file_position, file_path in enumerate(dfy_files)
+        }
+        # the methods of a file are submitted once the files before it are
+        baselines = {}
+        next_file = 0
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_type, job = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    traceback_str = "".join(traceback.format_exception(e))
+                    logger.error(f"An error occurred: {e}\n{traceback_str}")
+                    result = None
+                if job_type == "assertion":
+                    key, index, minimization = job
+                    if result is not None:
+                        for assertions_stats in result:
+                            stats.append(assertions_stats)
+                            csv_writer.writerow(assertions_stats)
+                        checkpoint.mark_done(key, index, removal_result(result))
+                    if minimization is not None:
+                        finish_minimization(minimization)
+                    continue
+                if job_type == "minimization":
+                    job["stats"] = result
+                    finish_minimization(job)
+                    continue
+
+                file_path = dfy_files[job]
+                files_done += 1
+                logger.info(
+                    f"==== Baseline of {file_path} {files_done}/{len(dfy_files)} ====="
+                )
+                baselines[job] = result
+                while next_file in baselines:
+                    result = baselines.pop(next_file)
+                    next_file += 1
+                    if result is None:
+                        continue
+                    method_list, success = result
+                    if success:
+                        submit_methods(method_list)
+
+
+def baseline_job(file_path, results_path, config):
+    with open(file_path) as file:
+        content = file.read()
+    return process_methods(file_path, content, results_path, config)
+
+
+def assertion_job(method, assertion, method_index, results_path, config):
+    stats = []
+    process_assertion(
+        method,
+        assertion,
+        os.path.dirname(method.file_path),
+        results_path,
+        config,
+        None,
+        stats,
+        method.get_file_content(),
+        [method_index],
+    )
+    return stats
+
+
+def minimization_job(method, assertions, results_path, config, minimization_index):
+    return minimize_method(
+        method,
+        assertions,
+        os.path.dirname(method.file_path),
+        results_path,
+        config,
+        minimization_index,
+    )
+
+
+def removal_result(assertions_stats):
+    if not assertions_stats:
+        return None
+    return assertions_stats[-1][11]
+
+
+def with_necessary(minimization_stats, assertions, removal_results):
+    """
+    Fill the necessary assertions of a minimization row: the ones whose
+    removal alone was verified and broke the method.
+    """
+    necessary = [
+        assertion
+        for assertion, result in zip(assertions, removal_results)
+        if result is not None and result != "Correct"
+    ]
+    return minimization_stats[:4] + [necessary] + minimization_stats[5:]
 
 
 def process_file(
-    file_path, file_location, results_path, config, csv_writer, stats, assertion_index
+    file_path,
+    file_location,
+    results_path,
+    config,
+    csv_writer,
+    stats,
+    assertion_index,
+    checkpoint=None,
+    minimization_writer=None,
 ):
     try:
         with open(file_path) as file:
@@ -76,6 +344,8 @@ def process_file(
                     csv_writer,
                     stats,
                     assertion_index,
+                    checkpoint,
+                    minimization_writer,
                 )
 
     except Exception as e:
@@ -87,13 +357,21 @@ def process_methods(file_path, content, results_path, config):
     method_names = extract_method_and_lemma_names(content)
     method_list = []
     success = True
+    positions = range(len(method_names))
 
-    for method_name in method_names:
+    if config.get("File_level_baseline", False):
+        method_list, positions, success = process_file_baseline(
+            file_path, content, method_names, results_path, config
+        )
+
+    for position in positions:
+        method_name = method_names[position]
         try:
             method = Method(file_path, method_name)
+            method.log_name = method_log_name(file_path, method_names, position, config)
             method_list.append(method)
             success = method.run_verification(
-                results_path, additionnal_args=config["Dafny_args"]
+                results_path, **parse_verification_options(config)
             )
 
             if not success:
@@ -108,15 +386,143 @@ def process_methods(file_path, content, results_path, config):
     return method_list, success
 
 
+def project_log_name(file_path, name, config, suffix):
+    """
+    Name of the logs of a method or file of the project. Methods and files
+    with the same name in different directories must not share their logs.
+    """
+    relative_path = os.path.relpath(file_path, config["Project_path"])
+    return f"{name}_{hash_key(relative_path)[:8]}_{suffix}"
+
+
+def method_log_name(file_path, method_names, position, config):
+    # methods of different modules can share their name
+    method_name = method_names[position]
+    occurrence = method_names[:position].count(method_name)
+    return project_log_name(file_path, method_name, config, str(occurrence))
+
+
+def method_error_records(output, file_path, content, method):
+    """
+    Records of the output of a whole file verification located in the span
+    of `method`.
+    """
+    method_content = method.get_method_content(content)
+    if not method_content:
+        return []
+    if method_content not in content:
+        # the method ends the file without a final newline
+        method_content = method_content[:-1]
+    start = content.count("\n", 0, content.index(method_content)) + 1
+    end = start + method_content.count("\n")
+    return [
+        record
+        for file_name, line, record in iter_records(output or "")
+        if os.path.basename(file_name) == os.path.basename(file_path)
+        and start <= line <= end
+    ]
+
+
+def process_file_baseline(file_path, content, method_names, results_path, config):
+    """
+    Verify the whole file once and dispatch the results to its methods, each
+    with the errors located in its own span. The positions of the methods
+    without results or that timed out are returned to be verified on their
+    own.
+    """
+    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    file_run = Method(file_path, file_name, type="file")
+    file_run.log_name = project_log_name(file_path, file_name, config, "file_0")
+    try:
+        file_run.run_verification(
+            results_path, whole_file=True, **parse_verification_options(config)
+        )
+    except Exception as e:
+        traceback_str = traceback.format_exc()
+        logger.error(f"An error occurred: {e}\n{traceback_str}")
+        return [], range(len(method_names)), True
+
+    qualified_names = extract_qualified_method_and_lemma_names(content)
+    method_list = []
+    remaining_positions = []
+    success = True
+    for position, method_name in enumerate(method_names):
+        outcomes = file_run.outcomes_of(qualified_names[position])
+        if not outcomes or any(
+            outcome.overall_outcome == "TimedOut" for outcome in outcomes
+        ):
+            remaining_positions.append(position)
+            continue
+        method = Method(file_path, method_name)
+        method.log_name = method_log_name(file_path, method_names, position, config)
+        method.verification_outcome = outcomes
+        method.dafny_log_file = file_run.dafny_log_file
+        records = method_error_records(
+            file_run.entire_error_message, file_path, content, method
+        )
+        if records:
+            verified = sum(
+                1 for outcome in outcomes if outcome.overall_outcome == "Correct"
+            )
+            method.record_error_output(records_output(records, verified), results_path)
+        success = method.record_verification_outcome()
+        if not success:
+            method.verification_time = 0
+        method_list.append(method)
+
+    logger.info(
+        f"File level baseline: {len(method_list)} methods, "
+        f"{len(remaining_positions)} verified on their own"
+    )
+    return method_list, remaining_positions, success
+
+
 def process_method(
-    method, file_location, results_path, config, csv_writer, stats, assertion_index
+    method,
+    file_location,
+    results_path,
+    config,
+    csv_writer,
+    stats,
+    assertion_index,
+    checkpoint=None,
+    minimization_writer=None,
 ):
     try:
         file_content = method.get_file_content()
         assertions = extract_assertions(method.get_method_content(file_content))
 
-        for assertion in assertions:
+        method_key = (os.path.abspath(method.file_path), method.method_name)
+        minimization_stats = None
+        if (
+            minimization_writer
+            and assertions
+            and not (checkpoint and checkpoint.is_minimized(method_key))
+        ):
+            # ddmin does not depend on the single removals
             assertion_index[0] += 1
+            minimization_index = assertion_index[0]
+            minimization_stats = minimize_method(
+                method,
+                assertions,
+                file_location,
+                results_path,
+                config,
+                minimization_index,
+                checkpoint,
+            )
+
+        removal_results = []
+        for position, assertion in enumerate(assertions):
+            key = assertion_key(
+                method.file_path, method.method_name, assertions, position
+            )
+            if checkpoint and checkpoint.is_done(key):
+                logger.info(f"Skipping done assertion {position + 1}/{len(assertions)}")
+                removal_results.append(checkpoint.results.get(key))
+                continue
+            assertion_index[0] += 1
+            stats_count = len(stats)
             logger.info(
                 f"Starting assertion {assertions.index(assertion) + 1}/{len(assertions)} for {method.method_name}"
             )
@@ -130,7 +536,18 @@ def process_method(
                 stats,
                 file_content,
                 assertion_index,
+                checkpoint,
+            )
+            removal_results.append(removal_result(stats[stats_count:]))
+            if checkpoint:
+                checkpoint.mark_done(key, assertion_index[0], removal_results[-1])
+
+        if minimization_stats is not None:
+            minimization_writer.writerow(
+                with_necessary(minimization_stats, assertions, removal_results)
             )
+            if checkpoint:
+                checkpoint.mark_minimized(method_key, minimization_index)
 
     except Exception as e:
         traceback_str = traceback.format_exc()
@@ -147,6 +564,7 @@ def process_assertion(
     stats,
     file_content,
     assertion_index,
+    checkpoint=None,
 ):
     method_index = assertion_index[0]
 
@@ -154,15 +572,27 @@ def process_assertion(
         modified_method = method.get_method_content(file_content).replace(
             assertion, "", 1
         )
+        # isolated workspaces do not need the file next to the original
+        directory = results_path if is_isolated(config) else file_location
         new_method = method.create_modified_method(
-            modified_method, file_location, method_index, 0, "prunned"
+            modified_method, directory, method_index, 0, "prunned"
         )
         logger.info(
             f"Creating modified method for {method.method_name} in {new_method.file_path}"
         )
+        # isolated runs create it in the results directory, where it stays
+        if checkpoint and not is_isolated(config):
+            checkpoint.record_created(new_method.file_path)
 
         process_verification(
-            new_method, method, results_path, config, csv_writer, stats, assertion
+            new_method,
+            method,
+            results_path,
+            config,
+            csv_writer,
+            stats,
+            assertion,
+            checkpoint,
         )
 
     except Exception as e:
@@ -172,16 +602,28 @@ def process_assertion(
 
 
 def process_verification(
-    new_method, method, results_path, config, csv_writer, stats, assertion
+    new_method,
+    method,
+    results_path,
+    config,
+    csv_writer,
+    stats,
+    assertion,
+    checkpoint=None,
 ):
     try:
-        method.move_original(results_path)
+        if not is_isolated(config):
+            method.move_original(results_path)
+            if checkpoint:
+                checkpoint.record_move(method.file_path, method.moved_path)
         success = new_method.run_verification(
-            results_path, additionnal_args=config["Dafny_args"]
+            results_path,
+            **parse_verification_options(config, method.verification_time),
         )
         method.move_back()
 
-        if not success:
+        # a removal that runs past the wall-clock limit is still a result
+        if not success and new_method.verification_result != "Timeout":
             new_method.move_to_results_directory(results_path)
             return
 
@@ -208,7 +650,8 @@ def process_verification(
         logger.debug(new_method)
         stats.append(assertions_stats)
         logger.debug(f"Writing stats: {assertions_stats}")
-        csv_writer.writerow(assertions_stats)
+        if csv_writer:
+            csv_writer.writerow(assertions_stats)
         new_method.move_to_results_directory(results_path)
 
     except Exception as e:
@@ -216,3 +659,88 @@ def process_verification(
         logger.error(f"An error occurred: {e}\n{traceback_str}")
         new_method.move_to_results_directory(results_path)
         method.move_back()
+
+
+def minimize_method(
+    method,
+    assertions,
+    file_location,
+    results_path,
+    config,
+    minimization_index,
+    checkpoint=None,
+):
+    """
+    Look for a minimal set of assertions the method still verifies with:
+    ddmin removes them by groups, starting with all of them at once. The
+    necessary assertions are left to the single removals, see
+    with_necessary.
+    """
+    method_content = method.get_method_content(method.get_file_content())
+    directory = results_path if is_isolated(config) else file_location
+    positions = list(range(len(assertions)))
+    verified_methods = {}
+
+    def verifies_with(kept):
+        kept = tuple(sorted(kept))
+        if kept not in verified_methods:
+            removed = [position for position in positions if position not in kept]
+            modified_method = remove_assertions_at(method_content, assertions, removed)
+            new_method = method.create_modified_method(
+                modified_method,
+                directory,
+                f"{minimization_index}_{len(verified_methods)}",
+                0,
+                "minimized",
+            )
+            logger.info(
+                f"Minimizing {method.method_name}: trying without {len(removed)}/{len(assertions)} assertions"
+            )
+            verify_modified_method(new_method, method, results_path, config, checkpoint)
+            verified_methods[kept] = new_method
+        return verified_methods[kept].verification_result == "Correct"
+
+    if method.verification_result == "Correct":
+        minimal = sorted(ddmin(positions, verifies_with))
+    else:
+        # ddmin needs a method that verifies with all its assertions
+        minimal = positions
+    # the whole method when no assertion could be removed
+    minimized_method = verified_methods.get(tuple(minimal), method)
+    logger.info(
+        f"Minimized {method.method_name} from {len(assertions)} to {len(minimal)} assertions"
+    )
+
+    return [
+        method.file_path,
+        method.method_name,
+        method.verification_time,
+        len(assertions),
+        None,
+        [assertions[position] for position in minimal],
+        [assertions[position] for position in positions if position not in minimal],
+        minimized_method.file_path,
+        minimized_method.verification_time,
+        minimized_method.verification_result,
+        len(verified_methods),
+    ]
+
+
+def verify_modified_method(new_method, method, results_path, config, checkpoint=None):
+    if checkpoint and not is_isolated(config):
+        checkpoint.record_created(new_method.file_path)
+    try:
+        if not is_isolated(config):
+            method.move_original(results_path)
+            if checkpoint:
+                checkpoint.record_move(method.file_path, method.moved_path)
+        new_method.run_verification(
+            results_path,
+            **parse_verification_options(config, method.verification_time),
+        )
+    except Exception as e:
+        traceback_str = traceback.format_exc()
+        logger.error(f"An error occurred: {e}\n{traceback_str}")
+    finally:
+        method.move_back()
+        new_method.move_to_results_directory(results_path)
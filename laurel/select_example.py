@@ -1,11 +1,19 @@
-import ast
 import os
+import numpy as np
 import pandas as pd
 import pickle
 
 
-from token_wrapper import call_tokenizer_csharp, parse_token_output
+from token_wrapper import (
+    as_token_sequence,
+    call_tokenizer_csharp,
+    load_token_columns,
+    parse_token_sequence,
+    save_token_columns,
+    tokenize_codes,
+)
 from dafny_utils import extract_dafny_functions
+from disk_cache import file_digest
 
 
 from similarity import embedding_lib
@@ -13,6 +21,8 @@ from similarity.mss import mss
 from similarity.get_distance_matrix import compute_clustering_unsave
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+TOKEN_COLUMNS = ["Assertion Tokens", "Method Tokens"]
+
 
 class ExamplesSelector:
     def __init__(self, config_prompt):
@@ -57,11 +67,6 @@ class ExamplesSelector:
         self.max_size = config_prompt["Context"]["Max_size"]
         self.tokens_df, recompute = get_tokens_df(training_file)
         # self.tokens_df["Assertion Tokens"]).to_list()
-        self.tokens_df["Method Tokens"] = self.tokens_df["Method Tokens"].to_list()
-        if isinstance(self.tokens_df["Method Tokens"][0], str):
-            self.tokens_df["Method Tokens"] = (
-                self.tokens_df["Method Tokens"].apply(ast.literal_eval).to_list()
-            )
 
     def init_file_provided_examples(self, config_prompt):
         training_file = config_prompt["Context"]["Training_file"]
@@ -106,11 +111,12 @@ class ExamplesSelector:
 
         self.tokens_df, recompute = get_tokens_df(training_file)
         assertion_tokens = self.tokens_df["Assertion Tokens"].to_list()
-        if isinstance(self.tokens_df["Assertion Tokens"][0], str):
-            assertion_tokens = (
-                self.tokens_df["Assertion Tokens"].apply(ast.literal_eval).to_list()
-            )
-        self.mspc = compute_clustering(assertion_tokens, token_file, force=recompute)
+        self.mspc = compute_clustering(
+            assertion_tokens,
+            token_file,
+            force=recompute,
+            dist_file=distance_file(config_prompt, token_file),
+        )
         centers = get_clusters_centers(self.mspc, threshold, min_cluster_length)
         examples = []
         for center in centers:
@@ -144,15 +150,16 @@ class ExamplesSelector:
         self.tokens_df, recompute = get_tokens_df(training_file)
         # self.tokens_df["Assertion Tokens"]).to_list()
         method_tokens = self.tokens_df["Method Tokens"].to_list()
-        if isinstance(self.tokens_df["Method Tokens"][0], str):
-            method_tokens = (
-                self.tokens_df["Method Tokens"].apply(ast.literal_eval).to_list()
-            )
         recompute = False
-        self.mspc = compute_clustering(method_tokens, token_file, force=recompute)
+        self.mspc = compute_clustering(
+            method_tokens,
+            token_file,
+            force=recompute,
+            dist_file=distance_file(config_prompt, token_file),
+        )
 
     def get_clusters_of_method(self, method, threshold):
-        method_tokens = parse_token_output(call_tokenizer_csharp(method))
+        method_tokens = parse_token_sequence(call_tokenizer_csharp(method))
         obj_index = self.mspc.add_row(method_tokens)
         self.mspc._compute_hac()
         _, clusters_elements = self.mspc.get_cluster_of_obj(obj_index, threshold)
@@ -172,7 +179,7 @@ class ExamplesSelector:
 
     def generate_tfidf_examples(self, method, threshold, question_prompt, current_file):
         # Get tokens of method
-        method_tokens = parse_token_output(call_tokenizer_csharp(method))
+        method_tokens = parse_token_sequence(call_tokenizer_csharp(method))
         vectorizer = TfidfVectorizer(analyzer=lambda x: x, lowercase=False)
         # tmp = self.tokens_df["Method Tokens"].append(method_tokens)
         self.tokens_df["all_tokens"] = self.tokens_df["Method Tokens"].apply(
@@ -264,18 +271,20 @@ def get_clusters_centers(mscp, threshold, min_cluster_length):
 
 
 def process_assertion(assertion):
-    tokens = parse_token_output(call_tokenizer_csharp(assertion))
+    tokens = parse_token_sequence(call_tokenizer_csharp(assertion))
     return assertion, tokens
 
 
 def process_method(original_file, original_method):
+    original_method_content = read_method(original_file, original_method)
+    tokens = parse_token_sequence(call_tokenizer_csharp(original_method_content))
+    return original_method_content, tokens
+
+
+def read_method(original_file, original_method):
     with open(original_file, "r") as f:
         original_file_content = f.read()
-    original_method_content = extract_dafny_functions(
-        original_file_content, original_method
-    )
-    tokens = parse_token_output(call_tokenizer_csharp(original_method_content))
-    return original_method_content, tokens
+    return extract_dafny_functions(original_file_content, original_method)
 
 
 def get_string_df(training_file):
@@ -298,44 +307,86 @@ def get_string_df(training_file):
 
 
 def get_tokens_df(training_file):
+    """
+    Read the training set with its token columns. The tokens are kept in a
+    numpy archive next to the training file and only computed when missing
+    or when the training file changed.
+    """
     df_non_verified = pd.read_csv(training_file)
     recompute = False
-    if "Assertion Tokens" not in df_non_verified.columns:
-        assertions_tokens = []
-        for _, row in df_non_verified.iterrows():
-            _, assertion_tokens = process_assertion(row["Assertion"])
-            assertions_tokens.append(assertion_tokens)
-        df_non_verified["Assertion Tokens"] = assertions_tokens
-        recompute = True
-    if "Method Tokens" not in df_non_verified.columns:
-        methods_tokens = []
-        for _, row in df_non_verified.iterrows():
-            _, method_tokens = process_method(row["New Method File"], row["New Method"])
-            methods_tokens.append(method_tokens)
-        df_non_verified["Method Tokens"] = methods_tokens
+    token_file = training_file + ".token_columns.npz"
+    training_digest = file_digest(training_file)
+    columns = {}
+    if os.path.exists(token_file):
+        columns = load_token_columns(token_file, training_digest)
+        if any(len(tokens) != len(df_non_verified) for tokens in columns.values()):
+            columns = {}
+    save = False
+    for column in TOKEN_COLUMNS:
+        if column in columns:
+            continue
+        save = True
+        if column in df_non_verified.columns:
+            # tokens written in the csv by older versions
+            columns[column] = [as_token_sequence(x) for x in df_non_verified[column]]
+            continue
+        # the snippets are tokenized in batches by the tokenizer service
+        if column == "Assertion Tokens":
+            codes = df_non_verified["Assertion"].to_list()
+        else:
+            codes = [
+                read_method(row["New Method File"], row["New Method"])
+                for _, row in df_non_verified.iterrows()
+            ]
+        columns[column] = tokenize_codes(codes)
         recompute = True
-    df_non_verified.to_csv(training_file, index=False)
+    if save:
+        save_token_columns(token_file, columns, training_digest)
+    df_non_verified = df_non_verified.drop(columns=TOKEN_COLUMNS, errors="ignore")
+    for column, tokens in columns.items():
+        df_non_verified[column] = token_series(tokens, df_non_verified.index)
     return df_non_verified, recompute
 
 
+def token_series(tokens, index):
+    # token sequences look like lists, keep numpy from unpacking them
+    values = np.empty(len(tokens), dtype=object)
+    for i, sequence in enumerate(tokens):
+        values[i] = sequence
+    return pd.Series(values, index=index)
+
+
 def comparator(x, y):
-    return mss.MostSimilarSubsequence(x, y, comp=mss.line_comp).similarity("mean")
+    return mss.MostSimilarSubsequence(
+        x, y, comp=mss.line_comp, alignment=False
+    ).similarity("mean")
+
 
+def distance_file(config_prompt, pickle_file):
+    # the distances of a clustering are memory-mapped next to its pickle
+    if config_prompt["Context"].get("Memory_mapped_distances", False):
+        return f"{pickle_file}.dist"
+    return None
 
-def compute_clustering(suggestions, pickle_file, force=False):
+
+def compute_clustering(suggestions, pickle_file, force=False, dist_file=None):
     if os.path.exists(pickle_file) and not force:
         with open(pickle_file, "rb") as f:
             try:
-                return pickle.load(f)
+                clustering = pickle.load(f)
             except Exception as e:
                 print(
                     f"Error loading pickle file, try recomputing the cluster by setting force=True: {e}, file: {pickle_file}"
                 )
                 raise
+        # clusterings saved by older versions hold lists of tuples
+        clustering.objs = [as_token_sequence(obj) for obj in clustering.objs]
+        return clustering
     clustering = mss.HierarchicalClustering(
         suggestions,
         comparator,
         method="complete",
+        dist_file=dist_file,
     )
     with open(pickle_file, "wb") as f:
         pickle.dump(clustering, f)
@@ -1,7 +1,7 @@
 import os
 import pickle
 
-from token_wrapper import parse_token_output, call_tokenizer_csharp
+from token_wrapper import parse_token_sequence, call_tokenizer_csharp
 from dafny_utils import extract_dafny_functions
 
 from similarity import mss
@@ -13,17 +13,19 @@ def process_method(original_file, original_method):
     original_method_content = extract_dafny_functions(
         original_file_content, original_method
     )
-    tokens = parse_token_output(call_tokenizer_csharp(original_method_content))
+    tokens = parse_token_sequence(call_tokenizer_csharp(original_method_content))
     return original_method_content, tokens
 
 
 def process_assertion(assertion):
-    tokens = parse_token_output(call_tokenizer_csharp(assertion))
+    tokens = parse_token_sequence(call_tokenizer_csharp(assertion))
     return assertion, tokens
 
 
 def comparator(x, y):
-    return mss.MostSimilarSubsequence(x, y, comp=mss.line_comp).similarity("mean")
+    return mss.MostSimilarSubsequence(
+        x, y, comp=mss.line_comp, alignment=False
+    ).similarity("mean")
 
 
 def compute_clustering(suggestions, pickle_file, method="complete"):
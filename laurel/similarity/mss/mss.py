@@ -1,7 +1,96 @@
 from multiprocess import Pool
 import os
+import tempfile
 import numpy as np
 from scipy.cluster.hierarchy import linkage, fcluster
+from scipy.spatial.distance import squareform
+
+# move to the previous cell of every choice of _compute_mss
+CHOICE_PREVIOUS = np.array([[-1, -1], [-1, 0], [0, -1], [-1, -1]])
+# shorter rows are faster to compute one cell at a time
+MIN_VECTORIZED_LENGTH = 48
+# tiles of the distance matrix per worker, so that the workers done with
+# cheap pairs pick up the remaining tiles
+DISTANCE_TILES_PER_CPU = 8
+
+
+def condensed_index(n, i, j):
+    """
+    Index of the distance between objects i < j among n in condensed form.
+    """
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+def condensed(square):
+    return square[np.triu_indices(len(square), 1)].astype(np.float32)
+
+
+def distance_tiles(n, nb_tiles):
+    """
+    Split the condensed indices of the pairs of n objects into at most
+    `nb_tiles` contiguous ranges with the same number of pairs.
+    """
+    size = n * (n - 1) // 2
+    bounds = np.linspace(0, size, min(nb_tiles, size) + 1).astype(np.int64)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+# objects, comparison function and output file of the distance workers, set
+# once per worker by the pool initializer
+_distance_task = None
+
+
+def _init_distance_worker(objs, comp, dist_file):
+    global _distance_task
+    _distance_task = (objs, comp, dist_file)
+
+
+def _compute_distance_tile(tile):
+    objs, comp, dist_file = _distance_task
+    n = len(objs)
+    start, end = tile
+    row_starts = condensed_index(n, np.arange(n), np.arange(n) + 1)
+    i = int(np.searchsorted(row_starts, start, side="right")) - 1
+    j = start - int(row_starts[i]) + i + 1
+
+    values = np.zeros(end - start, dtype=np.float32)
+    for k in range(end - start):
+        values[k] = 1 - comp(objs[i], objs[j])
+        j += 1
+        if j == n:
+            i += 1
+            j = i + 1
+    out = np.memmap(
+        dist_file,
+        dtype=np.float32,
+        mode="r+",
+        offset=start * np.dtype(np.float32).itemsize,
+        shape=(end - start,),
+    )
+    out[:] = values
+    out.flush()
+
+
+def comparison_rows(s, t, comp):
+    """
+    Rows of comp(s[i], t[j]), computed one at a time. A comparison function
+    can provide a faster way to compute them as its `rows` attribute.
+    """
+    if hasattr(comp, "rows"):
+        yield from comp.rows(s, t)
+        return
+    for x in s:
+        yield [comp(x, y) for y in t]
+
+
+def comparison_matrix(s, t, comp):
+    """
+    Matrix of comp(s[i], t[j]). A comparison function can provide a faster
+    way to compute the whole matrix as its `matrix` attribute.
+    """
+    if hasattr(comp, "matrix"):
+        return comp.matrix(s, t)
+    return np.array([[comp(x, y) for y in t] for x in s], dtype=float)
 
 
 class MostSimilarSubsequence:
@@ -11,13 +100,21 @@ class MostSimilarSubsequence:
     a float in [0, 1] representing the similarity between the two elements,
     where 0 means the elements are completely dissimilar and 1 means they are
     identical.
+    With `alignment=False` only the similarity is computed, keeping two rows
+    of the dynamic program instead of the full matrices.
     """
 
-    def __init__(self, s: list, t: list, comp) -> None:
+    def __init__(self, s: list, t: list, comp, alignment=True) -> None:
         self.s = s
         self.t = t
         self.comp = comp
 
+        self.similarity_map = None
+        if not alignment:
+            self.mss_value = self._compute_mss_score()
+            self._define_similarity()
+            return
+
         # self.mss_val[i, j] = the similarity of the most similar subsequence of s[:i] and t[:j]
         self.mss_val = np.zeros((len(s) + 1, len(t) + 1), dtype=float)
         self.mss_prev = np.ones((len(s) + 1, len(t) + 1, 2), dtype=int) * -1
@@ -30,7 +127,7 @@ class MostSimilarSubsequence:
         self.s_sub, self.t_sub = None, None
         self._backtrack_mss()
 
-        self.similarity_map = None
+        self.mss_value = self.mss_val[len(s), len(t)]
         self._define_similarity()
 
     def _compute_mss(self):
@@ -63,39 +160,102 @@ class MostSimilarSubsequence:
         #             self.mss_prev[i, j] = [0, -1]
         #             self.mss_choice[i, j] = 2
 
-        # implement the above by iterating over the anti-diagonals
-        for d in range(len(self.s) + len(self.t) + 1):
-            for i in range(max(0, d - len(self.t)), min(len(self.s) + 1, d + 1)):
-                j = d - i
-                if i == 0 or j == 0:
-                    self.mss_val[i, j] = 0
-                    continue
-                # Compute the similarity between the two elements
-                self.comp_res[i, j] = self.comp(self.s[i - 1], self.t[j - 1])
-                # If we match the current elements
-                match = self.mss_val[i - 1, j - 1] + self.comp_res[i, j]
-                # If we skip the current element in s
-                skip_s = self.mss_val[i - 1, j]
-                # If we skip the current element in t
-                skip_t = self.mss_val[i, j - 1]
-
-                self.mss_val[i, j] = self.mss_val[i - 1, j - 1]
-                # # This should be already initialized
-                # self.mss_prev[i, j] = [-1, -1]
-                # self.mss_choice[i, j] = 0
-
-                if match > self.mss_val[i, j]:
-                    self.mss_val[i, j] = match
-                    self.mss_prev[i, j] = [-1, -1]
-                    self.mss_choice[i, j] = 3
-                if skip_s > self.mss_val[i, j]:
-                    self.mss_val[i, j] = skip_s
-                    self.mss_prev[i, j] = [-1, 0]
-                    self.mss_choice[i, j] = 1
-                if skip_t > self.mss_val[i, j]:
-                    self.mss_val[i, j] = skip_t
-                    self.mss_prev[i, j] = [0, -1]
-                    self.mss_choice[i, j] = 2
+        n, m = len(self.s), len(self.t)
+        if n == 0 or m == 0:
+            return
+        self.comp_res[1:, 1:] = comparison_matrix(self.s, self.t, self.comp)
+        if m < MIN_VECTORIZED_LENGTH:
+            self._compute_mss_by_rows()
+        else:
+            self._compute_mss_vectorized()
+        self.mss_prev = CHOICE_PREVIOUS[self.mss_choice]
+
+    def _compute_mss_vectorized(self):
+        # implement the above a row at a time: without the skip of t, the
+        # cells of a row only depend on the previous row, and skipping t
+        # takes the running maximum of the row. The choices are recovered
+        # with the strict comparisons above, so ties are broken the same way.
+        for i in range(1, len(self.s) + 1):
+            previous_row = self.mss_val[i - 1]
+            skip_both = previous_row[:-1]
+            match = skip_both + self.comp_res[i, 1:]
+            skip_s = previous_row[1:]
+            choice = np.where(match > skip_both, 3, 0)
+            value = np.maximum(skip_both, match)
+            choice = np.where(skip_s > value, 1, choice)
+            value = np.maximum(value, skip_s)
+            row = self.mss_val[i]
+            np.maximum.accumulate(value, out=row[1:])
+            np.maximum(row[1:], 0, out=row[1:])
+            choice[row[:-1] > value] = 2
+            self.mss_choice[i, 1:] = choice
+
+    def _compute_mss_by_rows(self):
+        # the rows are too short to be worth vectorizing, run the loop above
+        # on lists
+        comp_res = self.comp_res.tolist()
+        previous_row = [0.0] * (len(self.t) + 1)
+        mss_val = [previous_row]
+        mss_choice = [[0] * (len(self.t) + 1)]
+        for i in range(1, len(self.s) + 1):
+            comp_row = comp_res[i]
+            row = [0.0]
+            choice_row = [0]
+            for j in range(1, len(self.t) + 1):
+                value = previous_row[j - 1]
+                choice = 0
+                match = value + comp_row[j]
+                if match > value:
+                    value = match
+                    choice = 3
+                if previous_row[j] > value:
+                    value = previous_row[j]
+                    choice = 1
+                if row[j - 1] > value:
+                    value = row[j - 1]
+                    choice = 2
+                row.append(value)
+                choice_row.append(choice)
+            mss_val.append(row)
+            mss_choice.append(choice_row)
+            previous_row = row
+        self.mss_val[:] = mss_val
+        self.mss_choice[:] = mss_choice
+
+    def _compute_mss_score(self):
+        # same dynamic program as _compute_mss, a row at a time
+        s, t = self.s, self.t
+        if getattr(self.comp, "symmetric", False) and len(t) > len(s):
+            # the rows are the shortest sequence
+            s, t = t, s
+        if len(s) == 0 or len(t) == 0:
+            return 0.0
+        previous_row = [0.0] * (len(t) + 1)
+        if len(t) < MIN_VECTORIZED_LENGTH:
+            for comp_row in comparison_rows(s, t, self.comp):
+                row = [0.0]
+                for j in range(1, len(t) + 1):
+                    value = previous_row[j - 1]
+                    match = value + comp_row[j - 1]
+                    if match > value:
+                        value = match
+                    if previous_row[j] > value:
+                        value = previous_row[j]
+                    if row[j - 1] > value:
+                        value = row[j - 1]
+                    row.append(value)
+                previous_row = row
+            return previous_row[-1]
+
+        previous_row = np.array(previous_row)
+        row = np.zeros(len(t) + 1)
+        for comp_row in comparison_rows(s, t, self.comp):
+            value = np.maximum(previous_row[:-1], previous_row[:-1] + comp_row)
+            np.maximum(value, previous_row[1:], out=value)
+            np.maximum.accumulate(value, out=row[1:])
+            np.maximum(row[1:], 0, out=row[1:])
+            previous_row, row = row, previous_row
+        return previous_row[-1]
 
     def _backtrack_mss(self):
         i, j = len(self.s), len(self.t)
@@ -113,7 +273,7 @@ class MostSimilarSubsequence:
         self.t_sub.reverse()
 
     def _define_similarity(self):
-        mss = self.mss_val[len(self.s), len(self.t)]
+        mss = self.mss_value
         len_s, len_t = len(self.s), len(self.t)
         sim_mean = 2 * mss / (len_s + len_t) if len_s + len_t > 0 else 1
         sim_min = mss / min(len_s, len_t) if min(len_s, len_t) > 0 else 1
@@ -121,7 +281,7 @@ class MostSimilarSubsequence:
         self.similarity_map = {"mean": sim_mean, "min": sim_min, "max": sim_max}
 
     def mss(self):
-        return self.mss_val[len(self.s), len(self.t)]
+        return self.mss_value
 
     def similarity(self, approx):
         if approx not in self.similarity_map:
@@ -133,10 +293,25 @@ class MostSimilarSubsequence:
 
 
 class HierarchicalClustering:
-    def __init__(self, objs, comp, method) -> None:
+    """
+    Hierarchical clustering of `objs` with the distance 1 - comp(x, y).
+    The distances are stored in condensed form, as the float32 upper
+    triangle of the distance matrix. With `dist_file` they are memory-mapped
+    from that file, which is not copied when the clustering is pickled, as
+    long as no object is added or removed.
+    With `legacy_linkage` the rows of the square distance matrix are
+    clustered as observation vectors, as older versions did, instead of the
+    distances themselves.
+    """
+
+    def __init__(
+        self, objs, comp, method, dist_file=None, legacy_linkage=False
+    ) -> None:
         self.objs = objs
         self.comp = comp
         self.method = method
+        self.dist_file = dist_file
+        self.legacy_linkage = legacy_linkage
 
         self.dist = None
         self._compute_distance_matrix()
@@ -144,51 +319,125 @@ class HierarchicalClustering:
         self.hac_res = None
         self._compute_hac()
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.dist_file is not None:
+            self.dist.flush()
+            state["dist"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("dist_file", None)
+        # keep the clusters of older pickles when they are recomputed
+        state.setdefault("legacy_linkage", True)
+        self.__dict__.update(state)
+        if self.dist_file is not None:
+            # read-only: loading a clustering must not modify its file
+            self.dist = np.memmap(self.dist_file, dtype=np.float32, mode="r")
+        elif self.dist is not None and self.dist.ndim == 2:
+            # pickled by older versions with the full float64 matrix
+            self.dist = condensed(self.dist)
+
     def _compute_distance_matrix(self):
         n = len(self.objs)
-        self.dist = np.zeros((n, n))
+        size = n * (n - 1) // 2
 
-        n_cpus = os.cpu_count() - 1
+        n_cpus = max(os.cpu_count() - 1, 1)
         print(f"Using {n_cpus} cpus for computing distances")
 
-        def distance_across_row(reference_idx):
-            row = np.zeros(n)
-            for i in range(n):
-                if i > reference_idx:
-                    row[i] = 1 - self.comp(self.objs[reference_idx], self.objs[i])
-            return row
-
-        # Create a pool of workers
-        with Pool(n_cpus) as pool:
-            rows = pool.map(distance_across_row, range(n))
-            for i in range(n):
-                self.dist[i] = rows[i]
-
-        self.dist = self.dist + self.dist.T
+        # the workers write their tiles directly into a file mapping, a
+        # temporary one when the distances are kept in memory
+        dist_file = self.dist_file
+        if dist_file is None:
+            fd, dist_file = tempfile.mkstemp(suffix=".dist")
+            os.close(fd)
+        try:
+            # np.memmap cannot map an empty file
+            self.dist = np.memmap(
+                dist_file, dtype=np.float32, mode="w+", shape=(max(size, 1),)
+            )[:size]
+            tiles = distance_tiles(n, n_cpus * DISTANCE_TILES_PER_CPU)
+            with Pool(
+                n_cpus,
+                initializer=_init_distance_worker,
+                initargs=(self.objs, self.comp, dist_file),
+            ) as pool:
+                for _ in pool.imap_unordered(_compute_distance_tile, tiles):
+                    pass
+            if self.dist_file is None:
+                self.dist = np.array(self.dist)
+        finally:
+            if self.dist_file is None:
+                os.remove(dist_file)
 
     def _compute_hac(self):
-        self.hac_res = linkage(self.dist, method=self.method)
+        if self.legacy_linkage:
+            self.hac_res = linkage(self.square_distances(), method=self.method)
+        else:
+            self.hac_res = linkage(self.dist, method=self.method)
         assert len(self.hac_res) == len(self.objs) - 1
 
+    def square_distances(self):
+        return squareform(self.dist, checks=False)
+
+    def distance(self, i, j):
+        if i == j:
+            return 0.0
+        if i > j:
+            i, j = j, i
+        return float(self.dist[condensed_index(len(self.objs), i, j)])
+
+    def distance_row(self, i):
+        """
+        Distances from the object at index i to every object.
+        """
+        n = len(self.objs)
+        row = np.zeros(n, dtype=np.float32)
+        before = np.arange(i)
+        row[:i] = self.dist[condensed_index(n, before, i)]
+        start = condensed_index(n, i, i + 1)
+        row[i + 1 :] = self.dist[start : start + n - i - 1]
+        return row
+
     def add_row(self, obj):
         self.objs.append(obj)
         n = len(self.objs)
 
-        def distance_across_row(reference_idx):
-            row = np.zeros(n)
-            for i in range(n):
-                row[i] = 1 - self.comp(self.objs[reference_idx], self.objs[i])
-            return row
-
-        row = distance_across_row(len(self.objs) - 1)
-        self.dist = np.vstack([self.dist, row[:-1]])
-        self.dist = np.hstack([self.dist, row.reshape(-1, 1)])
+        row = np.zeros(n - 1, dtype=np.float32)
+        for i in range(n - 1):
+            row[i] = 1 - self.comp(self.objs[n - 1], self.objs[i])
+        # the distance to the new object ends every row of the triangle
+        dist = np.zeros(n * (n - 1) // 2, dtype=np.float32)
+        for i in range(n - 1):
+            old_start = condensed_index(n - 1, i, i + 1)
+            start = condensed_index(n, i, i + 1)
+            dist[start : start + n - i - 2] = self.dist[
+                old_start : old_start + n - i - 2
+            ]
+            dist[start + n - i - 2] = row[i]
+        self._set_distances(dist)
         return n - 1
 
     def remove_row(self, idx):
+        n = len(self.objs)
         self.objs.pop(idx)
-        self.dist = np.delete(self.dist, idx, axis=0)
-        self.dist = np.delete(self.dist, idx, axis=1)
+        dist = np.zeros((n - 1) * (n - 2) // 2, dtype=np.float32)
+        start = 0
+        for i in range(n):
+            if i == idx:
+                continue
+            row_start = condensed_index(n, i, i + 1)
+            row = self.dist[row_start : row_start + n - i - 1]
+            if i < idx:
+                row = np.delete(row, idx - i - 1)
+            dist[start : start + len(row)] = row
+            start += len(row)
+        self._set_distances(dist)
+
+    def _set_distances(self, dist):
+        # a modified clustering no longer matches its file
+        self.dist = dist
+        self.dist_file = None
 
     def get_size(self):
         return len(self.objs)
@@ -241,7 +490,7 @@ class HierarchicalClustering:
         Return the cluster that the object at the given index belongs to.
         """
         print(f"threshold: {threshold}")
-        obj_row = self.dist[obj_idx]
+        obj_row = self.distance_row(obj_idx)
         # get the n min from that row indices
         t_closest = np.argsort(obj_row)[: threshold + 1]
         t_select = []
@@ -254,12 +503,12 @@ class HierarchicalClustering:
 
     def centroid(self, cluster):
         # avg_dist = lambda p: sum(self.dist[p, q] for q in cluster) / len(cluster)
-        avg_dist = lambda p: sum(self.dist[p, q] for q in cluster)
+        avg_dist = lambda p: self.distance_row(p)[cluster].sum()
         ctr = min(cluster, key=avg_dist)
         return ctr
 
     def chebyshev_center(self, cluster):
-        radius = lambda p: max(self.dist[p, q] for q in cluster)
+        radius = lambda p: self.distance_row(p)[cluster].max()
         ctr = min(cluster, key=radius)
         return ctr
 
@@ -273,5 +522,169 @@ def token_comp_dafny(t, k):
 
 
 def line_comp(s, t):
-    mss = MostSimilarSubsequence(s, t, token_comp_dafny)
-    return mss.similarity("mean")
+    """
+    Mean similarity of the most similar subsequence of two lines of tokens
+    compared with token_comp_dafny. Since tokens either match or not, it is
+    the longest common subsequence of the token kinds.
+    """
+    LINE_TABLE.start_comparison()
+    return LINE_TABLE.similarity(
+        LINE_TABLE.line_id(token_kinds(s)), LINE_TABLE.line_id(token_kinds(t))
+    )
+
+
+def line_comp_rows(s, t):
+    LINE_TABLE.start_comparison()
+    ids_t = [LINE_TABLE.line_id(kinds) for kinds in lines_kinds(t)]
+    # rows of the lines repeated in s
+    rows = {}
+    for kinds_s in lines_kinds(s):
+        id_s = LINE_TABLE.line_id(kinds_s)
+        if id_s not in rows:
+            rows[id_s] = LINE_TABLE.similarities_to(id_s, ids_t)
+        yield rows[id_s]
+
+
+def line_comp_matrix(s, t):
+    result = np.empty((len(s), len(t)))
+    for i, row in enumerate(line_comp_rows(s, t)):
+        result[i] = row
+    return result
+
+
+line_comp.rows = line_comp_rows
+line_comp.matrix = line_comp_matrix
+line_comp.symmetric = True
+
+
+class LineTable:
+    """
+    Ids of the distinct lines of tokens seen so far, and the similarity of
+    the pairs of lines already compared, so that the lines shared by many
+    methods are not compared again for every pair of methods. At most
+    `max_pairs` similarities are kept in two generations: when the current
+    one is full, it replaces the previous one. Once more than `max_lines`
+    lines are known, the next comparison starts from an empty table.
+    """
+
+    def __init__(self, max_pairs, max_lines):
+        self.max_pairs = max_pairs
+        self.max_lines = max_lines
+        self.clear()
+
+    def clear(self):
+        self.ids = {}
+        self.kinds = []
+        self.masks = []
+        self.similarities = {}
+        self.previous_similarities = {}
+
+    def start_comparison(self):
+        # the ids of the lines stay valid until the next comparison
+        if len(self.kinds) > self.max_lines:
+            self.clear()
+
+    def line_id(self, kinds):
+        key = tuple(kinds)
+        line_id = self.ids.get(key)
+        if line_id is None:
+            line_id = len(self.kinds)
+            self.ids[key] = line_id
+            self.kinds.append(kinds)
+            self.masks.append(match_masks(kinds))
+        return line_id
+
+    def similarities_to(self, id_s, ids_t):
+        similarities = self.similarities
+        row = []
+        for id_t in ids_t:
+            key = (id_s << 32) | id_t if id_s <= id_t else (id_t << 32) | id_s
+            similarity = similarities.get(key)
+            if similarity is None:
+                similarity = self.similarity(id_s, id_t)
+            row.append(similarity)
+        return row
+
+    def similarity(self, id_s, id_t):
+        # the similarity is symmetric
+        if id_s > id_t:
+            id_s, id_t = id_t, id_s
+        key = (id_s << 32) | id_t
+        similarity = self.similarities.get(key)
+        if similarity is None:
+            similarity = self.previous_similarities.get(key)
+            if similarity is None:
+                similarity = kinds_similarity(
+                    self.kinds[id_s], self.masks[id_s], self.kinds[id_t]
+                )
+            if len(self.similarities) >= self.max_pairs // 2:
+                self.previous_similarities = self.similarities
+                self.similarities = {}
+            self.similarities[key] = similarity
+        return similarity
+
+
+LINE_PAIR_CACHE_SIZE = 1 << 18
+LINE_CACHE_SIZE = 1 << 16
+LINE_TABLE = LineTable(LINE_PAIR_CACHE_SIZE, LINE_CACHE_SIZE)
+
+# codes of the token kinds that are not integers
+KIND_CODES = {}
+
+
+def kind_code(kind):
+    if isinstance(kind, (int, np.integer)):
+        return int(kind)
+    if isinstance(kind, str) and kind.isdigit():
+        return int(kind)
+    return KIND_CODES.setdefault(kind, (1 << 32) + len(KIND_CODES))
+
+
+def token_kinds(line):
+    """
+    Integer kinds of the tokens of a line. Elements that are not tokens get
+    -1 and never match, like in token_comp_dafny.
+    """
+    if isinstance(line, np.ndarray):
+        return line.tolist()
+    return [kind_code(t[0]) if isinstance(t, tuple) else -1 for t in line]
+
+
+def lines_kinds(lines):
+    if hasattr(lines, "line_kinds"):
+        # token sequences already hold the kinds as integers
+        kinds = lines.kinds.tolist()
+        offsets = lines.line_offsets.tolist()
+        return [kinds[start:end] for start, end in zip(offsets, offsets[1:])]
+    return [token_kinds(line) for line in lines]
+
+
+def match_masks(kinds):
+    masks = {}
+    for position, kind in enumerate(kinds):
+        if kind >= 0:
+            masks[kind] = masks.get(kind, 0) | (1 << position)
+    return masks
+
+
+def lcs_length(kinds_s, masks_s, kinds_t):
+    """
+    Length of the longest common subsequence of two lists of kinds, with the
+    bit-parallel algorithm of Hyyrö: bit i of `v` is cleared when s[i] ends
+    a longest common subsequence.
+    """
+    ones = (1 << len(kinds_s)) - 1
+    v = ones
+    for kind in kinds_t:
+        u = v & masks_s.get(kind, 0)
+        v = ((v + u) | (v - u)) & ones
+    return len(kinds_s) - v.bit_count()
+
+
+def kinds_similarity(kinds_s, masks_s, kinds_t):
+    len_s, len_t = len(kinds_s), len(kinds_t)
+    if len_s + len_t == 0:
+        return 1
+    if kinds_s == kinds_t and -1 not in kinds_s:
+        return 1.0
+    return 2 * lcs_length(kinds_s, masks_s, kinds_t) / (len_s + len_t)
@@ -0,0 +1,44 @@
+import math
+
+from dafny_utils import extract_verification_time_limit
+
+
+def is_tiered(config):
+    return config.get("Tiered_verification", False)
+
+
+def get_short_time_limit(config, baseline_time):
+    """
+    Verification time limit of the first tier, derived from the verification
+    time of the original method. None when tiers would not help.
+    """
+    if not is_tiered(config) or not baseline_time:
+        return None
+    time_limit = max(
+        config.get("Short_time_limit_min", 10),
+        math.ceil(config.get("Short_time_limit_factor", 2) * baseline_time),
+    )
+    full_time_limit = extract_verification_time_limit(config.get("Dafny_args", ""))
+    if full_time_limit is not None and time_limit >= full_time_limit:
+        return None
+    return time_limit
+
+
+def timed_out_candidates(candidates, indexes):
+    """
+    Indexes of the candidates to verify again with the full time limit after
+    the first tier: the ones that timed out, up to the first correct one.
+    """
+    timed_out = []
+    for index in indexes:
+        new_method, _, _, error = candidates[index]
+        if error is not None:
+            continue
+        # the candidates after a correct one would not have been tried
+        if new_method.verification_result == "Correct":
+            break
+        # only the solver time limit is raised, a candidate that ran past the
+        # wall-clock limit would time out again
+        if new_method.verification_result == "TimedOut":
+            timed_out.append(index)
+    return timed_out
@@ -1,16 +1,103 @@
+import ast
+import atexit
+import functools
+import json
+import logging
 import subprocess
 import os
+import threading
+
+import numpy as np
 
 TOKENIZER_CSHARP_PATH = "tokenizer_csharp/bin/Debug/net6.0/tokenizer_csharp"
+# snippets sent to the tokenizer service in one request
+TOKENIZER_BATCH_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+
+class TokenizerError(Exception):
+    pass
+
+
+class TokenizerService:
+    """
+    A long-running tokenizer process answering one request per line: every
+    request holds a batch of code snippets and the response the tokens of
+    each of them, the decoded form of the one-shot tokenizer output.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            [
+                os.path.join(os.path.dirname(__file__), TOKENIZER_CSHARP_PATH),
+                "--server",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+
+    def _request(self, codes):
+        if self.process is None or self.process.poll() is not None:
+            self._start()
+        try:
+            self.process.stdin.write(json.dumps({"Codes": codes}) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except OSError as e:
+            self.close()
+            raise TokenizerError(f"Tokenizer service is not running: {e}")
+        if not line:
+            self.close()
+            raise TokenizerError("Tokenizer service exited unexpectedly")
+        response = json.loads(line)
+        if response.get("Error"):
+            raise TokenizerError(response["Error"])
+        return response["Tokens"]
+
+    def tokenize(self, codes, batch_size=TOKENIZER_BATCH_SIZE):
+        """
+        Return the tokenizer output of every code snippet of `codes`.
+        """
+        outputs = []
+        with self.lock:
+            for start in range(0, len(codes), batch_size):
+                outputs.extend(self._request(codes[start : start + batch_size]))
+        return outputs
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+@functools.lru_cache(maxsize=None)
+def open_tokenizer_service():
+    logger.info("Starting the tokenizer service")
+    service = TokenizerService()
+    atexit.register(service.close)
+    return service
 
 
 def call_tokenizer_csharp(code):
-    command = [os.path.join(os.path.dirname(__file__), TOKENIZER_CSHARP_PATH)]
-    result = subprocess.run(
-        command, input=code, capture_output=True, text=True, check=True
-    )
-    output = result.stdout.strip()
-    return output
+    return open_tokenizer_service().tokenize([code])[0]
+
+
+def call_tokenizer_csharp_batch(codes):
+    return open_tokenizer_service().tokenize([str(code) for code in codes])
+
+
+def tokenize_codes(codes):
+    return [
+        parse_token_sequence(output) for output in call_tokenizer_csharp_batch(codes)
+    ]
 
 
 ## Tranform the JSON into a list of list of tokens
@@ -19,8 +106,232 @@ def call_tokenizer_csharp(code):
 ## to
 ## [[("35", "assert"), ("146", "false"), ("32", ";"), ("0", "")]]
 def parse_token_output(output):
-    tokens = eval(output)
-    return [[(t["Item1"], t["Item2"]) for t in token] for token in tokens]
+    return [[(t["Item1"], t["Item2"]) for t in token] for token in token_lines(output)]
+
+
+def parse_token_sequence(output):
+    return TokenSequence.from_lines(
+        [(t["Item1"], t["Item2"]) for t in token] for token in token_lines(output)
+    )
+
+
+def token_lines(output):
+    # the service answers with the tokens, the one-shot tokenizer with their JSON
+    if isinstance(output, str):
+        return json.loads(output)
+    return output
+
+
+class TokenTable:
+    """
+    Interned token texts, shared by all the token sequences of the process.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.texts = []
+
+    def intern(self, text):
+        text_id = self.ids.get(text)
+        if text_id is None:
+            text_id = len(self.texts)
+            self.ids[text] = text_id
+            self.texts.append(text)
+        return text_id
+
+
+TOKEN_TABLE = TokenTable()
+
+
+class TokenSequence:
+    """
+    Tokens of a piece of code, line by line. The token kinds are small
+    integers and the token texts ids in TOKEN_TABLE, both stored in flat
+    arrays where `line_offsets[i]` is the first token of line i.
+    Indexing gives the (kind, text) tuples of a line, so a sequence can be
+    used in place of the lists of lists returned by parse_token_output.
+    """
+
+    __slots__ = ("kinds", "text_ids", "line_offsets")
+
+    def __init__(self, kinds, text_ids, line_offsets):
+        self.kinds = kinds
+        self.text_ids = text_ids
+        self.line_offsets = line_offsets
+
+    @classmethod
+    def from_lines(cls, lines):
+        kinds = []
+        text_ids = []
+        line_offsets = [0]
+        for line in lines:
+            for kind, text in line:
+                kinds.append(int(kind))
+                text_ids.append(TOKEN_TABLE.intern(text))
+            line_offsets.append(len(kinds))
+        return cls(
+            np.array(kinds, dtype=np.int16),
+            np.array(text_ids, dtype=np.int32),
+            np.array(line_offsets, dtype=np.int32),
+        )
+
+    def __len__(self):
+        return len(self.line_offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token line index out of range")
+        start, end = self.line_offsets[index], self.line_offsets[index + 1]
+        texts = TOKEN_TABLE.texts
+        return [
+            (kind, texts[text_id])
+            for kind, text_id in zip(
+                self.kinds[start:end].tolist(), self.text_ids[start:end].tolist()
+            )
+        ]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        if isinstance(other, TokenSequence):
+            return (
+                np.array_equal(self.kinds, other.kinds)
+                and np.array_equal(self.text_ids, other.text_ids)
+                and np.array_equal(self.line_offsets, other.line_offsets)
+            )
+        return NotImplemented
+
+    def line_kinds(self, index):
+        return self.kinds[self.line_offsets[index] : self.line_offsets[index + 1]]
+
+    def texts(self):
+        texts = TOKEN_TABLE.texts
+        return [texts[text_id] for text_id in self.text_ids.tolist()]
+
+    def __getstate__(self):
+        # the ids are only valid in this process, pickle the texts instead
+        unique_ids, local_ids = np.unique(self.text_ids, return_inverse=True)
+        texts = [TOKEN_TABLE.texts[text_id] for text_id in unique_ids.tolist()]
+        return self.kinds, local_ids.astype(np.int32), self.line_offsets, texts
+
+    def __setstate__(self, state):
+        self.kinds, local_ids, self.line_offsets, texts = state
+        ids = np.array([TOKEN_TABLE.intern(text) for text in texts], dtype=np.int32)
+        self.text_ids = ids[local_ids]
+
+
+def as_token_sequence(tokens):
+    """
+    Convert the lists of lists of (kind, text) tuples of parse_token_output
+    (or their string form) into a TokenSequence.
+    """
+    if isinstance(tokens, TokenSequence):
+        return tokens
+    if isinstance(tokens, str):
+        tokens = ast.literal_eval(tokens)
+    return TokenSequence.from_lines(tokens)
+
+
+def save_token_columns(file_path, columns, source_digest=""):
+    """
+    Save columns of token sequences, given as a dict of lists, in a numpy
+    archive. The texts are stored once for all the columns. `source_digest`
+    identifies the data the tokens were computed from.
+    """
+    texts = TOKEN_TABLE.texts
+    used_ids = np.unique(
+        np.concatenate(
+            [np.zeros(0, dtype=np.int32)]
+            + [
+                sequence.text_ids
+                for sequences in columns.values()
+                for sequence in sequences
+            ]
+        )
+    )
+    local_ids = np.full(len(texts), -1, dtype=np.int32)
+    local_ids[used_ids] = np.arange(len(used_ids), dtype=np.int32)
+    arrays = {
+        "texts": np.frombuffer(
+            json.dumps([texts[text_id] for text_id in used_ids.tolist()]).encode(),
+            dtype=np.uint8,
+        ),
+        "columns": np.frombuffer(json.dumps(list(columns)).encode(), dtype=np.uint8),
+        "source_digest": np.frombuffer(source_digest.encode(), dtype=np.uint8),
+    }
+    for column_index, sequences in enumerate(columns.values()):
+        prefix = f"column_{column_index}"
+        arrays[f"{prefix}_kinds"] = concatenate(
+            [sequence.kinds for sequence in sequences], np.int16
+        )
+        arrays[f"{prefix}_text_ids"] = local_ids[
+            concatenate([sequence.text_ids for sequence in sequences], np.int32)
+        ]
+        arrays[f"{prefix}_line_lengths"] = concatenate(
+            [np.diff(sequence.line_offsets) for sequence in sequences], np.int32
+        )
+        arrays[f"{prefix}_sequence_lengths"] = np.array(
+            [len(sequence) for sequence in sequences], dtype=np.int32
+        )
+    tmp_path = f"{file_path}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, file_path)
+
+
+def load_token_columns(file_path, source_digest=None):
+    """
+    Load the columns saved by save_token_columns, or none of them if they
+    were computed from data other than `source_digest`.
+    """
+    with np.load(file_path, allow_pickle=False) as archive:
+        if source_digest is not None:
+            saved_digest = b""
+            if "source_digest" in archive:
+                saved_digest = archive["source_digest"].tobytes()
+            if saved_digest.decode() != source_digest:
+                return {}
+        texts = json.loads(archive["texts"].tobytes().decode())
+        names = json.loads(archive["columns"].tobytes().decode())
+        ids = np.array([TOKEN_TABLE.intern(text) for text in texts], dtype=np.int32)
+        columns = {}
+        for column_index, name in enumerate(names):
+            prefix = f"column_{column_index}"
+            kinds = archive[f"{prefix}_kinds"]
+            text_ids = ids[archive[f"{prefix}_text_ids"]]
+            line_lengths = archive[f"{prefix}_line_lengths"]
+            sequences = []
+            token_start = 0
+            line_start = 0
+            for nb_lines in archive[f"{prefix}_sequence_lengths"].tolist():
+                line_offsets = np.zeros(nb_lines + 1, dtype=np.int32)
+                np.cumsum(
+                    line_lengths[line_start : line_start + nb_lines],
+                    out=line_offsets[1:],
+                )
+                token_end = token_start + int(line_offsets[-1])
+                sequences.append(
+                    TokenSequence(
+                        kinds[token_start:token_end],
+                        text_ids[token_start:token_end],
+                        line_offsets,
+                    )
+                )
+                token_start = token_end
+                line_start += nb_lines
+            columns[name] = sequences
+    return columns
+
+
+def concatenate(arrays, dtype):
+    if not arrays:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
 
 
 # Example usage:
@@ -1,105 +1,169 @@
-﻿using Microsoft.Dafny;
-using System.Text;
-using System.Threading;
-using System.Diagnostics.Contracts;
-using System;
-using System.IO;
-using System.Collections.Generic;
-using System.Runtime.CompilerServices;
-using System.Text.Json;
-
-namespace tokenizer
-{
-
-
-
-    public class ProgramScanner
-    {
-        public static Scanner SetupScanner(string s /*!*/, Uri uri /*!*/,
-          ErrorReporter errorReporter /*!*/)
-        {
-            Contract.Requires(s != null);
-            Contract.Requires(uri != null);
-            System.Runtime.CompilerServices.RuntimeHelpers.RunClassConstructor(typeof(ParseErrors).TypeHandle);
-            System.Runtime.CompilerServices.RuntimeHelpers.RunClassConstructor(typeof(ResolutionErrors).TypeHandle);
-            /* System.Runtime.CompilerServices.RuntimeHelpers.RunClassConstructor(typeof(ParseErrors).TypeHandle); */
-            /* System.Runtime.CompilerServices.RuntimeHelpers.RunClassConstructor(typeof(ResolutionErrors).TypeHandle); */
-            byte[] /*!*/ buffer = cce.NonNull(Encoding.Default.GetBytes(s));
-            var ms = new MemoryStream(buffer, false);
-            var firstToken = new Token
-            {
-                Uri = uri
-            };
-
-            var errors = new Errors(errorReporter);
-            var scanner = new Scanner(ms, errors, uri, firstToken: firstToken);
-            return scanner;
-
-        }
-    }
-    class MainReturnValTest
-    {
-        static int Main(string[] args)
-        {
-
-            // Read from a file passed as argument or stdin if no argument is passed
-            TextWriter output = Console.Out;
-            DafnyOptions options = DafnyOptions.Create(output);
-            BatchErrorReporter errorReporter = new BatchErrorReporter(options);
-            string filePath = "/placeholder.dfy";
-            string input;
-            if (args.Length > 0)
-            {
-                filePath = args[0];
-                input = File.ReadAllText(filePath);
-            }
-            else
-            {
-                input = Console.In.ReadToEnd();
-            }
-            Uri uri = new Uri(filePath);
-
-            var scanner = ProgramScanner.SetupScanner(input, uri, errorReporter);
-
-            List<List<Tuple<string, string>>> tokens = new List<List<Tuple<string, string>>>();
-            List<Tuple<string, string>> currentList = new List<Tuple<string, string>>();
-
-            Token token;
-            int previousLine = 1;
-
-            do
-            {
-                token = scanner.Peek();
-                // a tuple of the token kind and the token text
-                // if it's a different line than the previous create a new list and add the current list to the list of lists
-                // add the tuple to the list
-                if (token.line != previousLine)
-                {
-                    tokens.Add(currentList);
-                    currentList = new List<Tuple<string, string>>
-                    {
-                        new Tuple<string, string>(token.kind.ToString(), token.val)
-                    };
-                    previousLine = token.line;
-                }
-                else
-                {
-                    currentList.Add(new Tuple<string, string>(token.kind.ToString(), token.val));
-                }
-            }
-            while (token.kind != Parser._EOF);
-            tokens.Add(currentList);
-            string json = JsonSerializer.Serialize(tokens);
-
-            if (args.Length > 0)
-            {
-                File.WriteAllText(filePath + "_tokens", json);
-            }
-            else
-            {
-                Console.WriteLine(json);
-            }
-            return 0;
-        }
-    }
-}
+﻿using Microsoft.Dafny;
+using System.Text;
+using System.Threading;
+using System.Diagnostics.Contracts;
+using System;
+using System.IO;
+using System.Collections.Generic;
+using System.Runtime.CompilerServices;
+using System.Text.Json;
+
+namespace tokenizer
+{
+
+
+
+    public class ProgramScanner
+    {
+        public static Scanner SetupScanner(string s /*!*/, Uri uri /*!*/,
+          ErrorReporter errorReporter /*!*/)
+        {
+            Contract.Requires(s != null);
+            Contract.Requires(uri != null);
+            System.Runtime.CompilerServices.RuntimeHelpers.RunClassConstructor(typeof(ParseErrors).TypeHandle);
+            System.Runtime.CompilerServices.RuntimeHelpers.RunClassConstructor(typeof(ResolutionErrors).TypeHandle);
+            /* System.Runtime.CompilerServices.RuntimeHelpers.RunClassConstructor(typeof(ParseErrors).TypeHandle); */
+            /* System.Runtime.CompilerServices.RuntimeHelpers.RunClassConstructor(typeof(ResolutionErrors).TypeHandle); */
+            byte[] /*!*/ buffer = cce.NonNull(Encoding.Default.GetBytes(s));
+            var ms = new MemoryStream(buffer, false);
+            var firstToken = new Token
+            {
+                Uri = uri
+            };
+
+            var errors = new Errors(errorReporter);
+            var scanner = new Scanner(ms, errors, uri, firstToken: firstToken);
+            return scanner;
+
+        }
+    }
+    public class TokenizeRequest
+    {
+        public string[] Codes { get; set; }
+    }
+
+    public class TokenizeResponse
+    {
+        // tokens of every code, in the format of the one-shot mode
+        public List<List<Tuple<string, string>>>[] Tokens { get; set; }
+        public string Error { get; set; }
+    }
+
+    class MainReturnValTest
+    {
+        static List<List<Tuple<string, string>>> Tokenize(string input, Uri uri, ErrorReporter errorReporter)
+        {
+            var scanner = ProgramScanner.SetupScanner(input, uri, errorReporter);
+
+            List<List<Tuple<string, string>>> tokens = new List<List<Tuple<string, string>>>();
+            List<Tuple<string, string>> currentList = new List<Tuple<string, string>>();
+
+            Token token;
+            int previousLine = 1;
+
+            do
+            {
+                token = scanner.Peek();
+                // a tuple of the token kind and the token text
+                // if it's a different line than the previous create a new list and add the current list to the list of lists
+                // add the tuple to the list
+                if (token.line != previousLine)
+                {
+                    tokens.Add(currentList);
+                    currentList = new List<Tuple<string, string>>
+                    {
+                        new Tuple<string, string>(token.kind.ToString(), token.val)
+                    };
+                    previousLine = token.line;
+                }
+                else
+                {
+                    currentList.Add(new Tuple<string, string>(token.kind.ToString(), token.val));
+                }
+            }
+            while (token.kind != Parser._EOF);
+            tokens.Add(currentList);
+            return tokens;
+        }
+
+        // Long-lived mode: reads one JSON request per line on stdin and
+        // answers with one JSON response per line on stdout.
+        static int Serve(DafnyOptions options)
+        {
+            var protocol = new StreamWriter(Console.OpenStandardOutput()) { AutoFlush = true };
+            Console.SetOut(Console.Error);
+            Uri uri = new Uri("/placeholder.dfy");
+
+            string line;
+            while ((line = Console.In.ReadLine()) != null)
+            {
+                if (string.IsNullOrWhiteSpace(line))
+                {
+                    continue;
+                }
+                var response = new TokenizeResponse();
+                try
+                {
+                    var request = JsonSerializer.Deserialize<TokenizeRequest>(line);
+                    // errors of a request are not reported with the next ones
+                    var errorReporter = new BatchErrorReporter(options);
+                    response.Tokens = new List<List<Tuple<string, string>>>[request.Codes.Length];
+                    for (int i = 0; i < request.Codes.Length; i++)
+                    {
+                        response.Tokens[i] = Tokenize(request.Codes[i], uri, errorReporter);
+                    }
+                }
+                catch (Exception e)
+                {
+                    response.Tokens = null;
+                    response.Error = e.ToString();
+                }
+                protocol.WriteLine(JsonSerializer.Serialize(response));
+            }
+            return 0;
+        }
+
+        static int Main(string[] args)
+        {
+
+            // Read from a file passed as argument or stdin if no argument is passed
+            // or serve requests with --server
+            TextWriter output = Console.Out;
+            if (args.Length > 0 && args[0] == "--server")
+            {
+                output = Console.Error;
+            }
+            DafnyOptions options = DafnyOptions.Create(output);
+            if (args.Length > 0 && args[0] == "--server")
+            {
+                return Serve(options);
+            }
+            BatchErrorReporter errorReporter = new BatchErrorReporter(options);
+            string filePath = "/placeholder.dfy";
+            string input;
+            if (args.Length > 0)
+            {
+                filePath = args[0];
+                input = File.ReadAllText(filePath);
+            }
+            else
+            {
+                input = Console.In.ReadToEnd();
+            }
+            Uri uri = new Uri(filePath);
+
+            var tokens = Tokenize(input, uri, errorReporter);
+            string json = JsonSerializer.Serialize(tokens);
+
+            if (args.Length > 0)
+            {
+                File.WriteAllText(filePath + "_tokens", json);
+            }
+            else
+            {
+                Console.WriteLine(json);
+            }
+            return 0;
+        }
+    }
+}
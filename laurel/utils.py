@@ -1,5 +1,6 @@
 import csv
 from difflib import ndiff
+import os
 import re
 
 
@@ -23,7 +24,7 @@ def read_pruning_result(csv_file_path):
         return csv_data
 
 
-def write_csv_header(csv_file_path):
+def write_csv_header(csv_file_path, resume=True):
     header = [
         "Index",
         "Original Method File",
@@ -39,9 +40,37 @@ def write_csv_header(csv_file_path):
         "New Method Result",
         "New Result File",
     ]
-    csv_file = open(csv_file_path, "a", newline="")
+    return append_csv_header(csv_file_path, header, resume)
+
+
+def write_minimization_csv_header(csv_file_path, resume=True):
+    header = [
+        "Original Method File",
+        "Original Method",
+        "Original Method Time",
+        "Assertions",
+        "Necessary Assertions",
+        "Minimal Assertions",
+        "Removable Assertions",
+        "Minimized Method File",
+        "Minimized Method Time",
+        "Minimized Method Result",
+        "Verifications",
+    ]
+    return append_csv_header(csv_file_path, header, resume)
+
+
+def append_csv_header(csv_file_path, header, resume=True):
+    # the file is appended to when a run is resumed, truncated otherwise
+    is_new = (
+        not resume
+        or not os.path.exists(csv_file_path)
+        or os.path.getsize(csv_file_path) == 0
+    )
+    csv_file = open(csv_file_path, "a" if resume else "w", newline="", buffering=1)
     csv_writer = csv.writer(csv_file)
-    csv_writer.writerow(header)
+    if is_new:
+        csv_writer.writerow(header)
     return csv_writer
 
 
@@ -61,6 +90,14 @@ def extract_string_between_backticks(text):
         return None
 
 
+def normalize_code(code):
+    # spacing, blank lines and repeated semicolons do not change the code,
+    # line breaks do since they end // comments
+    code = re.sub(r";(\s*;)+", ";", code)
+    lines = (" ".join(line.split()) for line in code.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
 def string_difference(str1, str2):
     lines1 = [line.lstrip() for line in str1.splitlines(keepends=True)]
     lines2 = [line.lstrip() for line in str2.splitlines(keepends=True)]
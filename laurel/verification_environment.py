@@ -0,0 +1,43 @@
+import os
+import shutil
+
+from config_parsing import is_isolated
+from Method import Method
+
+
+def setup_verification_environment(config, row, index=0):
+    """
+    Prepare the pruned method of a row of the pruning results to be verified
+    in place of the original file. With isolated workspaces the project tree
+    is left untouched: the pruned file only appears next to the files of the
+    original in the workspace of each verification.
+    """
+    original_filepath = row["Original Method File"]
+    if is_isolated(config):
+        original_method_file = row["New Method File"]
+        method = Method(original_method_file, row["Original Method"], index=index)
+        method.location = os.path.dirname(os.path.abspath(original_filepath))
+        # the original file stays in place, hide it from the verification instead
+        method.excluded_files = [original_filepath]
+        return method, None, original_method_file
+
+    tmp_original_file_location = shutil.move(
+        original_filepath,
+        os.path.join(config["Results_dir"], os.path.basename(original_filepath)),
+    )
+    original_method_file = os.path.join(
+        os.path.dirname(original_filepath), os.path.basename(row["New Method File"])
+    )
+    if row["New Method File"] != original_method_file:
+        shutil.copy(row["New Method File"], original_method_file)
+    method = Method(original_method_file, row["Original Method"], index=index)
+    return (
+        method,
+        tmp_original_file_location,
+        original_method_file,
+    )
+
+
+def cleanup_environment(tmp_original_file_location, original_file_path):
+    if tmp_original_file_location is not None:
+        shutil.copy(tmp_original_file_location, original_file_path)
@@ -0,0 +1,112 @@
+import functools
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+from disk_cache import dependency_files
+
+logger = logging.getLogger(__name__)
+
+
+class Workspace:
+    """
+    Scratch directory holding the dependency closure of one verification job.
+    Source files are mirrored under `root` at their absolute path so that
+    relative includes and --library globs keep resolving.
+    """
+
+    def __init__(self, root, file_path, dafny_args, source_path=None):
+        self.root = root
+        self.file_path = file_path
+        self.dafny_args = dafny_args
+        self.source_path = source_path
+
+    def restore_paths(self, output):
+        """
+        Replace the workspace paths in a Dafny output by the paths of the
+        files they mirror, which outlive the workspace.
+        """
+        if not output:
+            return output
+        if self.source_path is not None:
+            output = output.replace(self.file_path, self.source_path)
+        return output.replace(self.root + os.sep, os.sep)
+
+    def restore_output(self, process):
+        """
+        Restore the paths of the outputs of a completed or failed process.
+        """
+        process.stdout = self.restore_paths(process.stdout)
+        process.stderr = self.restore_paths(process.stderr)
+        return process
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+
+class WorkspaceManager:
+    def __init__(self, base_directory=None):
+        self.base_directory = base_directory
+        if base_directory:
+            os.makedirs(base_directory, exist_ok=True)
+
+    def materialize(self, file_path, dafny_args, location=None, excluded_files=()):
+        """
+        Create a workspace where `file_path` sits in `location` (its own
+        directory by default) next to its dependencies, without the
+        `excluded_files`.
+        """
+        root = tempfile.mkdtemp(prefix="laurel_", dir=self.base_directory)
+        location = os.path.abspath(location or os.path.dirname(file_path))
+        excluded_files = {os.path.abspath(path) for path in excluded_files}
+        for dependency in dependency_files(file_path, dafny_args, location):
+            if dependency in excluded_files or not os.path.exists(dependency):
+                continue
+            link_or_copy(dependency, mirror_path(root, dependency))
+        job_file = mirror_path(
+            root, os.path.join(location, os.path.basename(file_path))
+        )
+        link_or_copy(os.path.abspath(file_path), job_file)
+        logger.debug(f"Created workspace {root} for {file_path}")
+        return Workspace(
+            root,
+            job_file,
+            rewrite_library_patterns(root, dafny_args),
+            os.path.abspath(file_path),
+        )
+
+
+def mirror_path(root, path):
+    return os.path.join(root, os.path.abspath(path).lstrip(os.sep))
+
+
+def link_or_copy(source, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        # hardlinks are not possible across filesystems (e.g. tmpfs)
+        shutil.copyfile(source, destination)
+
+
+def rewrite_library_patterns(root, dafny_args):
+    return re.sub(
+        r"(--library[\s:=]+)([^\s]+)",
+        lambda match: match.group(1) + mirror_path(root, match.group(2)),
+        dafny_args or "",
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def open_workspace_manager(enabled, base_directory=None):
+    if not enabled:
+        return None
+    return WorkspaceManager(base_directory)
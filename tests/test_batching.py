@@ -0,0 +1,153 @@
+from batching import (
+    CandidateBatch,
+    count_errors,
+    is_recursive,
+    iter_records,
+    join_records,
+    records_output,
+)
+
+BASE = "method Foo(x: int)\n{\n  assert x == x;\n}\n\nmethod Bar()\n{\n}\n"
+
+# the candidates are at lines 6-9 and 11-15 of the batch, Bar at line 17
+OUTPUT = """batch.dfy(8,2): Error: unresolved identifier: a
+  |
+8 |   assert a;
+  |          ^
+
+batch.dfy(13,9): Error: assertion might not hold in Foo_laurel_candidate_2
+   |
+13 |   assert b;
+   |          ^
+
+batch.dfy(17,7): Related location: this is the precondition
+batch.dfy(19,0): Error: a postcondition might not hold
+   |
+19 | }
+   | ^
+
+Dafny program verifier finished with 0 verified, 3 errors
+"""
+
+
+def make_batch():
+    return CandidateBatch(
+        BASE,
+        "Foo",
+        {
+            1: "method Foo(x: int)\n{\n  assert a;\n}\n",
+            2: "method Foo(x: int)\n{\n  assert b;\n  assert c;\n}\n",
+        },
+    )
+
+
+def test_batch_content():
+    batch = make_batch()
+    assert batch.line_ranges == {1: (6, 9), 2: (11, 15)}
+    lines = batch.content.splitlines()
+    assert lines[5] == "method Foo_laurel_candidate_1(x: int)"
+    assert lines[10] == "method Foo_laurel_candidate_2(x: int)"
+    assert lines[16] == "method Bar()"
+
+
+def test_split_output():
+    records = make_batch().split_output(
+        OUTPUT, "batch.dfy", {1: "one.dfy", 2: "two.dfy"}
+    )
+    assert records[1] == [
+        "one.dfy(3,2): Error: unresolved identifier: a\n"
+        "  |\n"
+        "3 |   assert a;\n"
+        "  |          ^\n"
+        "\n"
+    ]
+    # the related location stays in the record of its error, at the line of
+    # Bar in the file of the candidate
+    assert records[2] == [
+        "two.dfy(3,9): Error: assertion might not hold in Foo\n"
+        "   |\n"
+        " 3 |   assert b;\n"
+        "   |          ^\n"
+        "\n"
+        "two.dfy(7,7): Related location: this is the precondition\n"
+    ]
+    assert records[None] == [
+        "batch.dfy(19,0): Error: a postcondition might not hold\n"
+        "   |\n"
+        "19 | }\n"
+        "   | ^\n"
+        "\n"
+    ]
+
+
+def test_split_output_without_errors():
+    records = make_batch().split_output(
+        "\nDafny program verifier finished with 4 verified, 0 errors\n",
+        "batch.dfy",
+        {1: "one.dfy", 2: "two.dfy"},
+    )
+    assert records == {1: [], 2: [], None: []}
+
+
+def test_count_and_join_records():
+    records = make_batch().split_output(
+        OUTPUT, "batch.dfy", {1: "one.dfy", 2: "two.dfy"}
+    )
+    assert count_errors(records[2]) == 1
+    assert count_errors(records[1] + records[2] + records[None]) == 3
+    assert count_errors(["x.dfy(1,1): Warning: unused\n"]) == 0
+    assert join_records(records[1]).endswith("^")
+
+
+def test_split_output_errors_in_other_files():
+    output = (
+        "lib.dfy(4,2): Error: a postcondition might not hold\n"
+        "  |\n"
+        "4 | }\n"
+        "\n"
+        "batch.dfy(8,2): Error: unresolved identifier: a\n"
+        "\n"
+    )
+    records = make_batch().split_output(
+        output, "batch.dfy", {1: "one.dfy", 2: "two.dfy"}
+    )
+    # an error in an included file belongs to no candidate
+    assert count_errors(records[None]) == 1
+    assert records[None][0].startswith("lib.dfy(4,2)")
+    assert count_errors(records[1]) == 1
+
+
+def test_is_recursive():
+    content = (
+        "method Foo(n: nat)\n{\n  if n > 0 { Foo(n - 1); }\n}\n\n"
+        "lemma Even(n: nat)\n{\n  if n > 0 { Odd(n - 1); }\n}\n\n"
+        "lemma Odd(n: nat)\n{\n  if n > 0 { Even(n - 1); }\n}\n\n"
+        "lemma Uses()\n{\n  Even(2);\n}\n"
+    )
+    assert is_recursive(content, "Foo")
+    # through another lemma
+    assert is_recursive(content, "Even")
+    assert not is_recursive(content, "Uses")
+    assert not is_recursive(BASE, "Foo")
+
+
+def test_iter_records():
+    assert [(file_name, line) for file_name, line, _ in iter_records(OUTPUT)] == [
+        ("batch.dfy", 8),
+        ("batch.dfy", 13),
+        ("batch.dfy", 19),
+    ]
+
+
+def test_records_output():
+    records = make_batch().split_output(
+        OUTPUT, "batch.dfy", {1: "one.dfy", 2: "two.dfy"}
+    )
+    output = records_output(records[2], 1)
+    assert output.endswith(
+        "\n\nDafny program verifier finished with 1 verified, 1 errors\n"
+    )
+    # the output splits back into the same records, up to the blank lines
+    assert [record.rstrip() for _, _, record in iter_records(output)] == [
+        record.rstrip() for record in records[2]
+    ]
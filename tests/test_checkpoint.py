@@ -0,0 +1,35 @@
+import csv
+
+from checkpoint import PruningCheckpoint, assertion_key, open_checkpoint
+from utils import write_csv_header
+
+
+def test_last_index_includes_minimizations(tmp_path):
+    path = tmp_path / "stats.csv.checkpoint"
+    checkpoint = PruningCheckpoint(str(path))
+    key = assertion_key("x.dfy", "Foo", ["assert a;"], 0)
+    checkpoint.mark_done(key, 3, "Correct")
+    checkpoint.mark_minimized(("x.dfy", "Foo"), 7)
+    checkpoint.close()
+
+    resumed = PruningCheckpoint(str(path))
+    assert resumed.is_done(key)
+    assert resumed.results[key] == "Correct"
+    assert resumed.is_minimized(("x.dfy", "Foo"))
+    assert resumed.last_index() == 7
+    resumed.close()
+
+
+def test_starting_over_truncates_the_stats(tmp_path):
+    stats_file = tmp_path / "stats.csv"
+    config = {"Stats_file": str(stats_file), "Project_path": str(tmp_path)}
+    write_csv_header(str(stats_file)).writerow(["row"])
+    # resuming appends to the stats
+    write_csv_header(str(stats_file)).writerow(["row"])
+    assert len(list(csv.reader(open(stats_file)))) == 3
+
+    open_checkpoint(config).mark_done(("x.dfy", "Foo", "assert a;", 0), 1)
+    config["Resume"] = False
+    assert open_checkpoint(config).last_index() == 0
+    write_csv_header(str(stats_file), resume=False).writerow(["row"])
+    assert len(list(csv.reader(open(stats_file)))) == 2
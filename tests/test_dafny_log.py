@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from dafny_log import (
+    AssertionResult,
+    ImplementationResult,
+    iter_json_log,
+    parse_duration,
+    read_log,
+)
+
+
+@pytest.mark.parametrize(
+    "duration, seconds",
+    [
+        ("00:00:01.5000000", 1.5),
+        ("00:02:03", 123),
+        ("01:00:00.25", 3600.25),
+        ("1.02:00:00", 26 * 3600),
+        (" 00:00:07.1 ", 7.1),
+    ],
+)
+def test_parse_duration(duration, seconds):
+    assert parse_duration(duration) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("duration", [None, "", "12", "00:xx:01", "1:2"])
+def test_parse_invalid_duration(duration):
+    assert parse_duration(duration) is None
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+TEXT_LOG = os.path.join(FIXTURES, "verification_log.txt")
+JSON_LOG = os.path.join(FIXTURES, "verification_log.json")
+
+
+@pytest.mark.parametrize("log_file", [TEXT_LOG, JSON_LOG])
+def test_read_log(log_file):
+    append, reverse, slow = read_log(log_file)
+    assert isinstance(append, ImplementationResult)
+    assert (append.function_name, append.verification_type) == (
+        "Lists.Append",
+        "correctness",
+    )
+    assert append.overall_outcome == "Correct"
+    assert append.overall_seconds == pytest.approx(0.218907)
+    assert append.overall_resource_count == 183542
+    assert append.max_batch_time == "00:00:00.1534210"
+    assert append.max_batch_resource_count == 120345
+    assert [batch.batch_number for batch in append.batches] == [1, 2]
+    assert append.batches[0].assertions[1] == AssertionResult(
+        "lists.dfy",
+        13,
+        4,
+        "a postcondition could not be proved on this return path",
+    )
+    assert reverse.overall_outcome == "Errors"
+    assert reverse.batches[0].overall_outcome == "Invalid"
+    assert slow.overall_outcome == "TimedOut"
+    assert slow.overall_seconds == 24 * 3600 + 30
+
+
+def test_text_and_json_logs_agree():
+    text_results = list(read_log(TEXT_LOG))
+    json_results = list(read_log(JSON_LOG))
+    # the first two implementations have the same fields in both formats
+    assert text_results[:2] == json_results[:2]
+
+
+def test_read_log_is_lazy():
+    results = read_log(JSON_LOG)
+    assert next(results).function_name == "Lists.Append"
+
+
+def test_json_log_in_small_chunks():
+    with open(JSON_LOG) as file:
+        results = list(iter_json_log(file, chunk_size=7))
+    assert results == list(read_log(JSON_LOG))
+
+
+def test_truncated_json_log(tmp_path):
+    with open(JSON_LOG) as file:
+        content = file.read()
+    truncated = tmp_path / "truncated.json"
+    # cut inside the second implementation
+    truncated.write_text(content[: content.index("Lists.Reverse") + 20])
+    assert [result.function_name for result in read_log(truncated)] == ["Lists.Append"]
@@ -0,0 +1,140 @@
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+from dafny_utils import (
+    VerificationCancelled,
+    extract_method_and_lemma_names,
+    extract_qualified_method_and_lemma_names,
+    remove_verification_options,
+    run_dafny_command,
+    source_name,
+)
+from Method import Method
+
+
+@pytest.mark.parametrize(
+    "dafny_args, resolution_args",
+    [
+        ("--cores:2 --resource-limit 20000 --library x", "--library x"),
+        (
+            "--use-basename-for-filename --cores:2 --verification-time-limit:300 "
+            "--disable-nonlinear-arithmetic",
+            "--use-basename-for-filename",
+        ),
+        ('--boogie-filter "*Foo*" --library a.dfy', "--library a.dfy"),
+        ("--solver-option O:x --allow-warnings", "--allow-warnings"),
+        ("--verify-included-files --library lib.dfy", "--library lib.dfy"),
+        ("--isolate-assertions=true", ""),
+        ("--function-syntax:4", "--function-syntax:4"),
+        (None, ""),
+    ],
+)
+def test_remove_verification_options(dafny_args, resolution_args):
+    assert remove_verification_options(dafny_args) == resolution_args
+
+
+def test_extract_qualified_method_and_lemma_names():
+    content = (
+        "// class Commented { }\n"
+        "datatype D = X | Y\n"
+        "method Foo() { var s := {1}; }\n"
+        "module A {\n"
+        "  class {:autocontracts} C<T> extends T0 {\n"
+        "    method Foo() { }\n"
+        "  }\n"
+        "  /* module Z { */\n"
+        "  lemma Foo() { }\n"
+        "  datatype E = Z {\n"
+        "    method Bar() { }\n"
+        "  }\n"
+        "  newtype N = x | 0 <= x < 10\n"
+        "}\n"
+        "module B.C {\n"
+        "  method Foo()\n"
+        "}\n"
+        "lemma L() {}\n"
+    )
+    names = extract_qualified_method_and_lemma_names(content)
+    assert names == ["Foo", "A.C.Foo", "A.E.Bar", "B.C.Foo", "A.Foo", "L"]
+    # in the order of the unqualified names
+    assert [name.rpartition(".")[2] for name in names] == (
+        extract_method_and_lemma_names(content)
+    )
+
+
+@pytest.mark.parametrize(
+    "implementation_name, name",
+    [
+        ("_module.__default.Foo", "Foo"),
+        ("A.__default.Foo", "A.Foo"),
+        ("A.C.Foo", "A.C.Foo"),
+        ("Foo", "Foo"),
+    ],
+)
+def test_source_name(implementation_name, name):
+    assert source_name(implementation_name) == name
+
+
+requires_shell = pytest.mark.skipif(
+    not os.path.exists("/usr/bin/zsh"), reason="Dafny commands run with zsh"
+)
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # a killed child of the shell stays a zombie until it is reaped
+    with open(f"/proc/{pid}/stat") as file:
+        return file.read().split(") ", 1)[1][0] != "Z"
+
+
+@requires_shell
+def test_timeout_kills_the_process_group(tmp_path):
+    pid_file = tmp_path / "pid"
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_dafny_command(f"sleep 30 & echo $! > {pid_file}; wait", timeout=1)
+    assert time.monotonic() - start < 10
+    # the grandchild was killed with the shell
+    pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while is_running(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not is_running(pid)
+
+
+@requires_shell
+def test_cancelled_command():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with pytest.raises(VerificationCancelled):
+        run_dafny_command("sleep 30", timeout=60, cancel_event=cancel_event)
+
+
+@requires_shell
+def test_command_output():
+    result = run_dafny_command("echo verified", timeout=10)
+    assert result.stdout == "verified\n"
+    with pytest.raises(subprocess.CalledProcessError):
+        run_dafny_command("exit 4", timeout=10)
+
+
+class TimingOutBackend:
+    def run(self, command, timeout, cancel_event=None):
+        raise subprocess.TimeoutExpired(command, timeout)
+
+
+def test_run_dafny_timeout(tmp_path):
+    method = Method(str(tmp_path / "x.dfy"), "Foo")
+    method.dafny_log_file = str(tmp_path / "log.txt")
+    assert not method.run_dafny(
+        method.file_path, str(tmp_path), "", TimingOutBackend(), None, timeout=1
+    )
+    assert method.verification_result == "Timeout"
+    assert method.verification_outcome == []
@@ -0,0 +1,173 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from disk_cache import (
+    DiskCache,
+    dependency_digests,
+    dependency_files,
+    file_digest,
+    hash_key,
+    open_cache,
+)
+from Method import Method
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def test_get_and_put(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    key = hash_key("content", "Foo")
+    assert cache.get(key) is None
+    cache.put(key, {"success": True, "log": "x"})
+    assert cache.get(key) == {"success": True, "log": "x"}
+    # entries are shared through the directory
+    assert DiskCache(str(tmp_path / "cache")).get(key) == {"success": True, "log": "x"}
+
+
+def test_unreadable_entry(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    key = hash_key("x")
+    cache.put(key, {"success": True})
+    with open(cache._entry_path(key), "w") as file:
+        file.write('{"success": tr')
+    assert cache.get(key) is None
+
+
+def test_concurrent_puts(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    key = hash_key("x")
+
+    def put(index):
+        cache.put(key, {"index": index, "padding": "x" * 100000})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(put, range(32)))
+    # the entry is one complete write and no temporary file is left
+    assert cache.get(key)["index"] in range(32)
+    assert os.listdir(os.path.dirname(cache._entry_path(key))) == [f"{key}.json"]
+
+
+def test_open_cache(tmp_path):
+    assert open_cache(None) is None
+    assert open_cache("") is None
+    assert open_cache(str(tmp_path)) is open_cache(str(tmp_path))
+
+
+def test_hash_key():
+    assert hash_key("a", ["b", 1]) == hash_key("a", ["b", 1])
+    assert hash_key("a", "b") != hash_key("ab")
+    assert hash_key("a", None) != hash_key("a", "")
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / "x.dfy"
+    path.write_text("method Foo() {}\n")
+    digest = file_digest(str(path))
+    path.write_text("method Foo() { assert true; }\n")
+    assert file_digest(str(path)) != digest
+
+
+def make_project(tmp_path):
+    project = tmp_path / "project"
+    (project / "lib").mkdir(parents=True)
+    (project / "x.dfy").write_text('include "y.dfy"\nmethod Foo() {}\n')
+    (project / "y.dfy").write_text('include "lib/z.dfy"\n')
+    (project / "lib" / "z.dfy").write_text("lemma Z() {}\n")
+    (project / "lib" / "w.dfy").write_text('include "v.dfy"\n')
+    (project / "lib" / "v.dfy").write_text("lemma V() {}\n")
+    return project
+
+
+def test_dependency_files(tmp_path):
+    project = make_project(tmp_path)
+    x = str(project / "x.dfy")
+    # includes are followed transitively
+    assert dependency_files(x, "") == [
+        str(project / "lib" / "z.dfy"),
+        str(project / "y.dfy"),
+    ]
+    # and from the library files
+    assert dependency_files(x, f"--library {project}/lib/*.dfy") == [
+        str(project / "lib" / "v.dfy"),
+        str(project / "lib" / "w.dfy"),
+        str(project / "lib" / "z.dfy"),
+        str(project / "y.dfy"),
+    ]
+
+
+def test_dependency_digests(tmp_path):
+    project = make_project(tmp_path)
+    x = str(project / "x.dfy")
+    digests = dependency_digests(x, "")
+    assert [path for path, _ in digests] == [
+        str(project / "lib" / "z.dfy"),
+        str(project / "y.dfy"),
+    ]
+    assert [
+        path for path, _ in dependency_digests(x, "", None, [project / "y.dfy"])
+    ] == [str(project / "lib" / "z.dfy")]
+    (project / "lib" / "z.dfy").write_text("lemma Z() { assert true; }\n")
+    assert dependency_digests(x, "") != digests
+
+
+class FakeBackend:
+    """
+    Dafny backend writing the fixture log, or timing out.
+    """
+
+    def __init__(self, timeout=False):
+        self.timeout = timeout
+        self.calls = 0
+
+    def version(self):
+        return "4.4.0-test"
+
+    def run(self, command, timeout, cancel_event=None):
+        self.calls += 1
+        if self.timeout:
+            raise subprocess.TimeoutExpired(command, timeout)
+        log_option = next(arg for arg in command if "LogFileName=" in arg)
+        log_file = log_option.split("LogFileName=", 1)[1].rstrip('"')
+        shutil.copyfile(os.path.join(FIXTURES, "verification_log.txt"), log_file)
+        return subprocess.CompletedProcess(command, 0, "", "")
+
+
+def test_cached_verification(tmp_path):
+    project = make_project(tmp_path)
+    results = tmp_path / "results"
+    results.mkdir()
+    cache = DiskCache(str(tmp_path / "cache"))
+    backend = FakeBackend()
+
+    def verify():
+        method = Method(str(project / "x.dfy"), "Append")
+        success = method.run_verification(str(results), cache=cache, backend=backend)
+        return method, success
+
+    method, success = verify()
+    assert success and backend.calls == 1
+    cached, cached_success = verify()
+    assert cached_success and backend.calls == 1
+    assert cached.verification_result == method.verification_result == "Correct"
+    assert cached.verification_time == pytest.approx(method.verification_time)
+    assert cached.verification_outcome == method.verification_outcome
+
+    # a change of an included file is a new verification
+    (project / "y.dfy").write_text('include "lib/z.dfy"\nlemma Y() {}\n')
+    verify()
+    assert backend.calls == 2
+
+
+def test_timeouts_are_not_cached(tmp_path):
+    project = make_project(tmp_path)
+    cache = DiskCache(str(tmp_path / "cache"))
+    backend = FakeBackend(timeout=True)
+    for _ in range(2):
+        method = Method(str(project / "x.dfy"), "Append")
+        assert not method.run_verification(str(tmp_path), cache=cache, backend=backend)
+    assert method.verification_result == "Timeout"
+    assert backend.calls == 2
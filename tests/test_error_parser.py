@@ -0,0 +1,25 @@
+import os
+
+import error_parser
+
+
+def test_placeholder_key_changes_with_the_finder_build(tmp_path, monkeypatch):
+    executable = tmp_path / "placeholder_finder"
+    executable.write_text("launcher")
+    assembly = tmp_path / "placeholder_finder.dll"
+    assembly.write_text("build 1")
+    method_file = tmp_path / "x.dfy"
+    method_file.write_text("method Foo() {}\n")
+    monkeypatch.setattr(error_parser, "placeholder_executable", lambda: str(executable))
+
+    def key():
+        return error_parser.placeholder_key(
+            "x.dfy(1,1): Error", str(method_file), "Foo", None, None, False
+        )
+
+    first_key = key()
+    assert key() == first_key
+    assembly.write_text("build 2")
+    # a rebuild keeps the launcher
+    os.utime(assembly, ns=(1, 1))
+    assert key() != first_key
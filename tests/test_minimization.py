@@ -0,0 +1,61 @@
+from minimization import ddmin, remove_assertions_at, split
+
+
+def needs(*needed):
+    tested = []
+
+    def test(subset):
+        tested.append(subset)
+        return set(needed) <= set(subset)
+
+    return test, tested
+
+
+def test_ddmin_without_necessary_items():
+    test, tested = needs()
+    assert ddmin(range(8), test) == []
+    assert tested == [[]]
+
+
+def test_ddmin_single_necessary_item():
+    test, tested = needs(5)
+    assert ddmin(range(16), test) == [5]
+    # halving: far fewer tests than one per item
+    assert len(tested) < 16
+
+
+def test_ddmin_necessary_items_in_different_halves():
+    test, _ = needs(3, 11)
+    assert ddmin(range(16), test) == [3, 11]
+
+
+def test_ddmin_is_one_minimal():
+    # any two of the items are enough
+    def test(subset):
+        return len(subset) >= 2
+
+    result = ddmin(range(6), test)
+    assert len(result) == 2
+
+
+def test_ddmin_tests_each_subset_once():
+    test, tested = needs(0, 1, 2, 3)
+    assert ddmin(range(4), test) == [0, 1, 2, 3]
+    assert len(tested) == len(set(map(tuple, tested)))
+
+
+def test_split():
+    assert split([1, 2, 3, 4, 5], 2) == [[1, 2, 3], [4, 5]]
+    assert split([1, 2], 4) == [[1], [2]]
+
+
+def test_remove_assertions_at():
+    method = "{\n  assert a;\n  assert b;\n  assert a;\n}\n"
+    assertions = ["assert a;", "assert b;", "assert a;"]
+    assert remove_assertions_at(method, assertions, [2]) == (
+        "{\n  assert a;\n  assert b;\n  \n}\n"
+    )
+    assert remove_assertions_at(method, assertions, [0, 1]) == (
+        "{\n  \n  \n  assert a;\n}\n"
+    )
+    assert remove_assertions_at(method, assertions, []) == method
@@ -0,0 +1,290 @@
+import pickle
+import random
+
+import numpy as np
+import pytest
+from scipy.cluster.hierarchy import linkage
+from scipy.spatial.distance import squareform
+
+from similarity.mss import mss
+
+
+def reference_lcs_length(s, t):
+    lengths = [[0] * (len(t) + 1) for _ in range(len(s) + 1)]
+    for i, a in enumerate(s):
+        for j, b in enumerate(t):
+            if a == b and a >= 0:
+                lengths[i + 1][j + 1] = lengths[i][j] + 1
+            else:
+                lengths[i + 1][j + 1] = max(lengths[i][j + 1], lengths[i + 1][j])
+    return lengths[-1][-1]
+
+
+def similarity(s, t):
+    return 1 / (1 + abs(s - t))
+
+
+def lcs_length(s, t):
+    return mss.lcs_length(s, mss.match_masks(s), t)
+
+
+@pytest.mark.parametrize(
+    "s, t, length",
+    [
+        ([], [], 0),
+        ([1, 2, 3], [], 0),
+        ([1, 2, 3], [1, 2, 3], 3),
+        ([1, 2, 3, 4], [2, 4], 2),
+        ([1, 2, 1, 2], [2, 1, 2, 1], 3),
+        # elements that are not tokens never match
+        ([-1, 5], [-1, 5], 1),
+    ],
+)
+def test_lcs_length(s, t, length):
+    assert lcs_length(s, t) == length
+
+
+def test_lcs_length_matches_dynamic_programming():
+    generator = random.Random(0)
+    for _ in range(200):
+        # longer than a machine word
+        s = [generator.randrange(-1, 4) for _ in range(generator.randrange(90))]
+        t = [generator.randrange(-1, 4) for _ in range(generator.randrange(90))]
+        assert lcs_length(s, t) == reference_lcs_length(s, t)
+
+
+def test_kinds_similarity():
+    assert mss.kinds_similarity([], {}, []) == 1
+    s = [1, 2, 3]
+    assert mss.kinds_similarity(s, mss.match_masks(s), [1, 2, 3]) == 1
+    assert mss.kinds_similarity(s, mss.match_masks(s), [3, 4, 5]) == pytest.approx(
+        1 / 3
+    )
+
+
+def test_condensed_index():
+    n = 7
+    square = np.arange(n * n, dtype=np.float32).reshape(n, n)
+    square = square + square.T
+    np.fill_diagonal(square, 0)
+    condensed = squareform(square, checks=False)
+    for i in range(n):
+        for j in range(i + 1, n):
+            assert condensed[mss.condensed_index(n, i, j)] == square[i, j]
+
+
+def test_condensed_index_of_arrays():
+    n = 5
+    rows = np.arange(n - 1)
+    assert mss.condensed_index(n, rows, rows + 1).tolist() == [0, 4, 7, 9]
+
+
+def test_condensed():
+    square = np.array([[0, 1, 2], [1, 0, 3], [2, 3, 0]])
+    condensed = mss.condensed(square)
+    assert condensed.dtype == np.float32
+    assert condensed.tolist() == [1, 2, 3]
+
+
+@pytest.mark.parametrize("n, nb_tiles", [(2, 8), (5, 3), (10, 7), (30, 64)])
+def test_distance_tiles(n, nb_tiles):
+    size = n * (n - 1) // 2
+    tiles = mss.distance_tiles(n, nb_tiles)
+    assert len(tiles) == min(nb_tiles, size)
+    # contiguous ranges covering every pair
+    assert tiles[0][0] == 0 and tiles[-1][1] == size
+    assert all(end == start for (_, end), (start, _) in zip(tiles, tiles[1:]))
+    lengths = [end - start for start, end in tiles]
+    assert max(lengths) - min(lengths) <= 1
+
+
+def test_distance_tiles_without_pairs():
+    assert mss.distance_tiles(1, 8) == []
+
+
+def test_compute_distance_tiles(tmp_path):
+    objs = list(range(9))
+
+    def comp(s, t):
+        return 1 / (1 + abs(s - t))
+
+    n = len(objs)
+    dist_file = tmp_path / "distances.dist"
+    np.memmap(dist_file, dtype=np.float32, mode="w+", shape=(n * (n - 1) // 2,))
+    mss._init_distance_worker(objs, comp, dist_file)
+    # tiles starting in the middle of rows
+    for tile in mss.distance_tiles(n, 5):
+        mss._compute_distance_tile(tile)
+
+    distances = np.fromfile(dist_file, dtype=np.float32)
+    expected = [1 - comp(objs[i], objs[j]) for i in range(n) for j in range(i + 1, n)]
+    assert distances.tolist() == pytest.approx(expected)
+
+
+def test_memory_mapped_clustering_is_loaded_read_only(tmp_path):
+    objs = [0, 1, 2, 5, 9]
+    dist_file = tmp_path / "clustering.dist"
+    clustering = mss.HierarchicalClustering(
+        objs, similarity, method="complete", dist_file=str(dist_file)
+    )
+    saved = dist_file.read_bytes()
+    loaded = pickle.loads(pickle.dumps(clustering))
+    assert loaded.dist.tolist() == pytest.approx(clustering.dist.tolist())
+    assert not loaded.dist.flags.writeable
+    assert dist_file.read_bytes() == saved
+
+
+def reference_mss(s, t, comp):
+    """
+    Most similar subsequence with the dynamic program computed one cell at a
+    time, returning its value and the aligned indices.
+    """
+    n, m = len(s), len(t)
+    values = np.zeros((n + 1, m + 1))
+    moves = np.zeros((n + 1, m + 1, 2), dtype=int)
+    matched = np.zeros((n + 1, m + 1), dtype=bool)
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            match = values[i - 1, j - 1] + comp(s[i - 1], t[j - 1])
+            values[i, j] = values[i - 1, j - 1]
+            moves[i, j] = [-1, -1]
+            if match > values[i, j]:
+                values[i, j] = match
+                matched[i, j] = True
+            if values[i - 1, j] > values[i, j]:
+                values[i, j] = values[i - 1, j]
+                moves[i, j] = [-1, 0]
+                matched[i, j] = False
+            if values[i, j - 1] > values[i, j]:
+                values[i, j] = values[i, j - 1]
+                moves[i, j] = [0, -1]
+                matched[i, j] = False
+    s_sub, t_sub = [], []
+    i, j = n, m
+    while i > 0 and j > 0:
+        if matched[i, j]:
+            s_sub.append(i - 1)
+            t_sub.append(j - 1)
+        di, dj = moves[i, j]
+        i, j = i + di, j + dj
+    return values[n, m], s_sub[::-1], t_sub[::-1]
+
+
+def random_sequences(generator, max_length):
+    for _ in range(40):
+        s = [generator.randrange(6) for _ in range(generator.randrange(max_length))]
+        t = [generator.randrange(6) for _ in range(generator.randrange(max_length))]
+        yield s, t
+
+
+def equal(s, t):
+    return float(s == t)
+
+
+# short rows are computed one cell at a time, longer ones vectorized
+@pytest.mark.parametrize("max_length", [10, 3 * mss.MIN_VECTORIZED_LENGTH])
+@pytest.mark.parametrize("comp", [similarity, equal])
+def test_mss_matches_dynamic_programming(max_length, comp):
+    generator = random.Random(max_length)
+    for s, t in random_sequences(generator, max_length):
+        value, s_sub, t_sub = reference_mss(s, t, comp)
+        result = mss.MostSimilarSubsequence(s, t, comp)
+        assert result.mss() == pytest.approx(value)
+        assert (result.s_sub, result.t_sub) == (s_sub, t_sub)
+        expected = 2 * value / (len(s) + len(t)) if s or t else 1
+        assert result.similarity("mean") == pytest.approx(expected)
+
+
+def random_lines(generator, count):
+    # tokens of a few kinds, and elements that are not tokens
+    tokens = [(str(kind), f"t{kind}") for kind in range(4)] + ["x"]
+    return [
+        [generator.choice(tokens) for _ in range(generator.randrange(12))]
+        for _ in range(count)
+    ]
+
+
+def reference_line_comp(s, t):
+    return mss.MostSimilarSubsequence(s, t, mss.token_comp_dafny).similarity("mean")
+
+
+@pytest.mark.parametrize("max_pairs, max_lines", [(4, 3), (1 << 18, 1 << 16)])
+def test_line_comp_matches_token_comparison(monkeypatch, max_pairs, max_lines):
+    table = mss.LineTable(max_pairs, max_lines)
+    monkeypatch.setattr(mss, "LINE_TABLE", table)
+    generator = random.Random(max_pairs)
+    # the lines are compared several times, after the evictions of the table
+    lines = random_lines(generator, 15)
+    for _ in range(3):
+        for s in lines:
+            for t in lines:
+                assert mss.line_comp(s, t) == pytest.approx(reference_line_comp(s, t))
+        s, t = lines[:8], lines[4:]
+        expected = [[reference_line_comp(x, y) for y in t] for x in s]
+        assert mss.line_comp_matrix(s, t) == pytest.approx(np.array(expected))
+    assert len(table.similarities) <= max_pairs // 2
+    assert len(table.previous_similarities) <= max_pairs // 2
+
+
+@pytest.mark.parametrize("max_length", [10, 3 * mss.MIN_VECTORIZED_LENGTH])
+def test_score_only_matches_alignment(max_length):
+    generator = random.Random(max_length)
+    for s, t in random_sequences(generator, max_length):
+        full = mss.MostSimilarSubsequence(s, t, similarity)
+        score = mss.MostSimilarSubsequence(s, t, similarity, alignment=False)
+        assert score.mss() == pytest.approx(full.mss())
+        for approx in ("mean", "min", "max"):
+            assert score.similarity(approx) == pytest.approx(full.similarity(approx))
+        # only the full mode keeps the matrices of the alignment
+        assert not hasattr(score, "mss_val") and not hasattr(score, "s_sub")
+        assert len(full.s_sub) == len(full.t_sub)
+
+
+@pytest.mark.parametrize("count", [10, 3 * mss.MIN_VECTORIZED_LENGTH])
+def test_score_only_line_comparison(count):
+    # line_comp is symmetric, the shortest method gives the rows
+    generator = random.Random(count)
+    s, t = random_lines(generator, count // 3), random_lines(generator, count)
+    full = mss.MostSimilarSubsequence(s, t, mss.line_comp)
+    for x, y in ((s, t), (t, s)):
+        score = mss.MostSimilarSubsequence(x, y, mss.line_comp, alignment=False)
+        assert score.similarity("mean") == pytest.approx(full.similarity("mean"))
+
+
+def untiled_distances(objs, comp):
+    square = np.array([[1 - comp(x, y) for y in objs] for x in objs])
+    np.fill_diagonal(square, 0)
+    return square
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_clustering_matches_untiled_distances(tmp_path, on_disk):
+    generator = random.Random(0)
+    objs = [generator.randrange(100) for _ in range(40)]
+    square = untiled_distances(objs, similarity)
+    dist_file = str(tmp_path / "clustering.dist") if on_disk else None
+    clustering = mss.HierarchicalClustering(
+        objs, similarity, method="complete", dist_file=dist_file
+    )
+    assert clustering.dist.dtype == np.float32
+    assert clustering.dist == pytest.approx(squareform(square), abs=1e-6)
+    assert clustering.square_distances() == pytest.approx(square, abs=1e-6)
+    for i in (0, 17, 39):
+        assert clustering.distance_row(i) == pytest.approx(square[i], abs=1e-6)
+    expected = linkage(squareform(square), method="complete")
+    assert clustering.hac_res == pytest.approx(expected)
+
+
+# older versions gave scipy the square matrix as observation vectors
+@pytest.mark.filterwarnings("ignore::scipy.cluster.hierarchy.ClusterWarning")
+def test_legacy_linkage_clusters_the_rows():
+    objs = [0, 1, 2, 5, 9, 20]
+    clustering = mss.HierarchicalClustering(
+        objs, similarity, method="complete", legacy_linkage=True
+    )
+    expected = linkage(clustering.square_distances(), method="complete")
+    assert clustering.hac_res == pytest.approx(expected)
+    # and differs from the clustering of the distances
+    assert clustering.hac_res != pytest.approx(
+        linkage(clustering.dist, method="complete")
+    )
@@ -0,0 +1,22 @@
+import subprocess
+
+import placeholder_wrapper
+
+
+def test_without_daemon(monkeypatch):
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 0, "method Foo()\n", "")
+
+    def open_daemon(executable):
+        raise AssertionError("the daemon is disabled")
+
+    monkeypatch.setattr(placeholder_wrapper.subprocess, "run", run)
+    monkeypatch.setattr(placeholder_wrapper, "open_placeholder_daemon", open_daemon)
+    output = placeholder_wrapper.call_placeholder_finder(
+        "x.dfy(3,2): Error: assertion might not hold", "x.dfy", "Foo", use_daemon=False
+    )
+    assert output == ("method Foo()", "")
+    assert commands[0][1:] == ["x.dfy", "Foo", "False"]
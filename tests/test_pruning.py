@@ -0,0 +1,68 @@
+from dafny_log import ImplementationResult
+from Method import Method
+from pruning import method_error_records, with_necessary
+
+
+def test_with_necessary():
+    stats = ["x.dfy", "Foo", 1.0, 3, None, ["assert b;"], [], "y.dfy", 0.5, "", 4]
+    row = with_necessary(
+        stats, ["assert a;", "assert b;", "assert c;"], ["Correct", "Errors", None]
+    )
+    # removals that were not verified are not labelled
+    assert row[4] == ["assert b;"]
+    assert row[:4] == stats[:4] and row[5:] == stats[5:]
+
+
+CONTENT = (
+    "module A {\n"
+    "  method Foo()\n"
+    "  {\n"
+    "    assert 1 == 2;\n"
+    "  }\n"
+    "}\n"
+    "method Bar()\n"
+    "{\n"
+    "}\n"
+)
+OUTPUT = (
+    "x.dfy(4,4): Error: assertion might not hold\n"
+    "  |\n"
+    "4 |     assert 1 == 2;\n"
+    "  |     ^^^^^^\n"
+    "\n"
+    "lib.dfy(8,0): Error: a postcondition might not hold\n"
+    "\n"
+    "Dafny program verifier finished with 1 verified, 2 errors\n"
+)
+
+
+def test_method_error_records():
+    foo = Method("/project/x.dfy", "Foo")
+    records = method_error_records(OUTPUT, "/project/x.dfy", CONTENT, foo)
+    assert records == [
+        "x.dfy(4,4): Error: assertion might not hold\n"
+        "  |\n"
+        "4 |     assert 1 == 2;\n"
+        "  |     ^^^^^^\n"
+        "\n"
+    ]
+    # the error at the same line of another file is not one of Bar's
+    bar = Method("/project/x.dfy", "Bar")
+    assert method_error_records(OUTPUT, "/project/x.dfy", CONTENT, bar) == []
+    assert method_error_records(None, "/project/x.dfy", CONTENT, foo) == []
+
+
+def test_outcomes_of_same_named_methods():
+    file_run = Method("/project/x.dfy", "x", type="file")
+    file_run.verification_outcome = [
+        ImplementationResult("A.Foo", "correctness", "Errors"),
+        ImplementationResult("B.C.Foo", "correctness", "Correct"),
+        ImplementationResult("_module.__default.Foo", "correctness", "Correct"),
+    ]
+    assert [outcome.function_name for outcome in file_run.outcomes_of("A.Foo")] == [
+        "A.Foo"
+    ]
+    assert [outcome.function_name for outcome in file_run.outcomes_of("Foo")] == [
+        "_module.__default.Foo"
+    ]
+    assert file_run.outcomes_of("C.Foo") == []
@@ -0,0 +1,51 @@
+import pytest
+
+from Method import Method
+from tiers import get_short_time_limit, timed_out_candidates
+
+
+def candidate(result):
+    new_method = Method("x.dfy", "Foo")
+    new_method.verification_result = result
+    return [new_method, "", 0, None]
+
+
+def test_timed_out_candidates():
+    candidates = [
+        candidate("Errors"),
+        candidate("TimedOut"),
+        # past the wall-clock limit
+        candidate("Timeout"),
+        [None, "", 0, ValueError("no assertion")],
+        candidate("TimedOut"),
+        candidate("Correct"),
+        candidate("TimedOut"),
+    ]
+    assert timed_out_candidates(candidates, range(len(candidates))) == [1, 4]
+    # duplicates are not in the indexes
+    assert timed_out_candidates(candidates, [0, 2, 4, 6]) == [4, 6]
+
+
+@pytest.mark.parametrize(
+    "config, baseline_time, time_limit",
+    [
+        ({"Tiered_verification": True}, 2.5, 10),
+        ({"Tiered_verification": True, "Short_time_limit_min": 1}, 2.5, 5),
+        ({"Tiered_verification": True, "Short_time_limit_factor": 8}, 2.5, 20),
+        ({"Tiered_verification": False}, 2.5, None),
+        ({"Tiered_verification": True}, 0, None),
+        # no shorter than the full limit
+        (
+            {"Tiered_verification": True, "Dafny_args": "--verification-time-limit:10"},
+            2.5,
+            None,
+        ),
+        (
+            {"Tiered_verification": True, "Dafny_args": "--verification-time-limit:60"},
+            2.5,
+            10,
+        ),
+    ],
+)
+def test_short_time_limit(config, baseline_time, time_limit):
+    assert get_short_time_limit(config, baseline_time) == time_limit
@@ -0,0 +1,37 @@
+import json
+import sys
+
+import token_wrapper
+
+TOKENS = [[{"Item1": "35", "Item2": "assert"}, {"Item1": "32", "Item2": ";"}]]
+
+# answers every code of a request with TOKENS, as nested arrays
+FAKE_TOKENIZER = f"""#!{sys.executable}
+import json, sys
+for line in sys.stdin:
+    codes = json.loads(line)["Codes"]
+    print(json.dumps({{"Tokens": [{TOKENS!r}] * len(codes), "Error": None}}), flush=True)
+"""
+
+
+def test_service_and_one_shot_outputs_agree():
+    assert token_wrapper.parse_token_sequence(TOKENS) == (
+        token_wrapper.parse_token_sequence(json.dumps(TOKENS))
+    )
+    assert token_wrapper.parse_token_output(TOKENS) == [[("35", "assert"), ("32", ";")]]
+
+
+def test_service_tokens(tmp_path, monkeypatch):
+    executable = tmp_path / "tokenizer"
+    executable.write_text(FAKE_TOKENIZER)
+    executable.chmod(0o755)
+    monkeypatch.setattr(token_wrapper, "TOKENIZER_CSHARP_PATH", str(executable))
+    service = token_wrapper.TokenizerService()
+    try:
+        outputs = service.tokenize(["assert a;", "assert b;", "assert c;"], 2)
+    finally:
+        service.close()
+    assert outputs == [TOKENS] * 3
+    assert token_wrapper.parse_token_output(outputs[0]) == [
+        [("35", "assert"), ("32", ";")]
+    ]
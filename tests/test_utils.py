@@ -0,0 +1,22 @@
+from utils import normalize_code
+
+
+def test_normalize_spacing():
+    assert normalize_code("  assert  x ==\t1;\n") == normalize_code("assert x == 1;")
+
+
+def test_normalize_repeated_semicolons():
+    assert normalize_code("assert x;;\n  assert y; ;") == normalize_code(
+        "assert x;\nassert y;"
+    )
+
+
+def test_normalize_blank_lines():
+    assert normalize_code("{\n\n  assert x;\n   \n}\n") == "{\nassert x;\n}"
+
+
+def test_line_breaks_end_comments():
+    # on one line the assertion would be commented out
+    assert normalize_code("x := 1; // set x\nassert x == 1;") != normalize_code(
+        "x := 1; // set x assert x == 1;"
+    )
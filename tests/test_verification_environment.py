@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from verification_environment import (
+    cleanup_environment,
+    setup_verification_environment,
+)
+from workspace import WorkspaceManager, mirror_path
+
+
+def snapshot(directory):
+    files = {}
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            path = os.path.join(root, file_name)
+            with open(path) as file:
+                files[path] = file.read()
+    return files
+
+
+def test_isolated_jobs_leave_the_project_untouched(tmp_path):
+    project = tmp_path / "project"
+    results = tmp_path / "results"
+    project.mkdir()
+    results.mkdir()
+    original = project / "Foo.dfy"
+    original.write_text('include "lib.dfy"\nmethod Foo()\n{\n  assert true;\n}\n')
+    (project / "lib.dfy").write_text("lemma L() {}\n")
+    pruned = results / "Foo_fix_prunned_0_1.dfy"
+    pruned.write_text('include "lib.dfy"\nmethod Foo()\n{\n}\n')
+    row = {
+        "Original Method File": str(original),
+        "Original Method": "Foo",
+        "New Method File": str(pruned),
+    }
+    config = {"Results_dir": str(results), "Isolated_workspaces": True}
+    manager = WorkspaceManager(str(tmp_path / "workspaces"))
+    before = snapshot(project)
+
+    def job(index):
+        method, tmp_location, _ = setup_verification_environment(config, row, index)
+        workspace = manager.materialize(
+            method.file_path, "", method.get_location(), method.excluded_files
+        )
+        with open(workspace.file_path) as file:
+            content = file.read()
+        job_files = snapshot(workspace.root)
+        workspace.cleanup()
+        cleanup_environment(tmp_location, row["Original Method File"])
+        return workspace.file_path, workspace.root, content, job_files
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        jobs = list(pool.map(job, [0, 1]))
+
+    assert snapshot(project) == before
+    for job_file, root, content, job_files in jobs:
+        # the pruned file sits next to the dependencies of the original,
+        # which is hidden
+        assert job_file == mirror_path(root, str(project / pruned.name))
+        assert content == pruned.read_text()
+        assert mirror_path(root, str(project / "lib.dfy")) in job_files
+        assert mirror_path(root, str(original)) not in job_files
+    assert jobs[0][1] != jobs[1][1]